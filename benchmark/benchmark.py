@@ -1,3 +1,4 @@
+import sys
 import time
 import os.path as path
 
@@ -11,10 +12,11 @@ for name in names:
         pass
 
 
-rndr = modules['misaka'].HtmlRenderer()
-m = modules['misaka'].Markdown(rndr)
-rndr = modules['hoedown'].HtmlRenderer()
-h = modules['hoedown'].Markdown(rndr)
+clock = getattr(time, 'perf_counter', time.time)
+
+if 'misaka' in modules:
+    m = modules['misaka'].Markdown(modules['misaka'].HtmlRenderer())
+h = modules['hoedown'].Markdown(modules['hoedown'].HtmlRenderer())
 
 
 class Benchmark(object):
@@ -23,9 +25,9 @@ class Benchmark(object):
 
     def __call__(self, func):
         def wrapper(*args, **kwargs):
-            start = time.clock()
+            start = clock()
             func(*args, **kwargs)
-            end = time.clock()
+            end = clock()
             return end - start
         wrapper.__name__ = func.__name__
         return wrapper
@@ -75,7 +77,7 @@ if __name__ == '__main__':
     with open(path.join(path.dirname(__file__), 'markdown-syntax.md'), 'r') as fd:
         text = fd.read()
 
-    loops = 50000
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
     totals = []
     methods = [
         ('Misaka', benchmark_misaka),
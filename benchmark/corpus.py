@@ -0,0 +1,251 @@
+"""Generate Markdown documents for the benchmark suite.
+
+Every generator takes a ``random.Random`` and a rough number of blocks, so
+the same seed and size always give the same document.
+"""
+
+import random
+import os.path as path
+
+
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing',
+         'elit', 'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore',
+         'et', 'dolore', 'magna', 'aliqua', 'enim', 'ad', 'minim', 'veniam')
+
+# Number of blocks in a document of each size
+SIZES = {
+    'small': 10,
+    'medium': 200,
+    'huge': 10000,
+}
+
+
+def words(rnd, count):
+    return ' '.join(rnd.choice(WORDS) for _ in range(count))
+
+
+def sentence(rnd):
+    text = words(rnd, rnd.randint(4, 16))
+    return text[0].upper() + text[1:] + '.'
+
+
+def inline(rnd):
+    """A sentence with some inline markup."""
+    parts = []
+    for _ in range(rnd.randint(4, 12)):
+        word = rnd.choice(WORDS)
+        markup = rnd.random()
+        if markup < 0.08:
+            word = '*%s*' % word
+        elif markup < 0.14:
+            word = '**%s**' % word
+        elif markup < 0.18:
+            word = '`%s`' % word
+        elif markup < 0.22:
+            word = '[%s](http://example.com/%s)' % (word, word)
+        parts.append(word)
+    return ' '.join(parts) + '.'
+
+
+def paragraph(rnd):
+    return '\n'.join(inline(rnd) for _ in range(rnd.randint(1, 4)))
+
+
+def tables(rnd, blocks):
+    out = []
+    for _ in range(blocks):
+        columns = rnd.randint(2, 6)
+        out.append('| ' + ' | '.join(words(rnd, 2) for _ in range(columns)) + ' |')
+        out.append('|' + '|'.join(rnd.choice((':--', '--:', ':-:', '---'))
+                                  for _ in range(columns)) + '|')
+        for _ in range(rnd.randint(2, 20)):
+            out.append('| ' + ' | '.join(inline(rnd) for _ in range(columns)) + ' |')
+        out.append('')
+    return '\n'.join(out)
+
+
+def lists(rnd, blocks):
+    out = []
+    for _ in range(blocks):
+        ordered = rnd.random() < 0.5
+        for n in range(rnd.randint(2, 12)):
+            marker = '%d.' % (n + 1) if ordered else rnd.choice('-*+')
+            out.append('%s %s' % (marker, inline(rnd)))
+            if rnd.random() < 0.2:
+                out.append('    - %s' % inline(rnd))
+        out.append('')
+    return '\n'.join(out)
+
+
+def links(rnd, blocks):
+    out = []
+    refs = []
+    for n in range(blocks):
+        parts = []
+        for _ in range(rnd.randint(3, 8)):
+            kind = rnd.random()
+            name = rnd.choice(WORDS)
+            if kind < 0.3:
+                parts.append('[%s](http://example.com/%s "%s")' % (name, name, name))
+            elif kind < 0.6:
+                ref = 'ref%d' % len(refs)
+                refs.append(ref)
+                parts.append('[%s][%s]' % (name, ref))
+            elif kind < 0.8:
+                parts.append('<http://example.com/%s>' % name)
+            else:
+                parts.append('![%s](/img/%s.png)' % (name, name))
+            parts.append(words(rnd, 3))
+        out.append(' '.join(parts))
+        out.append('')
+    for ref in refs:
+        out.append('[%s]: http://example.com/%s' % (ref, ref))
+    return '\n'.join(out)
+
+
+def references(rnd, blocks):
+    """One reference definition per block, like generated API docs, and a
+    footnote every ten blocks."""
+    out = []
+    for n in range(blocks):
+        target = rnd.randrange(blocks)
+        note = ' [^n%d]' % (target // 10) if n % 10 == 0 else ''
+        out.append('See [%s][Ref %d] and [ref %d].%s\n' % (
+            words(rnd, 2), target, rnd.randrange(blocks), note))
+    for n in range(blocks):
+        out.append('[ref %d]: http://example.com/api/%d "%s"' % (n, n, words(rnd, 2)))
+    out.append('')
+    for n in range(0, blocks, 10):
+        out.append('[^n%d]: %s\n' % (n // 10, sentence(rnd)))
+    return '\n'.join(out)
+
+
+def code(rnd, blocks):
+    out = []
+    for _ in range(blocks):
+        out.append(paragraph(rnd))
+        out.append('')
+        lines = ['    %s = %s(%s)' % (rnd.choice(WORDS), rnd.choice(WORDS), words(rnd, 2).replace(' ', ', '))
+                 for _ in range(rnd.randint(2, 15))]
+        if rnd.random() < 0.5:
+            out.append('```python')
+            out.extend(line[4:] for line in lines)
+            out.append('```')
+        else:
+            out.extend(lines)
+        out.append('')
+    return '\n'.join(out)
+
+
+def nested(rnd, blocks):
+    out = []
+    for _ in range(blocks):
+        depth = rnd.randint(2, 12)
+        for level in range(depth):
+            out.append('> ' * (level + 1) + '- ' + inline(rnd))
+        out.append('')
+    return '\n'.join(out)
+
+
+def html(rnd, blocks):
+    """Paragraphs with inline tags and HTML blocks, like user content that
+    needs a sanitizer."""
+    out = []
+    for _ in range(blocks):
+        kind = rnd.random()
+        if kind < 0.5:
+            out.append(' '.join('<%s class="x">%s</%s>' % (tag, word, tag)
+                                if tag else word
+                                for word, tag in ((rnd.choice(WORDS), rnd.choice(
+                                    ('', '', '', 'b', 'span', 'u', 'blink')))
+                                    for _ in range(rnd.randint(4, 12)))))
+        elif kind < 0.8:
+            out.append('<div class="note" onclick="go()">\n<p>%s <a href="%s">%s</a></p>\n</div>' % (
+                sentence(rnd), rnd.choice(('/a', 'http://example.com/', 'javascript:x()')),
+                rnd.choice(WORDS)))
+        elif kind < 0.9:
+            out.append('<script>\nvar %s = "<b>%s</b>";\n</script>' % (
+                rnd.choice(WORDS), words(rnd, 4)))
+        else:
+            out.append('<!-- %s -->\n<table>\n<tr><td align="left">%s</td></tr>\n</table>' % (
+                words(rnd, 3), sentence(rnd)))
+        out.append('')
+    return '\n'.join(out)
+
+
+# Unclosed markup that makes the parser scan ahead, repeated
+PATHOLOGICAL = (
+    '*a ', '_a **b ', '[', '![', '[a](', '[a][', '<a ', '^(', '*`a` ', '` ``',
+)
+
+
+def pathological(rnd, blocks):
+    """Paragraphs of unclosed markup, some of them long."""
+    out = []
+    for n in range(blocks):
+        markup = PATHOLOGICAL[n % len(PATHOLOGICAL)]
+        out.append(markup * rnd.choice((10, 50, 500)) + 'a\n')
+    return '\n'.join(out)
+
+
+def mixed(rnd, blocks):
+    out = []
+    for n in range(blocks):
+        kind = rnd.random()
+        if kind < 0.4:
+            out.append(paragraph(rnd))
+        elif kind < 0.5:
+            out.append('#' * rnd.randint(1, 6) + ' ' + sentence(rnd))
+        elif kind < 0.6:
+            out.append(lists(rnd, 1))
+        elif kind < 0.7:
+            out.append(code(rnd, 1))
+        elif kind < 0.75:
+            out.append(tables(rnd, 1))
+        elif kind < 0.8:
+            out.append('> ' + paragraph(rnd).replace('\n', '\n> '))
+        elif kind < 0.85:
+            out.append('~~%s~~ ==%s== ^%s $x^2$ www.example.com "%s" -- %s' % tuple(
+                words(rnd, 2) for _ in range(5)))
+        elif kind < 0.9:
+            out.append('%s[^%d]\n\n[^%d]: %s' % (sentence(rnd), n, n, sentence(rnd)))
+        else:
+            out.append(links(rnd, 1))
+        out.append('')
+    return '\n'.join(out)
+
+
+def syntax(rnd, blocks):
+    """The Markdown syntax document, repeated."""
+    with open(path.join(path.dirname(__file__), 'markdown-syntax.md'), 'r') as fd:
+        text = fd.read()
+    return '\n\n'.join([text] * max(1, blocks // 100))
+
+
+KINDS = {
+    'tables': tables,
+    'lists': lists,
+    'links': links,
+    'references': references,
+    'code': code,
+    'nested': nested,
+    'pathological': pathological,
+    'html': html,
+    'mixed': mixed,
+    'syntax': syntax,
+}
+
+
+def generate(kind, size='medium', seed=0):
+    """Returns a document of a kind from ``KINDS`` and a size from ``SIZES``
+    (or a number of blocks)."""
+    blocks = SIZES.get(size, size)
+    return KINDS[kind](random.Random('%s-%s' % (seed, kind)), int(blocks))
+
+
+if __name__ == '__main__':
+    import sys
+
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'mixed'
+    size = sys.argv[2] if len(sys.argv) > 2 else 'medium'
+    sys.stdout.write(generate(kind, size))
@@ -0,0 +1,262 @@
+"""Benchmark suite for hoedown.
+
+Renders the documents from ``corpus.py`` with ``html()``, with the
+``Markdown`` and renderer classes and with a renderer written in Python,
+and measures the cost of every extension.
+
+Every case is warmed up and timed a number of times. The statistics can be
+saved as JSON and compared with a saved baseline, in which case the suite
+exits with status 1 when a case got slower than the threshold allows::
+
+    python benchmark/suite.py --json baseline.json
+    # ... change things ...
+    python benchmark/suite.py --baseline baseline.json
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+import hoedown
+
+import corpus
+
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class PythonRenderer(hoedown.HtmlRenderer):
+    """Calls back into Python for the common block and span elements."""
+
+    def header(self, text, level):
+        return '<h%d>%s</h%d>\n' % (level, text, level)
+
+    def paragraph(self, text):
+        return '<p>%s</p>\n' % text
+
+    def emphasis(self, text):
+        return '<em>%s</em>' % text
+
+    def double_emphasis(self, text):
+        return '<strong>%s</strong>' % text
+
+    def codespan(self, text):
+        return '<code>%s</code>' % text
+
+    def link(self, content, link, title):
+        return '<a href="%s">%s</a>' % (link, content)
+
+
+EXTENSIONS = dict((name, getattr(hoedown, name)) for name in dir(hoedown)
+                  if name.startswith('EXT_'))
+ALL_EXTENSIONS = 0
+for value in EXTENSIONS.values():
+    if value != hoedown.EXT_DISABLE_INDENTED_CODE:
+        ALL_EXTENSIONS |= value
+
+
+class Case(object):
+    """A function rendering one document, timed by ``Runner``."""
+
+    def __init__(self, name, func, text):
+        self.name = name
+        self.func = func
+        self.text = text
+
+    def __call__(self):
+        self.func(self.text)
+
+
+def html_case(kind, size, extensions=ALL_EXTENSIONS, name=None):
+    text = corpus.generate(kind, size)
+    return Case(name or 'html/%s/%s' % (kind, size),
+                lambda t: hoedown.html(t, extensions), text)
+
+
+def classes_case(kind, size, renderer=hoedown.HtmlRenderer, name='classes'):
+    text = corpus.generate(kind, size)
+    markdown = hoedown.Markdown(renderer(), ALL_EXTENSIONS)
+    return Case('%s/%s/%s' % (name, kind, size), markdown.render, text)
+
+
+def cases():
+    result = []
+
+    for kind in sorted(corpus.KINDS):
+        result.append(html_case(kind, 'medium'))
+
+    for size in ('small', 'huge'):
+        result.append(html_case('mixed', size))
+
+    # Lookups in a large table of reference definitions
+    result.append(html_case('references', 10000, name='html/references/10k'))
+
+    # A single line, like a title or a chat message
+    line = corpus.inline(random.Random(0))
+    result.append(Case('html/line', hoedown.html, line))
+    result.append(Case('html_inline/line', hoedown.html_inline, line))
+
+    result.append(classes_case('mixed', 'medium'))
+    result.append(classes_case('mixed', 'small'))
+    result.append(classes_case('mixed', 'medium', PythonRenderer, 'python'))
+
+    # Plain text for search indexes
+    text = corpus.generate('mixed', 'medium')
+    result.append(Case('text/mixed/medium',
+                       lambda t: hoedown.plain_text(t, ALL_EXTENSIONS), text))
+
+    # Links rewritten by LinkRules in C
+    rules = hoedown.LinkRules(external_attributes={'rel': 'nofollow'},
+                              link_prefixes=[('/', 'https://cdn.example.com/')])
+    markdown = hoedown.Markdown(hoedown.HtmlRenderer(link_rules=rules), ALL_EXTENSIONS)
+    result.append(Case('rules/links/medium', markdown.render,
+                       corpus.generate('links', 'medium')))
+
+    # Slugs of the header text as anchors
+    markdown = hoedown.Markdown(hoedown.HtmlRenderer(hoedown.HTML_SLUG_ANCHORS, nesting_level=6),
+                                ALL_EXTENSIONS)
+    result.append(Case('anchors/mixed/medium', markdown.render, text))
+
+    # Raw HTML filtered by a Sanitizer in C
+    markdown = hoedown.Markdown(hoedown.HtmlRenderer(sanitizer=hoedown.Sanitizer()))
+    result.append(Case('sanitize/html/medium', markdown.render,
+                       corpus.generate('html', 'medium')))
+
+    # The cost of every extension on its own, compared to 'ext/none'
+    result.append(html_case('mixed', 'medium', 0, 'ext/none'))
+    for name in sorted(EXTENSIONS):
+        result.append(html_case('mixed', 'medium', EXTENSIONS[name],
+                                'ext/%s' % name[4:].lower()))
+
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def stdev(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / float(len(values))
+    return (sum((v - mean) ** 2 for v in values) / (len(values) - 1)) ** 0.5
+
+
+class Runner(object):
+    """Times cases.
+
+    Every repeat runs a case in a loop for at least ``min_time`` seconds and
+    records the time a single run took.
+    """
+
+    def __init__(self, warmup=1, repeat=5, min_time=0.05):
+        self.warmup = warmup
+        self.repeat = repeat
+        self.min_time = min_time
+
+    def loops(self, case):
+        start = clock()
+        case()
+        elapsed = clock() - start
+        return max(1, int(self.min_time / max(elapsed, 1e-9)))
+
+    def time(self, case):
+        for _ in range(self.warmup):
+            case()
+
+        loops = self.loops(case)
+        times = []
+        for _ in range(self.repeat):
+            start = clock()
+            for _ in range(loops):
+                case()
+            times.append((clock() - start) / loops)
+
+        return {
+            'loops': loops,
+            'min': min(times),
+            'median': median(times),
+            'mean': sum(times) / len(times),
+            'stdev': stdev(times),
+            'bytes': len(case.text.encode('utf-8')),
+        }
+
+
+def compare(results, baseline, threshold):
+    """Returns the names of the cases whose median got slower than the
+    baseline's by more than ``threshold`` (0.1 is 10%)."""
+    slower = []
+    for name, stats in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = stats['median'] / baseline[name]['median']
+        stats['baseline_ratio'] = ratio
+        if ratio > 1 + threshold:
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark hoedown.')
+    parser.add_argument('--filter', default='',
+                        help='only run the cases whose name contains this')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='seconds every repeat runs for at least')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare with the results in this file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed slowdown compared to the baseline')
+    args = parser.parse_args(argv)
+
+    runner = Runner(args.warmup, args.repeat, args.min_time)
+    results = {}
+
+    print('%-28s %12s %12s %8s %10s' % ('case', 'median', 'min', 'stdev', 'MB/s'))
+    for case in cases():
+        if args.filter not in case.name:
+            continue
+        stats = results[case.name] = runner.time(case)
+        print('%-28s %10.1fus %10.1fus %7.1f%% %10.1f' % (
+            case.name, stats['median'] * 1e6, stats['min'] * 1e6,
+            100 * stats['stdev'] / stats['median'],
+            stats['bytes'] / stats['median'] / 1e6))
+
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, fd, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as fd:
+            baseline = json.load(fd)['results']
+
+        slower = compare(results, baseline, args.threshold)
+        print()
+        for name in sorted(results):
+            if 'baseline_ratio' in results[name]:
+                print('%-28s %6.2fx%s' % (name, results[name]['baseline_ratio'],
+                                          '  SLOWER' if name in slower else ''))
+        if slower:
+            print('\n%d case(s) got more than %d%% slower than the baseline' % (
+                len(slower), args.threshold * 100))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
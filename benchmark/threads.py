@@ -0,0 +1,57 @@
+"""Measure render throughput with a growing number of threads.
+
+Every thread renders with its own ``Markdown`` instance, so with a native
+renderer the work should spread over as many cores as there are threads.
+"""
+
+import sys
+import time
+import threading
+import os.path as path
+
+import hoedown
+
+
+clock = getattr(time, 'perf_counter', time.time)
+local = threading.local()
+
+
+def markdown():
+    if not hasattr(local, 'markdown'):
+        local.markdown = hoedown.Markdown(hoedown.HtmlRenderer())
+    return local.markdown
+
+
+def worker(text, loops):
+    m = markdown()
+    for _ in range(loops):
+        m.render(text)
+
+
+def run(text, threads, loops):
+    pool = [threading.Thread(target=worker, args=(text, loops))
+            for _ in range(threads)]
+
+    start = clock()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return clock() - start
+
+
+if __name__ == '__main__':
+    with open(path.join(path.dirname(__file__), 'markdown-syntax.md'), 'r') as fd:
+        text = fd.read()
+
+    max_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    loops = 2000
+
+    print('Rendering %d documents per thread.\n' % loops)
+    base = None
+    for threads in range(1, max_threads + 1):
+        elapsed = run(text, threads, loops)
+        rate = threads * loops / elapsed
+        if base is None:
+            base = rate
+        print('%2d thread(s): %8.1f docs/s (%.2fx)' % (threads, rate, rate / base))
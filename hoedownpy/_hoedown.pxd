@@ -8,11 +8,17 @@ cdef extern from '_hoedown/src/buffer.h':
         size_t asize
         size_t unit
 
+    struct hoedown_buffer_stats:
+        size_t reallocs
+        size_t bytes
+
     hoedown_buffer* hoedown_buffer_new(size_t)
     int hoedown_buffer_grow(hoedown_buffer *, size_t)
     void hoedown_buffer_cstr(hoedown_buffer *)
     void hoedown_buffer_free(hoedown_buffer *)
     void hoedown_buffer_puts(hoedown_buffer *, char *)
+    void hoedown_buffer_putc(hoedown_buffer *, uint8_t)
+    void hoedown_buffer_set_stats(hoedown_buffer_stats *stats) nogil
 
 
 cdef extern from '_hoedown/src/html.h':
@@ -22,17 +28,67 @@ cdef extern from '_hoedown/src/html.h':
         int level_offset
         int nesting_level
 
+    struct hoedown_html_link_prefix:
+        const uint8_t *prefix
+        size_t prefix_size
+        const uint8_t *replacement
+        size_t replacement_size
+
+    struct hoedown_html_host:
+        const uint8_t *data
+        size_t size
+
+    struct hoedown_html_link_rules:
+        const hoedown_html_link_prefix *link_prefixes
+        size_t link_prefix_count
+        const hoedown_html_link_prefix *image_prefixes
+        size_t image_prefix_count
+        const hoedown_html_host *hosts
+        size_t host_count
+        int allowlist
+        const hoedown_html_host *allowed_hosts
+        size_t allowed_host_count
+        const uint8_t *attributes
+        size_t attributes_size
+        const uint8_t *external_attributes
+        size_t external_attributes_size
+
+    struct hoedown_html_sanitizer_tag:
+        const char *name
+        const char **attributes
+        size_t attribute_count
+
+    struct hoedown_html_sanitizer:
+        const hoedown_html_sanitizer_tag *tags
+        size_t tag_count
+        const char **attributes
+        size_t attribute_count
+        const char **url_attributes
+        size_t url_attribute_count
+        const char **protocols
+        size_t protocol_count
+        int escape
+
     struct hoedown_html_renderer_state:
         void *opaque
         _toc_data toc_data
         hoedown_html_flags flags
         void (*link_attributes)(hoedown_buffer *ob, const hoedown_buffer *url, const hoedown_renderer_data *data)
+        hoedown_buffer *toc
 
     hoedown_renderer *hoedown_html_renderer_new(
         unsigned int render_flags,
         int nesting_level)
     hoedown_renderer *hoedown_html_toc_renderer_new(
         int nesting_level)
+    hoedown_renderer *hoedown_text_renderer_new(
+        unsigned int render_flags)
+    void hoedown_html_renderer_set_link_rules(
+        hoedown_renderer *renderer,
+        const hoedown_html_link_rules *rules)
+    void hoedown_html_renderer_set_sanitizer(
+        hoedown_renderer *renderer,
+        const hoedown_html_sanitizer *sanitizer)
     void hoedown_html_renderer_free(hoedown_renderer *renderer)
     void hoedown_html_smartypants(
         hoedown_buffer *ob,
@@ -110,14 +166,70 @@ cdef extern from '_hoedown/src/document.h':
     struct hoedown_document:
         pass
 
+    ctypedef int (*hoedown_flush_cb)(const uint8_t *data, size_t size, void *opaque)
+
+    enum:
+        HOEDOWN_STATS_NODES
+
+    struct hoedown_document_stats:
+        unsigned long nodes[HOEDOWN_STATS_NODES]
+        size_t max_depth
+        size_t work_bufs
+        double callback_time
+
+    enum hoedown_limit:
+        HOEDOWN_LIMIT_NONE
+        HOEDOWN_LIMIT_STEPS
+        HOEDOWN_LIMIT_OUTPUT
+        HOEDOWN_LIMIT_TIME
+
+    struct hoedown_document_limits:
+        size_t max_steps
+        size_t max_output
+        double deadline
+        double (*clock)() nogil
+
     hoedown_document *hoedown_document_new(
         hoedown_renderer *callbacks,
         hoedown_extensions extensions,
-        size_t max_nesting)
+        size_t max_nesting) nogil
     void hoedown_document_render(
         hoedown_document *doc,
         hoedown_buffer *ob,
         const uint8_t *data,
-        size_t doc_size)
+        size_t doc_size) nogil
+    void hoedown_document_render_inline(
+        hoedown_document *doc,
+        hoedown_buffer *ob,
+        const uint8_t *data,
+        size_t size) nogil
+    unsigned int hoedown_document_start(
+        hoedown_document *doc,
+        hoedown_buffer *ob,
+        hoedown_buffer *text,
+        hoedown_buffer *defs,
+        const uint8_t *data,
+        size_t size)
+    size_t hoedown_document_render_block(
+        hoedown_document *doc,
+        hoedown_buffer *ob,
+        uint8_t *data,
+        size_t size)
+    void hoedown_document_finish(
+        hoedown_document *doc,
+        hoedown_buffer *ob)
+    void hoedown_document_set_flush(
+        hoedown_document *doc,
+        hoedown_flush_cb flush,
+        void *opaque,
+        size_t threshold) nogil
+    void hoedown_document_set_stats(
+        hoedown_document *doc,
+        hoedown_document_stats *stats) nogil
+    void hoedown_document_set_limits(
+        hoedown_document *doc,
+        const hoedown_document_limits *limits) nogil
+    hoedown_limit hoedown_document_get_limit(
+        const hoedown_document *doc) nogil
     void hoedown_document_free(hoedown_document *doc)
     void hoedown_version(int *major, int *minor, int *revision)
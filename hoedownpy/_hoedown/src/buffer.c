@@ -5,6 +5,15 @@
 #include <string.h>
 #include <assert.h>
 
+#if defined(_MSC_VER)
+#define HOEDOWN_THREAD_LOCAL __declspec(thread)
+#else
+#define HOEDOWN_THREAD_LOCAL __thread
+#endif
+
+/* Set by hoedown_buffer_set_stats, one per thread */
+static HOEDOWN_THREAD_LOCAL hoedown_buffer_stats *buffer_stats = NULL;
+
 void *
 hoedown_malloc(size_t size)
 {
@@ -112,10 +121,21 @@ hoedown_buffer_grow(hoedown_buffer *buf, size_t neosz)
 	while (neoasz < neosz)
 		neoasz += buf->unit;
 
+	if (buffer_stats) {
+		buffer_stats->reallocs++;
+		buffer_stats->bytes += neoasz - buf->asize;
+	}
+
 	buf->data = buf->data_realloc(buf->data, neoasz);
 	buf->asize = neoasz;
 }
 
+void
+hoedown_buffer_set_stats(hoedown_buffer_stats *stats)
+{
+	buffer_stats = stats;
+}
+
 void
 hoedown_buffer_put(hoedown_buffer *buf, const uint8_t *data, size_t size)
 {
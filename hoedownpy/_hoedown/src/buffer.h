@@ -40,6 +40,14 @@ struct hoedown_buffer {
 
 typedef struct hoedown_buffer hoedown_buffer;
 
+/* hoedown_buffer_stats: reallocations made by hoedown_buffer_grow */
+struct hoedown_buffer_stats {
+	size_t reallocs;	/* calls to data_realloc */
+	size_t bytes;	/* bytes added to the allocated sizes */
+};
+
+typedef struct hoedown_buffer_stats hoedown_buffer_stats;
+
 
 /*************
  * FUNCTIONS *
@@ -71,6 +79,10 @@ void hoedown_buffer_reset(hoedown_buffer *buf);
 /* hoedown_buffer_grow: increase the allocated size to the given value */
 void hoedown_buffer_grow(hoedown_buffer *buf, size_t neosz);
 
+/* hoedown_buffer_set_stats: add the reallocations made in the calling thread
+ * to stats, until it's called with NULL */
+void hoedown_buffer_set_stats(hoedown_buffer_stats *stats);
+
 /* hoedown_buffer_put: append raw data to a buffer */
 void hoedown_buffer_put(hoedown_buffer *buf, const uint8_t *data, size_t size);
 
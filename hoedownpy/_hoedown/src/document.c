@@ -1,6 +1,7 @@
 #include "document.h"
 
 #include <assert.h>
+#include <stddef.h>
 #include <string.h>
 #include <ctype.h>
 #include <stdio.h>
@@ -13,7 +14,7 @@
 #define strncasecmp	_strnicmp
 #endif
 
-#define REF_TABLE_SIZE 8
+#define REF_TABLE_SIZE 8	/* initial number of buckets of a ref_table */
 
 #define BUFFER_BLOCK 0
 #define BUFFER_SPAN 1
@@ -26,19 +27,34 @@ const char *hoedown_find_block_tag(const char *str, unsigned int len);
  * LOCAL TYPES *
  ***************/
 
+/* ref_entry: the name a link_ref or a footnote_ref is looked up by */
+struct ref_entry {
+	unsigned int id;	/* hash of the name */
+
+	const uint8_t *name;
+	size_t name_size;
+
+	struct ref_entry *next;	/* next entry in the same bucket */
+};
+
+/* ref_table: hash table of ref_entry, doubling its buckets as it fills up */
+struct ref_table {
+	struct ref_entry **buckets;
+	size_t size;
+	size_t count;
+};
+
 /* link_ref: reference to a link */
 struct link_ref {
-	unsigned int id;
+	struct ref_entry entry;
 
 	hoedown_buffer *link;
 	hoedown_buffer *title;
-
-	struct link_ref *next;
 };
 
 /* footnote_ref: reference to a footnote */
 struct footnote_ref {
-	unsigned int id;
+	struct ref_entry entry;
 
 	int is_used;
 	unsigned int num;
@@ -57,6 +73,9 @@ struct footnote_list {
 	unsigned int count;
 	struct footnote_item *head;
 	struct footnote_item *tail;
+
+	/* the first footnote_ref of every name, only for the definitions */
+	struct ref_table index;
 };
 
 /* char_trigger: function pointer to render active chars */
@@ -117,11 +136,42 @@ static char_trigger markdown_char_ptrs[] = {
 	&char_math
 };
 
+/* scan_cache • where the next occurrence of the bytes that close inline
+ * markup is, in the text of the outermost parse_inline. Markup that is never
+ * closed would otherwise be looked for up to the end of the text, once for
+ * every opening delimiter. */
+#define SCAN_SLOTS 10
+
+struct scan_entry {
+	/* there's no byte in [from, to), to is one or the end of the text */
+	const uint8_t *from;
+	const uint8_t *to;
+	unsigned int run;
+
+	/* one bit per byte of the text, set for the links and codespans that
+	 * find_emph_char skipped without finding the byte before misses_end */
+	uint8_t *misses;
+	size_t misses_size;
+	const uint8_t *misses_end;
+	unsigned int misses_run;
+};
+
+struct scan_cache {
+	const uint8_t *begin;
+	const uint8_t *end;
+	int depth;
+	unsigned int run;
+	struct scan_entry entries[SCAN_SLOTS];
+
+	/* the links and codespans skipped by the current find_emph_char */
+	hoedown_stack hops;
+};
+
 struct hoedown_document {
 	hoedown_renderer md;
 	hoedown_renderer_data data;
 
-	struct link_ref *refs[REF_TABLE_SIZE];
+	struct ref_table refs;
 	struct footnote_list footnotes_found;
 	struct footnote_list footnotes_used;
 	uint8_t active_char[256];
@@ -129,6 +179,21 @@ struct hoedown_document {
 	hoedown_extensions ext_flags;
 	size_t max_nesting;
 	int in_link_body;
+	int aborted;
+
+	struct scan_cache scan;
+
+	hoedown_flush_cb flush;
+	void *flush_opaque;
+	size_t flush_threshold;
+
+	hoedown_document_stats *stats;
+
+	const hoedown_document_limits *limits;
+	hoedown_limit limit;
+	hoedown_buffer *out;
+	size_t out_flushed;
+	size_t steps;
 };
 
 /***************************
@@ -149,11 +214,220 @@ newbuf(hoedown_document *doc, int type)
 	} else {
 		work = hoedown_buffer_new(buf_size[type]);
 		hoedown_stack_push(pool, work);
+		if (doc->stats)
+			doc->stats->work_bufs++;
+	}
+
+	if (doc->stats) {
+		size_t depth = doc->work_bufs[BUFFER_BLOCK].size + doc->work_bufs[BUFFER_SPAN].size;
+		if (depth > doc->stats->max_depth)
+			doc->stats->max_depth = depth;
 	}
 
 	return work;
 }
 
+/* count_node • counts a call of a renderer callback when collecting stats */
+static void
+count_node(hoedown_document *doc, hoedown_stats_node node)
+{
+	if (doc->stats)
+		doc->stats->nodes[node]++;
+}
+
+/* check_limits • aborts the document when the output is too large or the
+ * deadline has passed, every LIMIT_CLOCK_STEPS steps for the latter */
+#define LIMIT_CLOCK_STEPS 64
+
+static void
+check_limits(hoedown_document *doc)
+{
+	const hoedown_document_limits *limits = doc->limits;
+	hoedown_limit limit = HOEDOWN_LIMIT_NONE;
+
+	if (limits->max_steps && doc->steps > limits->max_steps)
+		limit = HOEDOWN_LIMIT_STEPS;
+	else if (limits->max_output && doc->out &&
+			doc->out->size + doc->out_flushed > limits->max_output)
+		limit = HOEDOWN_LIMIT_OUTPUT;
+	else if (limits->clock && doc->steps % LIMIT_CLOCK_STEPS == 0 &&
+			limits->clock() > limits->deadline)
+		limit = HOEDOWN_LIMIT_TIME;
+
+	if (limit != HOEDOWN_LIMIT_NONE) {
+		doc->limit = limit;
+		doc->aborted = 1;
+	}
+}
+
+/* count_step • counts a parsing step when rendering with limits */
+static void
+count_step(hoedown_document *doc)
+{
+	if (doc->limits) {
+		doc->steps++;
+		check_limits(doc);
+	}
+}
+
+/* start_limits • resets the step count before rendering into ob */
+static void
+start_limits(hoedown_document *doc, hoedown_buffer *ob)
+{
+	doc->limit = HOEDOWN_LIMIT_NONE;
+	doc->out = ob;
+	doc->out_flushed = 0;
+	doc->steps = 0;
+}
+
+/* scan_slot • the entry of the scan cache for c, or -1 */
+static int
+scan_slot(uint8_t c)
+{
+	switch (c) {
+	case ']': return 0;
+	case '[': return 1;
+	case ')': return 2;
+	case '`': return 3;
+	case '>': return 4;
+	case '*': return 5;
+	case '_': return 6;
+	case '~': return 7;
+	case '=': return 8;
+	case '"': return 9;
+	default: return -1;
+	}
+}
+
+/* scan_begin • starts caching scans in the text of the outermost parse_inline */
+static void
+scan_begin(hoedown_document *doc, const uint8_t *data, size_t size)
+{
+	if (doc->scan.depth++ == 0) {
+		/* entries from an earlier text are out of date */
+		doc->scan.run++;
+		doc->scan.begin = data;
+		doc->scan.end = data + size;
+	}
+}
+
+/* scan_end • stops caching once the outermost parse_inline is done, its
+ * text can be a work buffer that is reused */
+static void
+scan_end(hoedown_document *doc)
+{
+	if (--doc->scan.depth == 0)
+		doc->scan.begin = doc->scan.end = NULL;
+}
+
+/* scan_next • returns the offset of the first c in data, or size. Short
+ * distances are scanned, longer ones are looked up in the scan cache. */
+#define SCAN_WINDOW 64
+
+static size_t
+scan_next(hoedown_document *doc, const uint8_t *data, size_t size, uint8_t c)
+{
+	struct scan_cache *scan = &doc->scan;
+	struct scan_entry *entry;
+	const uint8_t *found, *limit;
+	int slot;
+
+	found = memchr(data, c, size < SCAN_WINDOW ? size : SCAN_WINDOW);
+	if (found)
+		return found - data;
+	if (size <= SCAN_WINDOW)
+		return size;
+
+	slot = scan_slot(c);
+	if (slot < 0 || data < scan->begin || data + size > scan->end) {
+		found = memchr(data + SCAN_WINDOW, c, size - SCAN_WINDOW);
+		return found ? (size_t)(found - data) : size;
+	}
+
+	entry = &scan->entries[slot];
+	if (entry->run != scan->run) {
+		entry->run = scan->run;
+		entry->from = entry->to = NULL;
+	}
+
+	if (entry->to && entry->from <= data && data <= entry->to)
+		found = entry->to;
+	else {
+		/* a known range after data doesn't need to be scanned again */
+		limit = (entry->to && data < entry->from) ? entry->from : scan->end;
+		found = memchr(data, c, limit - data);
+		if (!found)
+			found = (limit == scan->end) ? scan->end : entry->to;
+
+		entry->from = data;
+		entry->to = found;
+	}
+
+	return found < data + size ? (size_t)(found - data) : size;
+}
+
+/* scan_misses • the entry holding the misses of c, or NULL when end isn't
+ * in the text of the outermost parse_inline */
+static struct scan_entry *
+scan_misses(hoedown_document *doc, const uint8_t *end, uint8_t c)
+{
+	struct scan_cache *scan = &doc->scan;
+	int slot = scan_slot(c);
+
+	if (slot < 0 || end > scan->end || end < scan->begin)
+		return NULL;
+
+	return &scan->entries[slot];
+}
+
+/* scan_is_miss • whether find_emph_char is known to find nothing from data */
+static int
+scan_is_miss(hoedown_document *doc, const uint8_t *data, const uint8_t *end, uint8_t c)
+{
+	struct scan_entry *entry = scan_misses(doc, end, c);
+	size_t bit;
+
+	if (!entry || entry->misses_run != doc->scan.run || entry->misses_end != end ||
+		data < doc->scan.begin)
+		return 0;
+
+	bit = data - doc->scan.begin;
+	return (entry->misses[bit / 8] >> (bit % 8)) & 1;
+}
+
+/* scan_add_misses • remembers that the hops of find_emph_char found nothing */
+static void
+scan_add_misses(hoedown_document *doc, const uint8_t *end, uint8_t c)
+{
+	struct scan_cache *scan = &doc->scan;
+	struct scan_entry *entry = scan_misses(doc, end, c);
+	size_t i, bit, size;
+
+	if (!entry)
+		return;
+
+	if (entry->misses_run != scan->run || entry->misses_end != end) {
+		size = (scan->end - scan->begin) / 8 + 1;
+		if (size > entry->misses_size) {
+			entry->misses = hoedown_realloc(entry->misses, size);
+			entry->misses_size = size;
+		}
+		memset(entry->misses, 0x0, size);
+		entry->misses_run = scan->run;
+		entry->misses_end = end;
+	}
+
+	for (i = 0; i < scan->hops.size; i++) {
+		if ((const uint8_t *)scan->hops.item[i] < scan->begin)
+			continue;
+		bit = (const uint8_t *)scan->hops.item[i] - scan->begin;
+		entry->misses[bit / 8] |= 1 << (bit % 8);
+	}
+}
+
+/* RENDER • the renderer callback name, counted as node */
+#define RENDER(doc, name, node) (count_node(doc, HOEDOWN_STATS_##node), (doc)->md.name)
+
 static void
 popbuf(hoedown_document *doc, int type)
 {
@@ -192,65 +466,149 @@ hash_link_ref(const uint8_t *link_ref, size_t length)
 	return hash;
 }
 
-static struct link_ref *
-add_link_ref(
-	struct link_ref **references,
-	const uint8_t *name, size_t name_size)
+/* ref_entry_new • allocates size bytes for a link_ref or a footnote_ref
+ * followed by a copy of its name */
+static struct ref_entry *
+ref_entry_new(size_t size, const uint8_t *name, size_t name_size)
 {
-	struct link_ref *ref = hoedown_calloc(1, sizeof(struct link_ref));
+	struct ref_entry *entry = hoedown_calloc(1, size + name_size);
 
-	ref->id = hash_link_ref(name, name_size);
-	ref->next = references[ref->id % REF_TABLE_SIZE];
+	entry->id = hash_link_ref(name, name_size);
+	entry->name = (uint8_t *) entry + size;
+	entry->name_size = name_size;
+	memcpy((uint8_t *) entry + size, name, name_size);
 
-	references[ref->id % REF_TABLE_SIZE] = ref;
-	return ref;
+	return entry;
 }
 
-static struct link_ref *
-find_link_ref(struct link_ref **references, uint8_t *name, size_t length)
+/* ref_table_find • returns the entry with a name that's the same ignoring
+ * case, or NULL */
+static struct ref_entry *
+ref_table_find(struct ref_table *table, const uint8_t *name, size_t length)
 {
-	unsigned int hash = hash_link_ref(name, length);
-	struct link_ref *ref = NULL;
+	unsigned int hash;
+	struct ref_entry *entry;
+	size_t i;
+
+	if (!table->count)
+		return NULL;
 
-	ref = references[hash % REF_TABLE_SIZE];
+	hash = hash_link_ref(name, length);
+	entry = table->buckets[hash & (table->size - 1)];
 
-	while (ref != NULL) {
-		if (ref->id == hash)
-			return ref;
+	for (; entry != NULL; entry = entry->next) {
+		if (entry->id != hash || entry->name_size != length)
+			continue;
+
+		for (i = 0; i < length; ++i)
+			if (tolower(entry->name[i]) != tolower(name[i]))
+				break;
 
-		ref = ref->next;
+		if (i == length)
+			return entry;
 	}
 
 	return NULL;
 }
 
+/* ref_table_add • adds an entry, there mustn't be one with the same name */
 static void
-free_link_refs(struct link_ref **references)
+ref_table_add(struct ref_table *table, struct ref_entry *entry)
 {
 	size_t i;
 
-	for (i = 0; i < REF_TABLE_SIZE; ++i) {
-		struct link_ref *r = references[i];
-		struct link_ref *next;
+	if (table->count >= table->size) {
+		size_t size = table->size ? table->size * 2 : REF_TABLE_SIZE;
+		struct ref_entry **buckets = hoedown_calloc(size, sizeof(struct ref_entry *));
+
+		for (i = 0; i < table->size; ++i) {
+			struct ref_entry *e = table->buckets[i], *next;
+
+			for (; e != NULL; e = next) {
+				next = e->next;
+				e->next = buckets[e->id & (size - 1)];
+				buckets[e->id & (size - 1)] = e;
+			}
+		}
+
+		free(table->buckets);
+		table->buckets = buckets;
+		table->size = size;
+	}
+
+	entry->next = table->buckets[entry->id & (table->size - 1)];
+	table->buckets[entry->id & (table->size - 1)] = entry;
+	table->count++;
+}
+
+/* ref_table_clear • empties the table, the entries are freed by the caller */
+static void
+ref_table_clear(struct ref_table *table)
+{
+	if (table->count)
+		memset(table->buckets, 0x0, table->size * sizeof(struct ref_entry *));
+	table->count = 0;
+}
+
+static void
+ref_table_free(struct ref_table *table)
+{
+	free(table->buckets);
+	memset(table, 0x0, sizeof(struct ref_table));
+}
+
+/* add_link_ref • returns the link_ref to fill in for the name, the last
+ * definition of a name wins */
+static struct link_ref *
+add_link_ref(struct ref_table *references, const uint8_t *name, size_t name_size)
+{
+	struct link_ref *ref;
+
+	ref = (struct link_ref *) ref_table_find(references, name, name_size);
+	if (ref) {
+		hoedown_buffer_free(ref->link);
+		hoedown_buffer_free(ref->title);
+		ref->link = ref->title = NULL;
+		return ref;
+	}
+
+	ref = (struct link_ref *) ref_entry_new(sizeof(struct link_ref), name, name_size);
+	ref_table_add(references, &ref->entry);
+	return ref;
+}
+
+static struct link_ref *
+find_link_ref(struct ref_table *references, uint8_t *name, size_t length)
+{
+	return (struct link_ref *) ref_table_find(references, name, length);
+}
+
+static void
+free_link_refs(struct ref_table *references)
+{
+	size_t i;
+
+	for (i = 0; i < references->size && references->count; ++i) {
+		struct ref_entry *r = references->buckets[i];
+		struct ref_entry *next;
 
 		while (r) {
+			struct link_ref *ref = (struct link_ref *) r;
 			next = r->next;
-			hoedown_buffer_free(r->link);
-			hoedown_buffer_free(r->title);
-			free(r);
+			hoedown_buffer_free(ref->link);
+			hoedown_buffer_free(ref->title);
+			free(ref);
 			r = next;
 		}
 	}
+
+	ref_table_clear(references);
 }
 
 static struct footnote_ref *
 create_footnote_ref(struct footnote_list *list, const uint8_t *name, size_t name_size)
 {
-	struct footnote_ref *ref = hoedown_calloc(1, sizeof(struct footnote_ref));
-
-	ref->id = hash_link_ref(name, name_size);
-
-	return ref;
+	return (struct footnote_ref *) ref_entry_new(sizeof(struct footnote_ref), name, name_size);
 }
 
 static int
@@ -272,21 +630,19 @@ add_footnote_ref(struct footnote_list *list, struct footnote_ref *ref)
 	return 1;
 }
 
+/* index_footnote_ref • makes a footnote definition findable, unless an
+ * earlier one has the same name */
+static void
+index_footnote_ref(struct footnote_list *list, struct footnote_ref *ref)
+{
+	if (!ref_table_find(&list->index, ref->entry.name, ref->entry.name_size))
+		ref_table_add(&list->index, &ref->entry);
+}
+
 static struct footnote_ref *
 find_footnote_ref(struct footnote_list *list, uint8_t *name, size_t length)
 {
-	unsigned int hash = hash_link_ref(name, length);
-	struct footnote_item *item = NULL;
-
-	item = list->head;
-
-	while (item != NULL) {
-		if (item->ref->id == hash)
-			return item->ref;
-		item = item->next;
-	}
-
-	return NULL;
+	return (struct footnote_ref *) ref_table_find(&list->index, name, length);
 }
 
 static void
@@ -296,6 +652,7 @@ free_footnote_ref(struct footnote_ref *ref)
 	free(ref);
 }
 
+/* free_footnote_list • empties the list, keeping the index's buckets */
 static void
 free_footnote_list(struct footnote_list *list, int free_refs)
 {
@@ -309,6 +666,10 @@ free_footnote_list(struct footnote_list *list, int free_refs)
 		free(item);
 		item = next;
 	}
+
+	list->head = list->tail = NULL;
+	list->count = 0;
+	ref_table_clear(&list->index);
 }
 
 
@@ -484,7 +845,11 @@ parse_inline(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t si
 		doc->work_bufs[BUFFER_BLOCK].size > doc->max_nesting)
 		return;
 
-	while (i < size) {
+	scan_begin(doc, data, size);
+
+	while (i < size && !doc->aborted) {
+		count_step(doc);
+
 		/* copying inactive chars into the output */
 		while (end < size && active_char[data[end]] == 0)
 			end++;
@@ -492,7 +857,7 @@ parse_inline(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t si
 		if (doc->md.normal_text) {
 			work.data = data + i;
 			work.size = end - i;
-			doc->md.normal_text(ob, &work, &doc->data);
+			RENDER(doc, normal_text, NORMAL_TEXT)(ob, &work, &doc->data);
 		}
 		else
 			hoedown_buffer_put(ob, data + i, end - i);
@@ -509,6 +874,8 @@ parse_inline(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t si
 			consumed = i;
 		}
 	}
+
+	scan_end(doc);
 }
 
 /* is_escaped • returns whether special char at data[loc] is escaped by '\\' */
@@ -523,16 +890,26 @@ is_escaped(uint8_t *data, size_t loc)
 	return (loc - i) % 2;
 }
 
-/* find_emph_char • looks for the next emph uint8_t, skipping other constructs */
+/* find_emph_char_hops • looks for the next emph uint8_t, skipping other
+ * constructs and remembering where they start after the first SCAN_HOPS */
+#define SCAN_HOPS 8
+
 static size_t
-find_emph_char(uint8_t *data, size_t size, uint8_t c)
+find_emph_char_hops(hoedown_document *doc, uint8_t *data, size_t size, uint8_t c)
 {
-	size_t i = 0;
+	size_t i = 0, j, end, hops = 0;
 
 	while (i < size) {
-		while (i < size && data[i] != c && data[i] != '[' && data[i] != '`')
+		end = i + SCAN_WINDOW < size ? i + SCAN_WINDOW : size;
+		while (i < end && data[i] != c && data[i] != '[' && data[i] != '`')
 			i++;
 
+		if (i == end && i < size) {
+			end = scan_next(doc, data + i, size - i, c);
+			end = scan_next(doc, data + i, end, '[');
+			i += scan_next(doc, data + i, end, '`');
+		}
+
 		if (i == size)
 			return 0;
 
@@ -544,6 +921,13 @@ find_emph_char(uint8_t *data, size_t size, uint8_t c)
 		if (data[i] == c)
 			return i;
 
+		/* after a few links or codespans, the rest may be known to miss */
+		if (++hops > SCAN_HOPS) {
+			if (scan_is_miss(doc, data + i, data + size, c))
+				return 0;
+			hoedown_stack_push(&doc->scan.hops, data + i);
+		}
+
 		/* skipping a codespan */
 		if (data[i] == '`') {
 			size_t span_nb = 0, bt;
@@ -574,10 +958,10 @@ find_emph_char(uint8_t *data, size_t size, uint8_t c)
 			uint8_t cc;
 
 			i++;
-			while (i < size && data[i] != ']') {
-				if (!tmp_i && data[i] == c) tmp_i = i;
-				i++;
-			}
+			end = scan_next(doc, data + i, size - i, ']');
+			if ((j = scan_next(doc, data + i, end, c)) < end)
+				tmp_i = i + j;
+			i += end;
 
 			i++;
 			while (i < size && _isspace(data[i]))
@@ -601,10 +985,10 @@ find_emph_char(uint8_t *data, size_t size, uint8_t c)
 			}
 
 			i++;
-			while (i < size && data[i] != cc) {
-				if (!tmp_i && data[i] == c) tmp_i = i;
-				i++;
-			}
+			end = scan_next(doc, data + i, size - i, cc);
+			if (!tmp_i && (j = scan_next(doc, data + i, end, c)) < end)
+				tmp_i = i + j;
+			i += end;
 
 			if (i >= size)
 				return tmp_i;
@@ -616,6 +1000,23 @@ find_emph_char(uint8_t *data, size_t size, uint8_t c)
 	return 0;
 }
 
+/* find_emph_char • looks for the next emph uint8_t, skipping other constructs */
+/* a long chain of links or codespans is only followed once, so that looking
+ * for a byte that isn't there from every delimiter of a run isn't quadratic */
+static size_t
+find_emph_char(hoedown_document *doc, uint8_t *data, size_t size, uint8_t c)
+{
+	size_t i;
+
+	doc->scan.hops.size = 0;
+	i = find_emph_char_hops(doc, data, size, c);
+
+	if (i == 0 && doc->scan.hops.size > 0)
+		scan_add_misses(doc, data + size, c);
+
+	return i;
+}
+
 /* parse_emph1 • parsing single emphase */
 /* closed by a symbol not preceded by spacing and not followed by symbol */
 static size_t
@@ -629,7 +1030,7 @@ parse_emph1(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t siz
 	if (size > 1 && data[0] == c && data[1] == c) i = 1;
 
 	while (i < size) {
-		len = find_emph_char(data + i, size - i, c);
+		len = find_emph_char(doc, data + i, size - i, c);
 		if (!len) return 0;
 		i += len;
 		if (i >= size) return 0;
@@ -645,9 +1046,9 @@ parse_emph1(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t siz
 			parse_inline(work, doc, data, i);
 
 			if (doc->ext_flags & HOEDOWN_EXT_UNDERLINE && c == '_')
-				r = doc->md.underline(ob, work, &doc->data);
+				r = RENDER(doc, underline, UNDERLINE)(ob, work, &doc->data);
 			else
-				r = doc->md.emphasis(ob, work, &doc->data);
+				r = RENDER(doc, emphasis, EMPHASIS)(ob, work, &doc->data);
 
 			popbuf(doc, BUFFER_SPAN);
 			return r ? i + 1 : 0;
@@ -666,7 +1067,7 @@ parse_emph2(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t siz
 	int r;
 
 	while (i < size) {
-		len = find_emph_char(data + i, size - i, c);
+		len = find_emph_char(doc, data + i, size - i, c);
 		if (!len) return 0;
 		i += len;
 
@@ -675,11 +1076,11 @@ parse_emph2(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t siz
 			parse_inline(work, doc, data, i);
 
 			if (c == '~')
-				r = doc->md.strikethrough(ob, work, &doc->data);
+				r = RENDER(doc, strikethrough, STRIKETHROUGH)(ob, work, &doc->data);
 			else if (c == '=')
-				r = doc->md.highlight(ob, work, &doc->data);
+				r = RENDER(doc, highlight, HIGHLIGHT)(ob, work, &doc->data);
 			else
-				r = doc->md.double_emphasis(ob, work, &doc->data);
+				r = RENDER(doc, double_emphasis, DOUBLE_EMPHASIS)(ob, work, &doc->data);
 
 			popbuf(doc, BUFFER_SPAN);
 			return r ? i + 2 : 0;
@@ -698,7 +1099,7 @@ parse_emph3(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t siz
 	int r;
 
 	while (i < size) {
-		len = find_emph_char(data + i, size - i, c);
+		len = find_emph_char(doc, data + i, size - i, c);
 		if (!len) return 0;
 		i += len;
 
@@ -711,7 +1112,7 @@ parse_emph3(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t siz
 			hoedown_buffer *work = newbuf(doc, BUFFER_SPAN);
 
 			parse_inline(work, doc, data, i);
-			r = doc->md.triple_emphasis(ob, work, &doc->data);
+			r = RENDER(doc, triple_emphasis, TRIPLE_EMPHASIS)(ob, work, &doc->data);
 			popbuf(doc, BUFFER_SPAN);
 			return r ? i + 3 : 0;
 
@@ -767,7 +1168,7 @@ parse_math(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offs
 		displaymode = is_empty_all(data - offset, offset) && is_empty_all(data + i, size - i);
 
 	/* call callback */
-	if (doc->md.math(ob, &text, displaymode, &doc->data))
+	if (RENDER(doc, math, MATH)(ob, &text, displaymode, &doc->data))
 		return i;
 
 	return 0;
@@ -823,7 +1224,7 @@ char_linebreak(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 	while (ob->size && ob->data[ob->size - 1] == ' ')
 		ob->size--;
 
-	return doc->md.linebreak(ob, &doc->data) ? 1 : 0;
+	return RENDER(doc, linebreak, LINEBREAK)(ob, &doc->data) ? 1 : 0;
 }
 
 
@@ -862,10 +1263,10 @@ char_codespan(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t o
 		work.data = data + f_begin;
 		work.size = f_end - f_begin;
 
-		if (!doc->md.codespan(ob, &work, &doc->data))
+		if (!RENDER(doc, codespan, CODESPAN)(ob, &work, &doc->data))
 			end = 0;
 	} else {
-		if (!doc->md.codespan(ob, 0, &doc->data))
+		if (!RENDER(doc, codespan, CODESPAN)(ob, 0, &doc->data))
 			end = 0;
 	}
 
@@ -886,7 +1287,7 @@ char_quote(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offs
 	end = nq;
 	while (1) {
 		i = end;
-		end += find_emph_char(data + end, size - end, '"');
+		end += find_emph_char(doc, data + end, size - end, '"');
 		if (end == i) return 0;		/* no matching delimiter */
 		i = end;
 		while (end < size && data[end] == '"' && end - i < nq) end++;
@@ -907,11 +1308,11 @@ char_quote(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offs
 		hoedown_buffer *work = newbuf(doc, BUFFER_SPAN);
 		parse_inline(work, doc, data + f_begin, f_end - f_begin);
 
-		if (!doc->md.quote(ob, work, &doc->data))
+		if (!RENDER(doc, quote, QUOTE)(ob, work, &doc->data))
 			end = 0;
 		popbuf(doc, BUFFER_SPAN);
 	} else {
-		if (!doc->md.quote(ob, 0, &doc->data))
+		if (!RENDER(doc, quote, QUOTE)(ob, 0, &doc->data))
 			end = 0;
 	}
 
@@ -941,14 +1342,14 @@ char_escape(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t off
 		if (doc->md.normal_text) {
 			work.data = data + 1;
 			work.size = 1;
-			doc->md.normal_text(ob, &work, &doc->data);
+			RENDER(doc, normal_text, NORMAL_TEXT)(ob, &work, &doc->data);
 		}
 		else hoedown_buffer_putc(ob, data[1]);
 	} else if (size == 1) {
 		if (doc->md.normal_text) {
 			work.data = data;
 			work.size = 1;
-			doc->md.normal_text(ob, &work, &doc->data);
+			RENDER(doc, normal_text, NORMAL_TEXT)(ob, &work, &doc->data);
 		}
 		else hoedown_buffer_putc(ob, data[0]);
 	}
@@ -978,7 +1379,7 @@ char_entity(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t off
 	if (doc->md.entity) {
 		work.data = data;
 		work.size = end;
-		doc->md.entity(ob, &work, &doc->data);
+		RENDER(doc, entity, ENTITY)(ob, &work, &doc->data);
 	}
 	else hoedown_buffer_put(ob, data, end);
 
@@ -991,9 +1392,15 @@ char_langle_tag(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 {
 	hoedown_buffer work = { NULL, 0, 0, 0, NULL, NULL, NULL };
 	hoedown_autolink_type altype = HOEDOWN_AUTOLINK_NONE;
-	size_t end = tag_length(data, size, &altype);
+	size_t end;
 	int ret = 0;
 
+	/* tags and autolinks end with '>' */
+	if (scan_next(doc, data, size, '>') == size)
+		return 0;
+
+	end = tag_length(data, size, &altype);
+
 	work.data = data;
 	work.size = end;
 
@@ -1003,11 +1410,11 @@ char_langle_tag(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 			work.data = data + 1;
 			work.size = end - 2;
 			unscape_text(u_link, &work);
-			ret = doc->md.autolink(ob, u_link, altype, &doc->data);
+			ret = RENDER(doc, autolink, AUTOLINK)(ob, u_link, altype, &doc->data);
 			popbuf(doc, BUFFER_SPAN);
 		}
 		else if (doc->md.raw_html)
-			ret = doc->md.raw_html(ob, &work, &doc->data);
+			ret = RENDER(doc, raw_html, RAW_HTML)(ob, &work, &doc->data);
 	}
 
 	if (!ret) return 0;
@@ -1037,11 +1444,11 @@ char_autolink_www(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size
 
 		if (doc->md.normal_text) {
 			link_text = newbuf(doc, BUFFER_SPAN);
-			doc->md.normal_text(link_text, link, &doc->data);
-			doc->md.link(ob, link_text, link_url, NULL, &doc->data);
+			RENDER(doc, normal_text, NORMAL_TEXT)(link_text, link, &doc->data);
+			RENDER(doc, link, LINK)(ob, link_text, link_url, NULL, &doc->data);
 			popbuf(doc, BUFFER_SPAN);
 		} else {
-			doc->md.link(ob, link, link_url, NULL, &doc->data);
+			RENDER(doc, link, LINK)(ob, link, link_url, NULL, &doc->data);
 		}
 		popbuf(doc, BUFFER_SPAN);
 	}
@@ -1067,7 +1474,7 @@ char_autolink_email(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, si
 		else
 			ob->size = 0;
 
-		doc->md.autolink(ob, link, HOEDOWN_AUTOLINK_EMAIL, &doc->data);
+		RENDER(doc, autolink, AUTOLINK)(ob, link, HOEDOWN_AUTOLINK_EMAIL, &doc->data);
 	}
 
 	popbuf(doc, BUFFER_SPAN);
@@ -1091,7 +1498,7 @@ char_autolink_url(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size
 		else
 			ob->size = 0;
 
-		doc->md.autolink(ob, link, HOEDOWN_AUTOLINK_NORMAL, &doc->data);
+		RENDER(doc, autolink, AUTOLINK)(ob, link, HOEDOWN_AUTOLINK_NORMAL, &doc->data);
 	}
 
 	popbuf(doc, BUFFER_SPAN);
@@ -1114,7 +1521,7 @@ static size_t
 char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offset, size_t size)
 {
 	int is_img = (offset && data[-1] == '!' && !is_escaped(data - offset, offset - 1));
-	int is_footnote = (doc->ext_flags & HOEDOWN_EXT_FOOTNOTES && data[1] == '^');
+	int is_footnote = (doc->ext_flags & HOEDOWN_EXT_FOOTNOTES && size > 1 && data[1] == '^');
 	size_t i = 1, txt_e, link_b = 0, link_e = 0, title_b = 0, title_e = 0;
 	hoedown_buffer *content = NULL;
 	hoedown_buffer *link = NULL;
@@ -1129,7 +1536,7 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 		goto cleanup;
 
 	/* looking for the matching closing bracket */
-	i += find_emph_char(data + i, size - i, ']');
+	i += find_emph_char(doc, data + i, size - i, ']');
 	txt_e = i;
 
 	if (i < size && data[i] == ']') i++;
@@ -1157,7 +1564,7 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 
 			/* render */
 			if (doc->md.footnote_ref)
-				ret = doc->md.footnote_ref(ob, fr->num, &doc->data);
+				ret = RENDER(doc, footnote_ref, FOOTNOTE_REF)(ob, fr->num, &doc->data);
 		}
 
 		goto cleanup;
@@ -1180,6 +1587,10 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 
 		link_b = i;
 
+		/* the link or the title ends with ')' */
+		if (scan_next(doc, data + i, size - i, ')') == size - i)
+			goto cleanup;
+
 		/* looking for link end: ' " ) */
 		/* Count the number of open parenthesis */
 		nb_p = 0;
@@ -1259,7 +1670,7 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 		/* looking for the id */
 		i++;
 		link_b = i;
-		while (i < size && data[i] != ']') i++;
+		i += scan_next(doc, data + i, size - i, ']');
 		if (i >= size) goto cleanup;
 		link_e = i;
 
@@ -1269,7 +1680,7 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 		else
 			hoedown_buffer_put(id, data + link_b, link_e - link_b);
 
-		lr = find_link_ref(doc->refs, id->data, id->size);
+		lr = find_link_ref(&doc->refs, id->data, id->size);
 		if (!lr)
 			goto cleanup;
 
@@ -1288,7 +1699,7 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 		replace_spacing(id, data + 1, txt_e - 1);
 
 		/* finding the link_ref */
-		lr = find_link_ref(doc->refs, id->data, id->size);
+		lr = find_link_ref(&doc->refs, id->data, id->size);
 		if (!lr)
 			goto cleanup;
 
@@ -1321,9 +1732,9 @@ char_link(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t offse
 
 	/* calling the relevant rendering function */
 	if (is_img) {
-		ret = doc->md.image(ob, u_link, title, content, &doc->data);
+		ret = RENDER(doc, image, IMAGE)(ob, u_link, title, content, &doc->data);
 	} else {
-		ret = doc->md.link(ob, content, u_link, title, &doc->data);
+		ret = RENDER(doc, link, LINK)(ob, content, u_link, title, &doc->data);
 	}
 
 	/* cleanup */
@@ -1346,7 +1757,7 @@ char_superscript(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_
 
 	if (data[1] == '(') {
 		sup_start = 2;
-		sup_len = find_emph_char(data + 2, size - 2, ')') + 2;
+		sup_len = find_emph_char(doc, data + 2, size - 2, ')') + 2;
 
 		if (sup_len == size)
 			return 0;
@@ -1362,7 +1773,7 @@ char_superscript(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_
 
 	sup = newbuf(doc, BUFFER_SPAN);
 	parse_inline(sup, doc, data + sup_start, sup_len - sup_start);
-	doc->md.superscript(ob, sup, &doc->data);
+	RENDER(doc, superscript, SUPERSCRIPT)(ob, sup, &doc->data);
 	popbuf(doc, BUFFER_SPAN);
 
 	return (sup_start == 2) ? sup_len + 1 : sup_len;
@@ -1666,7 +2077,7 @@ parse_blockquote(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_
 
 	parse_block(out, doc, work_data, work_size);
 	if (doc->md.blockquote)
-		doc->md.blockquote(ob, out, &doc->data);
+		RENDER(doc, blockquote, BLOCKQUOTE)(ob, out, &doc->data);
 	popbuf(doc, BUFFER_BLOCK);
 	return end;
 }
@@ -1711,7 +2122,7 @@ parse_paragraph(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 		hoedown_buffer *tmp = newbuf(doc, BUFFER_BLOCK);
 		parse_inline(tmp, doc, work.data, work.size);
 		if (doc->md.paragraph)
-			doc->md.paragraph(ob, tmp, &doc->data);
+			RENDER(doc, paragraph, PARAGRAPH)(ob, tmp, &doc->data);
 		popbuf(doc, BUFFER_BLOCK);
 	} else {
 		hoedown_buffer *header_work;
@@ -1733,7 +2144,7 @@ parse_paragraph(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 				parse_inline(tmp, doc, work.data, work.size);
 
 				if (doc->md.paragraph)
-					doc->md.paragraph(ob, tmp, &doc->data);
+					RENDER(doc, paragraph, PARAGRAPH)(ob, tmp, &doc->data);
 
 				popbuf(doc, BUFFER_BLOCK);
 				work.data += beg;
@@ -1746,7 +2157,7 @@ parse_paragraph(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 		parse_inline(header_work, doc, work.data, work.size);
 
 		if (doc->md.header)
-			doc->md.header(ob, header_work, (int)level, &doc->data);
+			RENDER(doc, header, HEADER)(ob, header_work, (int)level, &doc->data);
 
 		popbuf(doc, BUFFER_SPAN);
 	}
@@ -1792,7 +2203,7 @@ parse_fencedcode(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_
 	text.size = line_start - text_start;
 
 	if (doc->md.blockcode)
-		doc->md.blockcode(ob, text.size ? &text : NULL, lang.size ? &lang : NULL, &doc->data);
+		RENDER(doc, blockcode, BLOCKCODE)(ob, text.size ? &text : NULL, lang.size ? &lang : NULL, &doc->data);
 
 	return i;
 }
@@ -1832,7 +2243,7 @@ parse_blockcode(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 	hoedown_buffer_putc(work, '\n');
 
 	if (doc->md.blockcode)
-		doc->md.blockcode(ob, work, NULL, &doc->data);
+		RENDER(doc, blockcode, BLOCKCODE)(ob, work, NULL, &doc->data);
 
 	popbuf(doc, BUFFER_BLOCK);
 	return beg;
@@ -1968,7 +2379,7 @@ parse_listitem(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 
 	/* render of li itself */
 	if (doc->md.listitem)
-		doc->md.listitem(ob, inter, *flags, &doc->data);
+		RENDER(doc, listitem, LISTITEM)(ob, inter, *flags, &doc->data);
 
 	popbuf(doc, BUFFER_SPAN);
 	popbuf(doc, BUFFER_SPAN);
@@ -1985,7 +2396,7 @@ parse_list(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t size
 
 	work = newbuf(doc, BUFFER_BLOCK);
 
-	while (i < size) {
+	while (i < size && !doc->aborted) {
 		j = parse_listitem(work, doc, data + i, size - i, &flags);
 		i += j;
 
@@ -1994,7 +2405,7 @@ parse_list(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t size
 	}
 
 	if (doc->md.list)
-		doc->md.list(ob, work, flags, &doc->data);
+		RENDER(doc, list, LIST)(ob, work, flags, &doc->data);
 	popbuf(doc, BUFFER_BLOCK);
 	return i;
 }
@@ -2026,7 +2437,7 @@ parse_atxheader(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 		parse_inline(work, doc, data + i, end - i);
 
 		if (doc->md.header)
-			doc->md.header(ob, work, (int)level, &doc->data);
+			RENDER(doc, header, HEADER)(ob, work, (int)level, &doc->data);
 
 		popbuf(doc, BUFFER_SPAN);
 	}
@@ -2044,7 +2455,7 @@ parse_footnote_def(hoedown_buffer *ob, hoedown_document *doc, unsigned int num,
 	parse_block(work, doc, data, size);
 
 	if (doc->md.footnote_def)
-	doc->md.footnote_def(ob, work, num, &doc->data);
+	RENDER(doc, footnote_def, FOOTNOTE_DEF)(ob, work, num, &doc->data);
 	popbuf(doc, BUFFER_SPAN);
 }
 
@@ -2062,14 +2473,14 @@ parse_footnote_list(hoedown_buffer *ob, hoedown_document *doc, struct footnote_l
 	work = newbuf(doc, BUFFER_BLOCK);
 
 	item = footnotes->head;
-	while (item) {
+	while (item && !doc->aborted) {
 		ref = item->ref;
 		parse_footnote_def(work, doc, ref->num, ref->contents->data, ref->contents->size);
 		item = item->next;
 	}
 
 	if (doc->md.footnotes)
-		doc->md.footnotes(ob, work, &doc->data);
+		RENDER(doc, footnotes, FOOTNOTES)(ob, work, &doc->data);
 	popbuf(doc, BUFFER_BLOCK);
 }
 
@@ -2189,7 +2600,7 @@ parse_htmlblock(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 			if (j) {
 				work.size = i + j;
 				if (do_render && doc->md.blockhtml)
-					doc->md.blockhtml(ob, &work, &doc->data);
+					RENDER(doc, blockhtml, BLOCKHTML)(ob, &work, &doc->data);
 				return work.size;
 			}
 		}
@@ -2206,7 +2617,7 @@ parse_htmlblock(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 				if (j) {
 					work.size = i + j;
 					if (do_render && doc->md.blockhtml)
-						doc->md.blockhtml(ob, &work, &doc->data);
+						RENDER(doc, blockhtml, BLOCKHTML)(ob, &work, &doc->data);
 					return work.size;
 				}
 			}
@@ -2231,7 +2642,7 @@ parse_htmlblock(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t
 	/* the end of the block has been found */
 	work.size = tag_end;
 	if (do_render && doc->md.blockhtml)
-		doc->md.blockhtml(ob, &work, &doc->data);
+		RENDER(doc, blockhtml, BLOCKHTML)(ob, &work, &doc->data);
 
 	return tag_end;
 }
@@ -2268,7 +2679,7 @@ parse_table_row(
 
 		cell_start = i;
 
-		len = find_emph_char(data + i, size - i, '|');
+		len = find_emph_char(doc, data + i, size - i, '|');
 
 		/* Two possibilities for len == 0:
 		   1) No more pipe char found in the current line.
@@ -2285,7 +2696,7 @@ parse_table_row(
 			cell_end--;
 
 		parse_inline(cell_work, doc, data + cell_start, 1 + cell_end - cell_start);
-		doc->md.table_cell(row_work, cell_work, col_data[col] | header_flag, &doc->data);
+		RENDER(doc, table_cell, TABLE_CELL)(row_work, cell_work, col_data[col] | header_flag, &doc->data);
 
 		popbuf(doc, BUFFER_SPAN);
 		i++;
@@ -2293,10 +2704,10 @@ parse_table_row(
 
 	for (; col < columns; ++col) {
 		hoedown_buffer empty_cell = { 0, 0, 0, 0, NULL, NULL, NULL };
-		doc->md.table_cell(row_work, &empty_cell, col_data[col] | header_flag, &doc->data);
+		RENDER(doc, table_cell, TABLE_CELL)(row_work, &empty_cell, col_data[col] | header_flag, &doc->data);
 	}
 
-	doc->md.table_row(ob, row_work, &doc->data);
+	RENDER(doc, table_row, TABLE_ROW)(ob, row_work, &doc->data);
 
 	popbuf(doc, BUFFER_SPAN);
 }
@@ -2416,7 +2827,7 @@ parse_table(
 	i = parse_table_header(header_work, doc, data, size, &columns, &col_data);
 	if (i > 0) {
 
-		while (i < size) {
+		while (i < size && !doc->aborted) {
 			size_t row_start;
 			int pipes = 0;
 
@@ -2444,13 +2855,13 @@ parse_table(
 		}
 
         if (doc->md.table_header)
-            doc->md.table_header(work, header_work, &doc->data);
+            RENDER(doc, table_header, TABLE_HEADER)(work, header_work, &doc->data);
 
         if (doc->md.table_body)
-            doc->md.table_body(work, body_work, &doc->data);
+            RENDER(doc, table_body, TABLE_BODY)(work, body_work, &doc->data);
 
 		if (doc->md.table)
-			doc->md.table(ob, work, &doc->data);
+			RENDER(doc, table, TABLE)(ob, work, &doc->data);
 	}
 
 	free(col_data);
@@ -2460,64 +2871,84 @@ parse_table(
 	return i;
 }
 
-/* parse_block • parsing of one block, returning next uint8_t to parse */
+/* flush_output • hands everything but the last byte of ob to the flush
+ * callback, and aborts the document when it fails */
 static void
-parse_block(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t size)
+flush_output(hoedown_buffer *ob, hoedown_document *doc)
 {
-	size_t beg, end, i;
-	uint8_t *txt_data;
-	beg = 0;
+	if (!doc->flush(ob->data, ob->size - 1, doc->flush_opaque))
+		doc->aborted = 1;
+	doc->out_flushed += ob->size - 1;
+	ob->data[0] = ob->data[ob->size - 1];
+	ob->size = 1;
+}
 
-	if (doc->work_bufs[BUFFER_SPAN].size +
-		doc->work_bufs[BUFFER_BLOCK].size > doc->max_nesting)
-		return;
+/* parse_block_step • parses the block at the start of data, returning its size */
+static size_t
+parse_block_step(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t size)
+{
+	size_t i;
 
-	while (beg < size) {
-		txt_data = data + beg;
-		end = size - beg;
+	if (is_atxheader(doc, data, size))
+		return parse_atxheader(ob, doc, data, size);
 
-		if (is_atxheader(doc, txt_data, end))
-			beg += parse_atxheader(ob, doc, txt_data, end);
+	else if (data[0] == '<' && doc->md.blockhtml &&
+			(i = parse_htmlblock(ob, doc, data, size, 1)) != 0)
+		return i;
 
-		else if (data[beg] == '<' && doc->md.blockhtml &&
-				(i = parse_htmlblock(ob, doc, txt_data, end, 1)) != 0)
-			beg += i;
+	else if ((i = is_empty(data, size)) != 0)
+		return i;
 
-		else if ((i = is_empty(txt_data, end)) != 0)
-			beg += i;
+	else if (is_hrule(data, size)) {
+		if (doc->md.hrule)
+			RENDER(doc, hrule, HRULE)(ob, &doc->data);
 
-		else if (is_hrule(txt_data, end)) {
-			if (doc->md.hrule)
-				doc->md.hrule(ob, &doc->data);
+		for (i = 0; i < size && data[i] != '\n'; i++);
 
-			while (beg < size && data[beg] != '\n')
-				beg++;
+		return i + 1;
+	}
 
-			beg++;
-		}
+	else if ((doc->ext_flags & HOEDOWN_EXT_FENCED_CODE) != 0 &&
+		(i = parse_fencedcode(ob, doc, data, size)) != 0)
+		return i;
+
+	else if ((doc->ext_flags & HOEDOWN_EXT_TABLES) != 0 &&
+		(i = parse_table(ob, doc, data, size)) != 0)
+		return i;
 
-		else if ((doc->ext_flags & HOEDOWN_EXT_FENCED_CODE) != 0 &&
-			(i = parse_fencedcode(ob, doc, txt_data, end)) != 0)
-			beg += i;
+	else if (prefix_quote(data, size))
+		return parse_blockquote(ob, doc, data, size);
 
-		else if ((doc->ext_flags & HOEDOWN_EXT_TABLES) != 0 &&
-			(i = parse_table(ob, doc, txt_data, end)) != 0)
-			beg += i;
+	else if (!(doc->ext_flags & HOEDOWN_EXT_DISABLE_INDENTED_CODE) && prefix_code(data, size))
+		return parse_blockcode(ob, doc, data, size);
 
-		else if (prefix_quote(txt_data, end))
-			beg += parse_blockquote(ob, doc, txt_data, end);
+	else if (prefix_uli(data, size))
+		return parse_list(ob, doc, data, size, 0);
 
-		else if (!(doc->ext_flags & HOEDOWN_EXT_DISABLE_INDENTED_CODE) && prefix_code(txt_data, end))
-			beg += parse_blockcode(ob, doc, txt_data, end);
+	else if (prefix_oli(data, size))
+		return parse_list(ob, doc, data, size, HOEDOWN_LIST_ORDERED);
 
-		else if (prefix_uli(txt_data, end))
-			beg += parse_list(ob, doc, txt_data, end, 0);
+	else
+		return parse_paragraph(ob, doc, data, size);
+}
 
-		else if (prefix_oli(txt_data, end))
-			beg += parse_list(ob, doc, txt_data, end, HOEDOWN_LIST_ORDERED);
+/* parse_block • parsing of one block, returning next uint8_t to parse */
+static void
+parse_block(hoedown_buffer *ob, hoedown_document *doc, uint8_t *data, size_t size)
+{
+	size_t beg = 0;
 
-		else
-			beg += parse_paragraph(ob, doc, txt_data, end);
+	if (doc->work_bufs[BUFFER_SPAN].size +
+		doc->work_bufs[BUFFER_BLOCK].size > doc->max_nesting)
+		return;
+
+	while (beg < size && !doc->aborted) {
+		count_step(doc);
+		beg += parse_block_step(ob, doc, data + beg, size - beg);
+
+		if (doc->flush && !doc->aborted && ob->size > doc->flush_threshold &&
+			doc->work_bufs[BUFFER_SPAN].size + doc->work_bufs[BUFFER_BLOCK].size == 0)
+			flush_output(ob, doc);
 	}
 }
 
@@ -2626,22 +3057,24 @@ is_footnote(const uint8_t *data, size_t beg, size_t end, size_t *last, struct fo
 			free_footnote_ref(ref);
 			return 0;
 		}
+		index_footnote_ref(list, ref);
 		ref->contents = contents;
 	}
 
 	return 1;
 }
 
-/* is_ref • returns whether a line is a reference or not */
+/* is_ref • returns whether a line is a reference or not, read is set to
+ * the end of what was looked at, which goes into the next line for a title */
 static int
-is_ref(const uint8_t *data, size_t beg, size_t end, size_t *last, struct link_ref **refs)
+is_ref(const uint8_t *data, size_t beg, size_t end, size_t *last, size_t *read, struct ref_table *refs)
 {
 /*	int n; */
 	size_t i = 0;
 	size_t id_offset, id_end;
 	size_t link_offset, link_end;
 	size_t title_offset, title_end;
-	size_t line_end;
+	size_t line_end, read_end;
 
 	/* up to 3 optional leading spaces */
 	if (beg + 3 >= end) return 0;
@@ -2693,11 +3126,13 @@ is_ref(const uint8_t *data, size_t beg, size_t end, size_t *last, struct link_re
 	if (i >= end || data[i] == '\r' || data[i] == '\n') line_end = i;
 	if (i + 1 < end && data[i] == '\n' && data[i + 1] == '\r')
 		line_end = i + 1;
+	read_end = i;
 
 	/* optional (space|tab)* spacer after a newline */
 	if (line_end) {
 		i = line_end + 1;
-		while (i < end && data[i] == ' ') i++; }
+		while (i < end && data[i] == ' ') i++;
+		read_end = i < end ? i + 1 : end; }
 
 	/* optional title: any non-newline sequence enclosed in '"()
 					alone on its line */
@@ -2708,6 +3143,7 @@ is_ref(const uint8_t *data, size_t beg, size_t end, size_t *last, struct link_re
 		title_offset = i;
 		/* looking for EOL */
 		while (i < end && data[i] != '\n' && data[i] != '\r') i++;
+		read_end = i;
 		if (i + 1 < end && data[i] == '\n' && data[i + 1] == '\r')
 			title_end = i + 1;
 		else	title_end = i;
@@ -2726,6 +3162,8 @@ is_ref(const uint8_t *data, size_t beg, size_t end, size_t *last, struct link_re
 	/* a valid ref has been found, filling-in return structures */
 	if (last)
 		*last = line_end;
+	if (read)
+		*read = read_end > line_end ? read_end : line_end;
 
 	if (refs) {
 		struct link_ref *ref;
@@ -2802,6 +3240,10 @@ hoedown_document_new(
 	hoedown_stack_init(&doc->work_bufs[BUFFER_BLOCK], 4);
 	hoedown_stack_init(&doc->work_bufs[BUFFER_SPAN], 8);
 
+	memset(&doc->refs, 0x0, sizeof(doc->refs));
+	memset(&doc->footnotes_found, 0x0, sizeof(doc->footnotes_found));
+	memset(&doc->footnotes_used, 0x0, sizeof(doc->footnotes_used));
+
 	memset(doc->active_char, 0x0, 256);
 
 	if (extensions & HOEDOWN_EXT_UNDERLINE && doc->md.underline) {
@@ -2851,35 +3293,44 @@ hoedown_document_new(
 	doc->ext_flags = extensions;
 	doc->max_nesting = max_nesting;
 	doc->in_link_body = 0;
+	doc->aborted = 0;
+
+	memset(&doc->scan, 0x0, sizeof(doc->scan));
+	hoedown_stack_init(&doc->scan.hops, 8);
+
+	doc->flush = NULL;
+	doc->flush_opaque = NULL;
+	doc->flush_threshold = 0;
+	doc->stats = NULL;
+
+	doc->limits = NULL;
+	start_limits(doc, NULL);
 
 	return doc;
 }
 
-void
-hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t *data, size_t size)
+unsigned int
+hoedown_document_start(hoedown_document *doc, hoedown_buffer *ob, hoedown_buffer *text, hoedown_buffer *defs, const uint8_t *data, size_t size)
 {
 	static const uint8_t UTF8_BOM[] = {0xEF, 0xBB, 0xBF};
 
-	hoedown_buffer *text;
-	size_t beg, end;
+	size_t beg, end, read;
 
 	int footnotes_enabled;
 
-	text = hoedown_buffer_new(64);
-
 	/* Preallocate enough space for our buffer to avoid expanding while copying */
 	hoedown_buffer_grow(text, size);
 
-	/* reset the references table */
-	memset(&doc->refs, 0x0, REF_TABLE_SIZE * sizeof(void *));
+	/* reset the references table and the footnotes lists, which are
+	 * already empty unless the last document wasn't finished */
+	free_link_refs(&doc->refs);
+	free_footnote_list(&doc->footnotes_found, 1);
+	free_footnote_list(&doc->footnotes_used, 0);
 
-	footnotes_enabled = doc->ext_flags & HOEDOWN_EXT_FOOTNOTES;
+	doc->aborted = 0;
+	start_limits(doc, ob);
 
-	/* reset the footnotes lists */
-	if (footnotes_enabled) {
-		memset(&doc->footnotes_found, 0x0, sizeof(doc->footnotes_found));
-		memset(&doc->footnotes_used, 0x0, sizeof(doc->footnotes_used));
-	}
+	footnotes_enabled = doc->ext_flags & HOEDOWN_EXT_FOOTNOTES;
 
 	/* first pass: looking for references, copying everything else */
 	beg = 0;
@@ -2890,10 +3341,16 @@ hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t
 		beg += 3;
 
 	while (beg < size) /* iterating over lines */
-		if (footnotes_enabled && is_footnote(data, beg, size, &end, &doc->footnotes_found))
+		if (footnotes_enabled && is_footnote(data, beg, size, &end, &doc->footnotes_found)) {
+			if (defs)
+				hoedown_buffer_put(defs, data + beg, end - beg);
 			beg = end;
-		else if (is_ref(data, beg, size, &end, doc->refs))
+		}
+		else if (is_ref(data, beg, size, &end, &read, &doc->refs)) {
+			if (defs)
+				hoedown_buffer_put(defs, data + beg, read - beg);
 			beg = end;
+		}
 		else { /* skipping to the next line */
 			end = beg;
 			while (end < size && data[end] != '\n' && data[end] != '\r')
@@ -2913,21 +3370,47 @@ hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t
 			beg = end;
 		}
 
-	/* pre-grow the output buffer to minimize allocations */
-	hoedown_buffer_grow(ob, text->size + (text->size >> 1));
+	/* adding a final newline if not already present */
+	if (text->size && text->data[text->size - 1] != '\n' && text->data[text->size - 1] != '\r')
+		hoedown_buffer_putc(text, '\n');
+
+	/* pre-grow the output buffer to minimize allocations, unless it's
+	 * flushed as it goes */
+	if (!doc->flush)
+		hoedown_buffer_grow(ob, text->size + (text->size >> 1));
 
 	/* second pass: actual rendering */
 	if (doc->md.doc_header)
 		doc->md.doc_header(ob, 0, &doc->data);
 
-	if (text->size) {
-		/* adding a final newline if not already present */
-		if (text->data[text->size - 1] != '\n' &&  text->data[text->size - 1] != '\r')
-			hoedown_buffer_putc(text, '\n');
+	return footnotes_enabled ? doc->footnotes_found.count : 0;
+}
 
-		parse_block(ob, doc, text->data, text->size);
+size_t
+hoedown_document_render_block(hoedown_document *doc, hoedown_buffer *ob, uint8_t *data, size_t size)
+{
+	size_t beg = 0, i;
+
+	/* nothing more is rendered once the document is aborted */
+	if (doc->aborted)
+		return size;
+
+	while (beg < size && (i = is_empty(data + beg, size - beg)) != 0)
+		beg += i;
+
+	if (beg < size) {
+		count_step(doc);
+		beg += parse_block_step(ob, doc, data + beg, size - beg);
 	}
 
+	return beg < size ? beg : size;
+}
+
+void
+hoedown_document_finish(hoedown_document *doc, hoedown_buffer *ob)
+{
+	int footnotes_enabled = doc->ext_flags & HOEDOWN_EXT_FOOTNOTES;
+
 	/* footnotes */
 	if (footnotes_enabled)
 		parse_footnote_list(ob, doc, &doc->footnotes_used);
@@ -2935,9 +3418,12 @@ hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t
 	if (doc->md.doc_footer)
 		doc->md.doc_footer(ob, 0, &doc->data);
 
+	/* the footnotes and the footer can make the output too large */
+	if (doc->limits && !doc->aborted)
+		check_limits(doc);
+
 	/* clean-up */
-	hoedown_buffer_free(text);
-	free_link_refs(doc->refs);
+	free_link_refs(&doc->refs);
 	if (footnotes_enabled) {
 		free_footnote_list(&doc->footnotes_found, 1);
 		free_footnote_list(&doc->footnotes_used, 0);
@@ -2947,6 +3433,20 @@ hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t
 	assert(doc->work_bufs[BUFFER_BLOCK].size == 0);
 }
 
+void
+hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t *data, size_t size)
+{
+	hoedown_buffer *text = hoedown_buffer_new(64);
+
+	hoedown_document_start(doc, ob, text, NULL, data, size);
+
+	if (text->size)
+		parse_block(ob, doc, text->data, text->size);
+
+	hoedown_document_finish(doc, ob);
+	hoedown_buffer_free(text);
+}
+
 void
 hoedown_document_render_inline(hoedown_document *doc, hoedown_buffer *ob, const uint8_t *data, size_t size)
 {
@@ -2954,7 +3454,10 @@ hoedown_document_render_inline(hoedown_document *doc, hoedown_buffer *ob, const
 	hoedown_buffer *text = hoedown_buffer_new(64);
 
 	/* reset the references table */
-	memset(&doc->refs, 0x0, REF_TABLE_SIZE * sizeof(void *));
+	free_link_refs(&doc->refs);
+
+	doc->aborted = 0;
+	start_limits(doc, ob);
 
 	/* first pass: expand tabs and process newlines */
 	hoedown_buffer_grow(text, size);
@@ -2994,6 +3497,50 @@ hoedown_document_render_inline(hoedown_document *doc, hoedown_buffer *ob, const
 	assert(doc->work_bufs[BUFFER_BLOCK].size == 0);
 }
 
+void
+hoedown_document_abort(const hoedown_renderer_data *data)
+{
+	hoedown_document *doc = (hoedown_document *)
+		((char *) data - offsetof(hoedown_document, data));
+
+	doc->aborted = 1;
+}
+
+void
+hoedown_document_set_flush(hoedown_document *doc, hoedown_flush_cb flush, void *opaque, size_t threshold)
+{
+	doc->flush = flush;
+	doc->flush_opaque = opaque;
+	doc->flush_threshold = threshold;
+}
+
+void
+hoedown_document_set_stats(hoedown_document *doc, hoedown_document_stats *stats)
+{
+	doc->stats = stats;
+}
+
+hoedown_document_stats *
+hoedown_document_get_stats(const hoedown_renderer_data *data)
+{
+	hoedown_document *doc = (hoedown_document *)
+		((char *) data - offsetof(hoedown_document, data));
+
+	return doc->stats;
+}
+
+void
+hoedown_document_set_limits(hoedown_document *doc, const hoedown_document_limits *limits)
+{
+	doc->limits = limits;
+}
+
+hoedown_limit
+hoedown_document_get_limit(const hoedown_document *doc)
+{
+	return doc->limit;
+}
+
 void
 hoedown_document_free(hoedown_document *doc)
 {
@@ -3008,5 +3555,13 @@ hoedown_document_free(hoedown_document *doc)
 	hoedown_stack_uninit(&doc->work_bufs[BUFFER_SPAN]);
 	hoedown_stack_uninit(&doc->work_bufs[BUFFER_BLOCK]);
 
+	for (i = 0; i < SCAN_SLOTS; ++i)
+		free(doc->scan.entries[i].misses);
+	hoedown_stack_uninit(&doc->scan.hops);
+
+	free_link_refs(&doc->refs);
+	ref_table_free(&doc->refs);
+	ref_table_free(&doc->footnotes_found.index);
+
 	free(doc);
 }
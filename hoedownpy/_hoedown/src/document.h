@@ -143,6 +143,92 @@ struct hoedown_renderer {
 };
 typedef struct hoedown_renderer hoedown_renderer;
 
+/* hoedown_flush_cb - receives rendered output at top-level block boundaries,
+ * returns 0 to stop rendering like hoedown_document_abort */
+typedef int (*hoedown_flush_cb)(const uint8_t *data, size_t size, void *opaque);
+
+/* hoedown_stats_node - indexes into hoedown_document_stats.nodes, in the
+ * same order as the callbacks of hoedown_renderer */
+enum hoedown_stats_node {
+	/* block level */
+	HOEDOWN_STATS_BLOCKCODE,
+	HOEDOWN_STATS_BLOCKQUOTE,
+	HOEDOWN_STATS_HEADER,
+	HOEDOWN_STATS_HRULE,
+	HOEDOWN_STATS_LIST,
+	HOEDOWN_STATS_LISTITEM,
+	HOEDOWN_STATS_PARAGRAPH,
+	HOEDOWN_STATS_TABLE,
+	HOEDOWN_STATS_TABLE_HEADER,
+	HOEDOWN_STATS_TABLE_BODY,
+	HOEDOWN_STATS_TABLE_ROW,
+	HOEDOWN_STATS_TABLE_CELL,
+	HOEDOWN_STATS_FOOTNOTES,
+	HOEDOWN_STATS_FOOTNOTE_DEF,
+	HOEDOWN_STATS_BLOCKHTML,
+
+	/* span level */
+	HOEDOWN_STATS_AUTOLINK,
+	HOEDOWN_STATS_CODESPAN,
+	HOEDOWN_STATS_DOUBLE_EMPHASIS,
+	HOEDOWN_STATS_EMPHASIS,
+	HOEDOWN_STATS_UNDERLINE,
+	HOEDOWN_STATS_HIGHLIGHT,
+	HOEDOWN_STATS_QUOTE,
+	HOEDOWN_STATS_IMAGE,
+	HOEDOWN_STATS_LINEBREAK,
+	HOEDOWN_STATS_LINK,
+	HOEDOWN_STATS_TRIPLE_EMPHASIS,
+	HOEDOWN_STATS_STRIKETHROUGH,
+	HOEDOWN_STATS_SUPERSCRIPT,
+	HOEDOWN_STATS_FOOTNOTE_REF,
+	HOEDOWN_STATS_MATH,
+	HOEDOWN_STATS_RAW_HTML,
+
+	/* low level */
+	HOEDOWN_STATS_ENTITY,
+	HOEDOWN_STATS_NORMAL_TEXT,
+
+	HOEDOWN_STATS_NODES
+};
+typedef enum hoedown_stats_node hoedown_stats_node;
+
+/* hoedown_document_stats - counters added to while rendering */
+struct hoedown_document_stats {
+	/* calls of every renderer callback */
+	unsigned long nodes[HOEDOWN_STATS_NODES];
+
+	/* deepest nesting of work buffers, and how many were allocated */
+	size_t max_depth;
+	size_t work_bufs;
+
+	/* seconds spent in renderer callbacks, for renderers that time
+	 * themselves with hoedown_document_get_stats */
+	double callback_time;
+};
+typedef struct hoedown_document_stats hoedown_document_stats;
+
+/* hoedown_limit - the limit that stopped a render */
+enum hoedown_limit {
+	HOEDOWN_LIMIT_NONE = 0,
+	HOEDOWN_LIMIT_STEPS,
+	HOEDOWN_LIMIT_OUTPUT,
+	HOEDOWN_LIMIT_TIME
+};
+typedef enum hoedown_limit hoedown_limit;
+
+/* hoedown_document_limits - bounds on the work of a render, 0 is no limit.
+ * A step is one pass of the block or inline parsing loop. */
+struct hoedown_document_limits {
+	size_t max_steps;
+	size_t max_output;
+
+	/* the render stops once clock() returns more than deadline */
+	double deadline;
+	double (*clock)(void);
+};
+typedef struct hoedown_document_limits hoedown_document_limits;
+
 
 /*************
  * FUNCTIONS *
@@ -158,9 +244,55 @@ hoedown_document *hoedown_document_new(
 /* hoedown_document_render: render regular Markdown using the document processor */
 void hoedown_document_render(hoedown_document *doc, hoedown_buffer *ob, const uint8_t *data, size_t size);
 
+/* hoedown_document_start: first step of rendering a document block by block.
+ * Resets the document, collects the reference and footnote definitions (their
+ * source, with the part of the next line read for a title, is appended to defs
+ * unless it's NULL), appends the text that's left to text and renders the
+ * document header. Returns the number of footnote
+ * definitions. */
+unsigned int hoedown_document_start(hoedown_document *doc, hoedown_buffer *ob, hoedown_buffer *text, hoedown_buffer *defs, const uint8_t *data, size_t size);
+
+/* hoedown_document_render_block: render the top-level block at the start of
+ * data (a part of the text filled in by hoedown_document_start), skipping any
+ * empty lines before it. Returns the number of bytes consumed. data is
+ * modified while parsing. */
+size_t hoedown_document_render_block(hoedown_document *doc, hoedown_buffer *ob, uint8_t *data, size_t size);
+
+/* hoedown_document_finish: render the footnotes and the document footer and
+ * release what hoedown_document_start collected */
+void hoedown_document_finish(hoedown_document *doc, hoedown_buffer *ob);
+
 /* hoedown_document_render_inline: render inline Markdown using the document processor */
 void hoedown_document_render_inline(hoedown_document *doc, hoedown_buffer *ob, const uint8_t *data, size_t size);
 
+/* hoedown_document_abort: called by a renderer callback to stop rendering the
+ * document as soon as possible, e.g. after an error. What's been rendered so
+ * far is left in the output buffer. */
+void hoedown_document_abort(const hoedown_renderer_data *data);
+
+/* hoedown_document_set_flush: pass the output buffer to flush (and empty it)
+ * whenever it holds more than threshold bytes after a top-level block. The
+ * last byte is kept back so renderers still see a non-empty buffer, the
+ * caller must handle whatever is left in it after rendering. Pass NULL to
+ * turn flushing off. */
+void hoedown_document_set_flush(hoedown_document *doc, hoedown_flush_cb flush, void *opaque, size_t threshold);
+
+/* hoedown_document_set_stats: add to stats while rendering, until it's called
+ * with NULL. Collecting nothing costs a test per callback. */
+void hoedown_document_set_stats(hoedown_document *doc, hoedown_document_stats *stats);
+
+/* hoedown_document_get_stats: called by a renderer callback, returns the
+ * stats of the document being rendered or NULL */
+hoedown_document_stats *hoedown_document_get_stats(const hoedown_renderer_data *data);
+
+/* hoedown_document_set_limits: stop rendering, like hoedown_document_abort,
+ * once a render goes past limits, until it's called again with NULL */
+void hoedown_document_set_limits(hoedown_document *doc, const hoedown_document_limits *limits);
+
+/* hoedown_document_get_limit: returns the limit that stopped the last render,
+ * or HOEDOWN_LIMIT_NONE */
+hoedown_limit hoedown_document_get_limit(const hoedown_document *doc);
+
 /* hoedown_document_free: deallocate a document processor instance */
 void hoedown_document_free(hoedown_document *doc);
 
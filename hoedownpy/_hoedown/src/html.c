@@ -52,25 +52,522 @@ static void escape_href(hoedown_buffer *ob, const uint8_t *source, size_t length
 	hoedown_escape_href(ob, source, length);
 }
 
+/* smartypants_begin • returns the buffer a callback writes its output to:
+ * ob, or a work buffer that smartypants_end processes into ob */
+static hoedown_buffer *
+smartypants_begin(hoedown_buffer *ob, hoedown_html_renderer_state *state)
+{
+	if (!(state->flags & HOEDOWN_HTML_SMARTYPANTS) || state->smartypants.skip_tag)
+		return ob;
+
+	if (!state->smartypants_work)
+		state->smartypants_work = hoedown_buffer_new(64);
+
+	state->smartypants_work->size = 0;
+	return state->smartypants_work;
+}
+
+static void
+smartypants_end(hoedown_buffer *ob, hoedown_buffer *work, hoedown_html_renderer_state *state)
+{
+	if (work != ob)
+		hoedown_html_smartypants_text(ob, &state->smartypants,
+			ob->size ? ob->data[ob->size - 1] : 0, work->data, work->size);
+}
+
+/* url_host • copies the host of a URL to host, which has room for
+ * HOST_MAX bytes, the way browsers find it: without tabs and newlines, and
+ * after any slashes or backslashes following a special scheme like
+ * "https:". Returns 1 for a URL with a host, 0 for one without a scheme
+ * or host, and -1 for one with a scheme but no host, like "mailto:" ones */
+#define HOST_MAX 256
+
+static int
+url_host(const uint8_t *url, size_t size, uint8_t *host, size_t *host_size)
+{
+	static const char *special[] = {"http", "https", "ftp", "ws", "wss"};
+	uint8_t clean[HOST_MAX * 2];
+	size_t i, j, length = 0, scheme = 0, beg, end;
+
+	/* leading spaces and control characters, tabs and newlines are left
+	 * out, up to the longest host that's looked at */
+	for (i = 0; i < size && url[i] <= ' '; i++);
+	for (; i < size && length < sizeof(clean); i++)
+		if (url[i] != '\t' && url[i] != '\n' && url[i] != '\r')
+			clean[length++] = url[i];
+
+	if (length && isalpha(clean[0])) {
+		for (i = 1; i < length && (isalnum(clean[i]) || clean[i] == '+' || clean[i] == '-' || clean[i] == '.'); i++);
+		if (i < length && clean[i] == ':')
+			scheme = i;
+	}
+
+	if (scheme) {
+		beg = scheme + 1;
+
+		for (i = 0; i < sizeof(special) / sizeof(special[0]); i++) {
+			for (j = 0; j < scheme && special[i][j] == tolower(clean[j]); j++);
+			if (j == scheme && special[i][j] == 0)
+				break;
+		}
+
+		/* browsers take backslashes for slashes */
+		if (i < sizeof(special) / sizeof(special[0])) {
+			while (beg < length && (clean[beg] == '/' || clean[beg] == '\\'))
+				beg++;
+		} else if (beg + 2 <= length && (clean[beg] == '/' || clean[beg] == '\\') &&
+			   (clean[beg + 1] == '/' || clean[beg + 1] == '\\')) {
+			beg += 2;
+		} else {
+			return -1;
+		}
+	} else {
+		if (length < 2 || (clean[0] != '/' && clean[0] != '\\') || (clean[1] != '/' && clean[1] != '\\'))
+			return 0;
+		beg = 2;
+	}
+
+	end = beg;
+	while (end < length && clean[end] != '/' && clean[end] != '\\' && clean[end] != '?' && clean[end] != '#')
+		end++;
+
+	/* a host that doesn't end in the cleaned part is too long */
+	if (end == length && length == sizeof(clean))
+		return -1;
+
+	/* skip the user info */
+	for (i = end; i > beg; i--) {
+		if (clean[i - 1] == '@') {
+			beg = i;
+			break;
+		}
+	}
+
+	/* leave out the port */
+	if (beg < end && clean[beg] == '[') {
+		for (i = beg; i < end && clean[i] != ']'; i++);
+		end = i < end ? i + 1 : end;
+	} else {
+		for (i = beg; i < end && clean[i] != ':'; i++);
+		end = i;
+	}
+
+	/* "example.com." is "example.com" */
+	if (end > beg && clean[end - 1] == '.')
+		end--;
+
+	if (end == beg || end - beg > HOST_MAX)
+		return scheme ? -1 : 0;
+
+	memcpy(host, clean + beg, end - beg);
+	*host_size = end - beg;
+	return 1;
+}
+
+/* host_matches • checks if a host is one of a list of hosts */
+static int
+host_matches(const hoedown_html_host *hosts, size_t count, const uint8_t *host, size_t size)
+{
+	size_t i, j, offset;
+
+	for (i = 0; i < count; i++) {
+		const uint8_t *data = hosts[i].data;
+		size_t host_size = hosts[i].size;
+
+		/* ".example.com" matches "example.com" and its subdomains */
+		if (host_size && data[0] == '.') {
+			if (size == host_size - 1) {
+				data++;
+				host_size--;
+			} else if (size < host_size) {
+				continue;
+			}
+		} else if (size != host_size) {
+			continue;
+		}
+
+		offset = size - host_size;
+		for (j = 0; j < host_size && tolower(host[offset + j]) == data[j]; j++);
+		if (j == host_size)
+			return 1;
+	}
+
+	return 0;
+}
+
+/* link_rewrite • returns the URL rewritten by the first matching prefix,
+ * in the state's work buffer, or the URL itself */
+static const hoedown_buffer *
+link_rewrite(hoedown_html_renderer_state *state, const hoedown_buffer *url, const hoedown_html_link_prefix *prefixes, size_t count)
+{
+	size_t i;
+
+	for (i = 0; i < count; i++) {
+		const hoedown_html_link_prefix *rule = &prefixes[i];
+
+		if (url->size >= rule->prefix_size && memcmp(url->data, rule->prefix, rule->prefix_size) == 0) {
+			if (!state->link_work)
+				state->link_work = hoedown_buffer_new(64);
+
+			state->link_work->size = 0;
+			hoedown_buffer_put(state->link_work, rule->replacement, rule->replacement_size);
+			hoedown_buffer_put(state->link_work, url->data + rule->prefix_size, url->size - rule->prefix_size);
+			return state->link_work;
+		}
+	}
+
+	return url;
+}
+
+/* link_attributes • the link_attributes callback writing the attributes
+ * of the link rules */
+static void
+link_attributes(hoedown_buffer *ob, const hoedown_buffer *url, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+	const hoedown_html_link_rules *rules = state->link_rules;
+	uint8_t host[HOST_MAX];
+	size_t host_size;
+
+	hoedown_buffer_put(ob, rules->attributes, rules->attributes_size);
+
+	if (rules->external_attributes_size && url && url_host(url->data, url->size, host, &host_size) > 0 &&
+	    !host_matches(rules->hosts, rules->host_count, host, host_size))
+		hoedown_buffer_put(ob, rules->external_attributes, rules->external_attributes_size);
+}
+
+
+/* name_in • checks if a name is in a list of lowercase names, ignoring its case */
+static int
+name_in(const char * const *names, size_t count, const uint8_t *name, size_t size)
+{
+	size_t i, j;
+
+	for (i = 0; i < count; i++) {
+		for (j = 0; j < size && names[i][j] && (uint8_t) names[i][j] == tolower(name[j]); j++);
+		if (j == size && names[i][j] == 0)
+			return 1;
+	}
+
+	return 0;
+}
+
+/* sanitizer_tag • returns the sanitizer's entry for a tag, or NULL if the tag isn't allowed */
+static const hoedown_html_sanitizer_tag *
+sanitizer_tag(const hoedown_html_sanitizer *sanitizer, const uint8_t *name, size_t size)
+{
+	size_t i;
+
+	for (i = 0; i < sanitizer->tag_count; i++)
+		if ((uint8_t) sanitizer->tags[i].name[0] == tolower(name[0]) &&
+		    name_in(&sanitizer->tags[i].name, 1, name, size))
+			return &sanitizer->tags[i];
+
+	return NULL;
+}
+
+/* sanitizer_url • checks that a URL is relative or uses an allowed
+ * protocol. Entities, spaces and control characters before the path could
+ * hide a protocol from the browser, so URLs with them aren't allowed. */
+static int
+sanitizer_url(const hoedown_html_sanitizer *sanitizer, const uint8_t *url, size_t size)
+{
+	size_t i;
+
+	for (i = 0; i < size && url[i] != '/' && url[i] != '?' && url[i] != '#'; i++) {
+		if (url[i] == ':')
+			return name_in(sanitizer->protocols, sanitizer->protocol_count, url, i);
+		if (url[i] == '&' || url[i] <= ' ' || url[i] == 0x7F)
+			return 0;
+	}
+
+	return 1;
+}
+
+/* sanitizer_attribute • writes an attribute if it's allowed on the tag */
+static void
+sanitizer_attribute(hoedown_buffer *ob, const hoedown_html_sanitizer *sanitizer, const hoedown_html_sanitizer_tag *tag,
+	const uint8_t *name, size_t name_size, const uint8_t *value, size_t value_size, int has_value)
+{
+	size_t i, mark;
+
+	if (!name_in(sanitizer->attributes, sanitizer->attribute_count, name, name_size) &&
+	    !name_in(tag->attributes, tag->attribute_count, name, name_size))
+		return;
+
+	if (name_in(sanitizer->url_attributes, sanitizer->url_attribute_count, name, name_size) &&
+	    (!has_value || !sanitizer_url(sanitizer, value, value_size)))
+		return;
+
+	hoedown_buffer_putc(ob, ' ');
+	mark = ob->size;
+	hoedown_buffer_put(ob, name, name_size);
+	for (i = mark; i < ob->size; i++)
+		ob->data[i] = tolower(ob->data[i]);
+
+	if (!has_value)
+		return;
+
+	/* the value is always quoted, entities are left alone */
+	HOEDOWN_BUFPUTSL(ob, "=\"");
+	for (i = 0; i < value_size; i++) {
+		mark = i;
+		while (i < value_size && value[i] != '"' && value[i] != '<' && value[i] != '>')
+			i++;
+		hoedown_buffer_put(ob, value + mark, i - mark);
+		if (i >= value_size)
+			break;
+		if (value[i] == '"')
+			HOEDOWN_BUFPUTSL(ob, "&quot;");
+		else if (value[i] == '<')
+			HOEDOWN_BUFPUTSL(ob, "&lt;");
+		else
+			HOEDOWN_BUFPUTSL(ob, "&gt;");
+	}
+	hoedown_buffer_putc(ob, '"');
+}
+
+/* sanitize_tag • writes the allowed parts of the tag, comment or
+ * declaration at the start of data, and returns its length, or 0 when data
+ * doesn't start with one. *skip is set to the name of a removed tag whose
+ * content must be left out too. */
+static size_t
+sanitize_tag(hoedown_buffer *ob, const uint8_t *data, size_t size, const hoedown_html_sanitizer *sanitizer, const char **skip)
+{
+	const hoedown_html_sanitizer_tag *tag = NULL;
+	size_t i = 1, name, name_size, attr, attr_size, value, value_size, mark = ob->size;
+	int closing = 0, self_closing = 0, has_value;
+	uint8_t quote;
+
+	*skip = NULL;
+
+	if (size < 3 || data[0] != '<')
+		return 0;
+
+	/* comments, declarations and processing instructions are removed */
+	if (data[1] == '!' || data[1] == '?') {
+		if (size > 4 && data[1] == '!' && data[2] == '-' && data[3] == '-') {
+			for (i = 4; i + 2 < size && (data[i] != '-' || data[i + 1] != '-' || data[i + 2] != '>'); i++);
+			i += 2;
+		} else {
+			while (i < size && data[i] != '>')
+				i++;
+		}
+
+		if (i >= size)
+			return 0;
+		i++;
+		goto removed;
+	}
+
+	if (data[1] == '/') {
+		closing = 1;
+		i++;
+	}
+
+	if (i >= size || !isalpha(data[i]))
+		return 0;
+
+	name = i;
+	while (i < size && (isalnum(data[i]) || data[i] == '-'))
+		i++;
+	name_size = i - name;
+
+	tag = sanitizer_tag(sanitizer, data + name, name_size);
+	if (tag) {
+		hoedown_buffer_putc(ob, '<');
+		if (closing) hoedown_buffer_putc(ob, '/');
+		hoedown_buffer_puts(ob, tag->name);
+	}
+
+	while (1) {
+		while (i < size && isspace(data[i]))
+			i++;
+
+		if (i >= size)
+			goto invalid;
+
+		if (data[i] == '>') {
+			i++;
+			break;
+		}
+
+		if (data[i] == '/') {
+			if (i + 1 < size && data[i + 1] == '>') {
+				self_closing = 1;
+				i += 2;
+				break;
+			}
+			i++;
+			continue;
+		}
+
+		attr = i;
+		while (i < size && !isspace(data[i]) && data[i] != '/' && data[i] != '>' && data[i] != '=')
+			i++;
+		attr_size = i - attr;
+
+		while (i < size && isspace(data[i]))
+			i++;
+
+		value = value_size = 0;
+		has_value = 0;
+		if (i < size && data[i] == '=') {
+			i++;
+			while (i < size && isspace(data[i]))
+				i++;
+			if (i >= size)
+				goto invalid;
+
+			if (data[i] == '"' || data[i] == '\'') {
+				quote = data[i++];
+				value = i;
+				while (i < size && data[i] != quote)
+					i++;
+				if (i >= size)
+					goto invalid;
+				value_size = i++ - value;
+			} else {
+				value = i;
+				while (i < size && !isspace(data[i]) && data[i] != '>')
+					i++;
+				value_size = i - value;
+			}
+			has_value = 1;
+		}
+
+		if (tag && !closing && attr_size)
+			sanitizer_attribute(ob, sanitizer, tag, data + attr, attr_size, data + value, value_size, has_value);
+	}
+
+	if (tag) {
+		if (self_closing)
+			hoedown_buffer_putc(ob, '/');
+		hoedown_buffer_putc(ob, '>');
+		return i;
+	}
+
+	if (!closing && !sanitizer->escape) {
+		if (name_in((const char *[]) {"script"}, 1, data + name, name_size))
+			*skip = "script";
+		else if (name_in((const char *[]) {"style"}, 1, data + name, name_size))
+			*skip = "style";
+	}
+
+removed:
+	if (sanitizer->escape)
+		escape_html(ob, data, i);
+	return i;
+
+invalid:
+	ob->size = mark;
+	return 0;
+}
+
+/* sanitizer_closes • checks if data starts with the closing tag of name,
+ * like hoedown_html_is_tag but ignoring the case as browsers do */
+static int
+sanitizer_closes(const uint8_t *data, size_t size, const char *name)
+{
+	size_t length = strlen(name);
+
+	return size > length + 2 && data[0] == '<' && data[1] == '/' &&
+		name_in(&name, 1, data + 2, length) &&
+		(isspace(data[length + 2]) || data[length + 2] == '>');
+}
+
+/* sanitize_html • writes raw HTML without the tags that aren't allowed,
+ * escaping the '<' that don't start a tag */
+static void
+sanitize_html(hoedown_buffer *ob, const uint8_t *data, size_t size, const hoedown_html_sanitizer *sanitizer)
+{
+	size_t i = 0, mark, length;
+	const char *skip;
+
+	while (i < size) {
+		mark = i;
+		while (i < size && data[i] != '<')
+			i++;
+
+		hoedown_buffer_put(ob, data + mark, i - mark);
+
+		if (i >= size)
+			break;
+
+		length = sanitize_tag(ob, data + i, size - i, sanitizer, &skip);
+		if (!length) {
+			HOEDOWN_BUFPUTSL(ob, "&lt;");
+			i++;
+			continue;
+		}
+		i += length;
+
+		/* the content of a removed <script> or <style> goes with it */
+		if (skip)
+			while (i < size && !sanitizer_closes(data + i, size - i, skip))
+				i++;
+	}
+}
+
+
+/* link_allowed • checks the URL of a link or image against the allowed
+ * hosts of the link rules and the protocols of the sanitizer */
+static int
+link_allowed(const hoedown_html_renderer_state *state, const hoedown_buffer *url)
+{
+	const hoedown_html_link_rules *rules = state->link_rules;
+	uint8_t host[HOST_MAX];
+	size_t host_size;
+	int found;
+
+	if (state->sanitizer && !sanitizer_url(state->sanitizer, url->data, url->size))
+		return 0;
+
+	if (!rules || !rules->allowlist)
+		return 1;
+
+	/* relative URLs are allowed, URLs with a scheme but no host aren't */
+	found = url_host(url->data, url->size, host, &host_size);
+	if (found <= 0)
+		return found == 0;
+
+	return host_matches(rules->allowed_hosts, rules->allowed_host_count, host, host_size);
+}
+
+
 /********************
  * GENERIC RENDERER *
  ********************/
 static int
-rndr_autolink(hoedown_buffer *ob, const hoedown_buffer *link, hoedown_autolink_type type, const hoedown_renderer_data *data)
+rndr_autolink(hoedown_buffer *out, const hoedown_buffer *link, hoedown_autolink_type type, const hoedown_renderer_data *data)
 {
 	hoedown_html_renderer_state *state = data->opaque;
+	hoedown_buffer *ob;
+
+	const hoedown_buffer *url = link;
 
 	if (!link || !link->size)
 		return 0;
 
+	ob = smartypants_begin(out, state);
+
+	if (state->link_rules && type != HOEDOWN_AUTOLINK_EMAIL)
+		url = link_rewrite(state, link, state->link_rules->link_prefixes, state->link_rules->link_prefix_count);
+
+	if (type != HOEDOWN_AUTOLINK_EMAIL && !link_allowed(state, url)) {
+		escape_html(ob, link->data, link->size);
+		smartypants_end(out, ob, state);
+		return 1;
+	}
+
 	HOEDOWN_BUFPUTSL(ob, "<a href=\"");
 	if (type == HOEDOWN_AUTOLINK_EMAIL)
 		HOEDOWN_BUFPUTSL(ob, "mailto:");
-	escape_href(ob, link->data, link->size);
+	escape_href(ob, url->data, url->size);
 
 	if (state->link_attributes) {
 		hoedown_buffer_putc(ob, '\"');
-		state->link_attributes(ob, link, data);
+		state->link_attributes(ob, url, data);
 		hoedown_buffer_putc(ob, '>');
 	} else {
 		HOEDOWN_BUFPUTSL(ob, "\">");
@@ -89,6 +586,7 @@ rndr_autolink(hoedown_buffer *ob, const hoedown_buffer *link, hoedown_autolink_t
 
 	HOEDOWN_BUFPUTSL(ob, "</a>");
 
+	smartypants_end(out, ob, state);
 	return 1;
 }
 
@@ -211,70 +709,508 @@ rndr_linebreak(hoedown_buffer *ob, const hoedown_renderer_data *data)
 	return 1;
 }
 
-static void
-rndr_header(hoedown_buffer *ob, const hoedown_buffer *content, int level, const hoedown_renderer_data *data)
+/* slug_entry: an anchor used in the document */
+struct slug_entry {
+	unsigned int hash;
+	unsigned int duplicates;	/* the number of the last "-N" anchor tried */
+
+	size_t offset;	/* of the anchor in hoedown_html_slugs.data */
+	size_t size;
+
+	size_t next;	/* next entry in the same bucket, plus one */
+};
+
+/* hoedown_html_slugs: hash table of slug_entry, doubling its buckets as it
+ * fills up. Its memory is reused by the next document. */
+struct hoedown_html_slugs {
+	size_t *buckets;	/* first entry of every bucket, plus one */
+	size_t size;
+
+	struct slug_entry *entries;
+	size_t count;
+	size_t capacity;
+
+	hoedown_buffer *data;
+};
+
+static unsigned int
+slug_hash(const uint8_t *data, size_t size)
 {
-	hoedown_html_renderer_state *state = data->opaque;
+	size_t i;
+	unsigned int hash = 0;
 
-	if (ob->size)
-		hoedown_buffer_putc(ob, '\n');
+	for (i = 0; i < size; ++i)
+		hash = data[i] + (hash << 6) + (hash << 16) - hash;
 
-	if (level <= state->toc_data.nesting_level)
-		hoedown_buffer_printf(ob, "<h%d id=\"toc_%d\">", level, state->toc_data.header_count++);
-	else
-		hoedown_buffer_printf(ob, "<h%d>", level);
+	return hash;
+}
 
-	if (content) hoedown_buffer_put(ob, content->data, content->size);
-	hoedown_buffer_printf(ob, "</h%d>\n", level);
+/* slugs_find • returns the entry of an anchor with a slug_hash, or NULL */
+static struct slug_entry *
+slugs_find(struct hoedown_html_slugs *slugs, const uint8_t *data, size_t size, unsigned int hash)
+{
+	struct slug_entry *entry;
+	size_t i;
+
+	if (!slugs->count)
+		return NULL;
+
+	for (i = slugs->buckets[hash & (slugs->size - 1)]; i; i = entry->next) {
+		entry = &slugs->entries[i - 1];
+		if (entry->hash == hash && entry->size == size &&
+		    memcmp(slugs->data->data + entry->offset, data, size) == 0)
+			return entry;
+	}
+
+	return NULL;
 }
 
-static int
-rndr_link(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_renderer_data *data)
+/* slugs_add • adds an anchor with a slug_hash, it mustn't be in the table yet */
+static void
+slugs_add(struct hoedown_html_slugs *slugs, const uint8_t *data, size_t size, unsigned int hash)
 {
-	hoedown_html_renderer_state *state = data->opaque;
+	struct slug_entry *entry;
+	size_t i, bucket;
 
-	HOEDOWN_BUFPUTSL(ob, "<a href=\"");
+	if (slugs->count >= slugs->size) {
+		size_t new_size = slugs->size ? slugs->size * 2 : 16;
 
-	if (link && link->size)
-		escape_href(ob, link->data, link->size);
+		free(slugs->buckets);
+		slugs->buckets = hoedown_calloc(new_size, sizeof(size_t));
+		slugs->size = new_size;
 
-	if (title && title->size) {
-		HOEDOWN_BUFPUTSL(ob, "\" title=\"");
-		escape_html(ob, title->data, title->size);
+		for (i = 0; i < slugs->count; ++i) {
+			bucket = slugs->entries[i].hash & (new_size - 1);
+			slugs->entries[i].next = slugs->buckets[bucket];
+			slugs->buckets[bucket] = i + 1;
+		}
 	}
 
-	if (state->link_attributes) {
-		hoedown_buffer_putc(ob, '\"');
-		state->link_attributes(ob, link, data);
-		hoedown_buffer_putc(ob, '>');
-	} else {
-		HOEDOWN_BUFPUTSL(ob, "\">");
+	if (slugs->count >= slugs->capacity) {
+		slugs->capacity = slugs->capacity ? slugs->capacity * 2 : 16;
+		slugs->entries = hoedown_realloc(slugs->entries, slugs->capacity * sizeof(struct slug_entry));
 	}
 
-	if (content && content->size) hoedown_buffer_put(ob, content->data, content->size);
-	HOEDOWN_BUFPUTSL(ob, "</a>");
-	return 1;
+	if (!slugs->data)
+		slugs->data = hoedown_buffer_new(256);
+
+	entry = &slugs->entries[slugs->count++];
+	entry->hash = hash;
+	entry->duplicates = 0;
+	entry->offset = slugs->data->size;
+	entry->size = size;
+	hoedown_buffer_put(slugs->data, data, size);
+
+	bucket = entry->hash & (slugs->size - 1);
+	entry->next = slugs->buckets[bucket];
+	slugs->buckets[bucket] = slugs->count;
 }
 
+/* slugs_clear • removes every anchor */
 static void
-rndr_list(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+slugs_clear(struct hoedown_html_slugs *slugs)
 {
-	if (ob->size) hoedown_buffer_putc(ob, '\n');
-	hoedown_buffer_put(ob, (const uint8_t *)(flags & HOEDOWN_LIST_ORDERED ? "<ol>\n" : "<ul>\n"), 5);
-	if (content) hoedown_buffer_put(ob, content->data, content->size);
-	hoedown_buffer_put(ob, (const uint8_t *)(flags & HOEDOWN_LIST_ORDERED ? "</ol>\n" : "</ul>\n"), 6);
+	if (slugs->count)
+		memset(slugs->buckets, 0, slugs->size * sizeof(size_t));
+
+	slugs->count = 0;
+	if (slugs->data)
+		slugs->data->size = 0;
 }
 
-static void
-rndr_listitem(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+/* slug_lower • lowercases the letters of the common alphabets */
+static unsigned long
+slug_lower(unsigned long c)
 {
-	HOEDOWN_BUFPUTSL(ob, "<li>");
-	if (content) {
-		size_t size = content->size;
-		while (size && content->data[size - 1] == '\n')
-			size--;
+	if ((c >= 0xC0 && c <= 0xDE && c != 0xD7) || (c >= 0x391 && c <= 0x3AB && c != 0x3A2) ||
+	    (c >= 0x410 && c <= 0x42F) || (c >= 0xFF21 && c <= 0xFF3A))
+		return c + 0x20;
+	if (c >= 0x400 && c <= 0x40F)
+		return c + 0x50;
+	if (c >= 0x531 && c <= 0x556)
+		return c + 0x30;
+	if (c == 0x386)
+		return 0x3AC;
+	if (c >= 0x388 && c <= 0x38A)
+		return c + 0x25;
+	if (c == 0x38C)
+		return 0x3CC;
+	if (c == 0x38E || c == 0x38F)
+		return c + 0x3F;
+	if (c == 0x178)
+		return 0xFF;
+
+	/* Latin Extended-A pairs, uppercase first, except for the Turkish
+	 * dotted and dotless i, which slug_char handles */
+	if ((c >= 0x100 && c <= 0x12F) || (c >= 0x132 && c <= 0x137) || (c >= 0x14A && c <= 0x177))
+		return c | 1;
+	if ((c >= 0x139 && c <= 0x148) || (c >= 0x179 && c <= 0x17E))
+		return c + (c & 1);
+
+	return c;
+}
 
-		hoedown_buffer_put(ob, content->data, size);
+/* slug_char • writes a character of a slug to out and returns its size:
+ * letters and digits lowercased, spaces as dashes, dashes and underscores,
+ * but no other punctuation, symbols or spaces */
+static size_t
+slug_char(uint8_t *out, unsigned long c)
+{
+	if (c < 0x80) {
+		if ((c >= 'a' && c <= 'z') || (c >= '0' && c <= '9') || c == '_')
+			out[0] = c;
+		else if (c >= 'A' && c <= 'Z')
+			out[0] = c + ('a' - 'A');
+		else if (c == ' ' || c == '-')
+			out[0] = '-';
+		else
+			return 0;
+		return 1;
+	}
+
+	/* Latin-1 punctuation and symbols, general punctuation, currency,
+	 * arrows, math and other symbols, CJK and fullwidth punctuation,
+	 * variation selectors, specials, emoji and invalid code points */
+	if ((c <= 0xBF && c != 0xAA && c != 0xB2 && c != 0xB3 && c != 0xB5 && c != 0xB9 && c != 0xBA &&
+	     (c < 0xBC || c > 0xBE)) ||
+	    c == 0xD7 || c == 0xF7 ||
+	    (c >= 0x2000 && c <= 0x2BFF && !(c >= 0x2070 && c <= 0x209F) && !(c >= 0x2150 && c <= 0x218F)) ||
+	    (c >= 0x2E00 && c <= 0x2E7F) || (c >= 0x3000 && c <= 0x303F) ||
+	    (c >= 0xD800 && c <= 0xDFFF) ||
+	    (c >= 0xFE00 && c <= 0xFE4F) || (c >= 0xFF00 && c <= 0xFF0F) ||
+	    (c >= 0xFF1A && c <= 0xFF20) || (c >= 0xFF3B && c <= 0xFF40) ||
+	    (c >= 0xFF5B && c <= 0xFF65) || (c >= 0xFFF0 && c <= 0xFFFF) ||
+	    (c >= 0x1F000 && c <= 0x1FAFF) || (c >= 0xE0000 && c <= 0xE007F) || c > 0x10FFFF)
+		return 0;
+
+	/* İ lowercases to i and a combining dot above, as in JavaScript */
+	if (c == 0x130) {
+		out[0] = 'i';
+		out[1] = 0xCC;
+		out[2] = 0x87;
+		return 3;
+	}
+
+	c = slug_lower(c);
+
+	if (c < 0x800) {
+		out[0] = 0xC0 | (c >> 6);
+		out[1] = 0x80 | (c & 0x3F);
+		return 2;
+	} else if (c < 0x10000) {
+		out[0] = 0xE0 | (c >> 12);
+		out[1] = 0x80 | ((c >> 6) & 0x3F);
+		out[2] = 0x80 | (c & 0x3F);
+		return 3;
+	}
+
+	out[0] = 0xF0 | (c >> 18);
+	out[1] = 0x80 | ((c >> 12) & 0x3F);
+	out[2] = 0x80 | ((c >> 6) & 0x3F);
+	out[3] = 0x80 | (c & 0x3F);
+	return 4;
+}
+
+/* header_slug • writes the slug of rendered header content, the way GitHub
+ * makes them: the text without tags, lowercased, without punctuation and
+ * with spaces as dashes */
+static void
+header_slug(hoedown_buffer *ob, const uint8_t *data, size_t size)
+{
+	/* the entities SmartyPants writes are slugged as the text it replaced,
+	 * so the table of contents renderer, which doesn't apply SmartyPants,
+	 * makes the same slugs */
+	static const struct { const char *name; const char *text; } entities[] = {
+		{"&ndash;", "--"}, {"&mdash;", "---"}, {"&copy;", "c"}, {"&reg;", "r"},
+		{"&trade;", "tm"}, {"&frac12;", "12"}, {"&frac14;", "14"}, {"&frac34;", "34"}
+	};
+	unsigned long c;
+	size_t i = 0, end, j, length;
+	uint8_t *out;
+
+	/* a slug is never longer than the content, but for İ, which takes 3
+	 * bytes for its 2 */
+	hoedown_buffer_grow(ob, ob->size + size + size / 2);
+	out = ob->data + ob->size;
+
+	while (i < size) {
+		c = data[i];
+
+		if (c < 0x80 && c != '<' && c != '&') {
+			out += slug_char(out, c);
+			i++;
+			continue;
+		}
+
+		if (c == '<') {
+			while (i < size && data[i] != '>')
+				i++;
+			i++;
+			continue;
+		}
+
+		if (c == '&') {
+			for (end = i + 1; end < size && end - i < 32 && (isalnum(data[end]) || data[end] == '#'); end++);
+
+			if (end >= size || data[end] != ';') {
+				i++;
+				continue;
+			}
+			end++;
+
+			if (data[i + 1] == '#') {
+				c = 0;
+				if (i + 2 < end && (data[i + 2] == 'x' || data[i + 2] == 'X')) {
+					for (j = i + 3; j < end - 1 && isxdigit(data[j]) && c <= 0x10FFFF; j++)
+						c = c * 16 + (isdigit(data[j]) ? data[j] - '0' : tolower(data[j]) - 'a' + 10);
+				} else {
+					for (j = i + 2; j < end - 1 && isdigit(data[j]) && c <= 0x10FFFF; j++)
+						c = c * 10 + (data[j] - '0');
+				}
+				if (j == end - 1 && c > 0)
+					out += slug_char(out, c);
+			} else {
+				for (j = 0; j < sizeof(entities) / sizeof(entities[0]); j++) {
+					if (end - i == strlen(entities[j].name) && memcmp(data + i, entities[j].name, end - i) == 0) {
+						for (length = 0; entities[j].text[length]; length++)
+							out += slug_char(out, (uint8_t) entities[j].text[length]);
+						break;
+					}
+				}
+			}
+
+			i = end;
+			continue;
+		}
+
+		/* UTF-8, invalid bytes are left out */
+		length = (c & 0xE0) == 0xC0 ? 2 : (c & 0xF0) == 0xE0 ? 3 : (c & 0xF8) == 0xF0 ? 4 : 0;
+
+		if (!length || i + length > size) {
+			i++;
+			continue;
+		}
+
+		c &= 0x3F >> (length - 1);
+		for (j = 1; j < length && (data[i + j] & 0xC0) == 0x80; j++)
+			c = (c << 6) | (data[i + j] & 0x3F);
+
+		if (j < length) {
+			i++;
+			continue;
+		}
+
+		out += slug_char(out, c);
+		i += length;
+	}
+
+	ob->size = out - ob->data;
+}
+
+/* header_anchor • returns the anchor of the next header: toc_<n>, or with
+ * HOEDOWN_HTML_SLUG_ANCHORS the slug of its content, with "-1", "-2"...
+ * added when it's already used in the document */
+static const hoedown_buffer *
+header_anchor(hoedown_html_renderer_state *state, const hoedown_buffer *content)
+{
+	hoedown_buffer *anchor;
+	struct slug_entry *entry;
+	unsigned int hash;
+	size_t size;
+	int id = state->toc_data.header_count++;
+
+	if (!state->anchor_work)
+		state->anchor_work = hoedown_buffer_new(64);
+
+	anchor = state->anchor_work;
+	anchor->size = 0;
+
+	if (!(state->flags & HOEDOWN_HTML_SLUG_ANCHORS)) {
+		hoedown_buffer_printf(anchor, "toc_%d", id);
+		return anchor;
+	}
+
+	if (!state->slugs)
+		state->slugs = hoedown_calloc(1, sizeof(struct hoedown_html_slugs));
+
+	if (content)
+		header_slug(anchor, content->data, content->size);
+	if (!anchor->size)
+		HOEDOWN_BUFPUTSL(anchor, "section");
+
+	size = anchor->size;
+	hash = slug_hash(anchor->data, size);
+	entry = slugs_find(state->slugs, anchor->data, size, hash);
+	if (entry) {
+		do {
+			anchor->size = size;
+			hoedown_buffer_printf(anchor, "-%u", ++entry->duplicates);
+			hash = slug_hash(anchor->data, anchor->size);
+		} while (slugs_find(state->slugs, anchor->data, anchor->size, hash));
+	}
+
+	slugs_add(state->slugs, anchor->data, anchor->size, hash);
+	return anchor;
+}
+
+/* toc_put_unlinked • copies HTML without the <a> and </a> tags, so rendered
+ * header content can go inside the link of a TOC entry */
+static void
+toc_put_unlinked(hoedown_buffer *ob, const uint8_t *data, size_t size)
+{
+	size_t i = 0, org;
+
+	while (i < size) {
+		org = i;
+		while (i < size && data[i] != '<')
+			i++;
+		hoedown_buffer_put(ob, data + org, i - org);
+
+		if (i >= size)
+			break;
+
+		if (i + 2 < size && data[i + 1] == 'a' && (data[i + 2] == ' ' || data[i + 2] == '>')) {
+			while (i < size && data[i] != '>')
+				i++;
+			i++;
+		} else if (i + 3 < size && data[i + 1] == '/' && data[i + 2] == 'a' && data[i + 3] == '>') {
+			i += 4;
+		} else {
+			hoedown_buffer_putc(ob, '<');
+			i++;
+		}
+	}
+}
+
+/* toc_entry • adds a header to the nested lists of a table of contents,
+ * linking to its anchor */
+static void
+toc_entry(hoedown_buffer *ob, const hoedown_buffer *content, int level, const hoedown_buffer *anchor, int unlink, hoedown_html_renderer_state *state)
+{
+	/* set the level offset if this is the first header
+	 * we're parsing for the document */
+	if (state->toc_data.current_level == 0)
+		state->toc_data.level_offset = level - 1;
+
+	level -= state->toc_data.level_offset;
+
+	if (level > state->toc_data.current_level) {
+		while (level > state->toc_data.current_level) {
+			HOEDOWN_BUFPUTSL(ob, "<ul>\n<li>\n");
+			state->toc_data.current_level++;
+		}
+	} else if (level < state->toc_data.current_level) {
+		HOEDOWN_BUFPUTSL(ob, "</li>\n");
+		while (level < state->toc_data.current_level) {
+			HOEDOWN_BUFPUTSL(ob, "</ul>\n</li>\n");
+			state->toc_data.current_level--;
+		}
+		HOEDOWN_BUFPUTSL(ob,"<li>\n");
+	} else {
+		HOEDOWN_BUFPUTSL(ob,"</li>\n<li>\n");
+	}
+
+	HOEDOWN_BUFPUTSL(ob, "<a href=\"#");
+	hoedown_buffer_put(ob, anchor->data, anchor->size);
+	HOEDOWN_BUFPUTSL(ob, "\">");
+	if (content && unlink)
+		toc_put_unlinked(ob, content->data, content->size);
+	else if (content)
+		hoedown_buffer_put(ob, content->data, content->size);
+	HOEDOWN_BUFPUTSL(ob, "</a>\n");
+}
+
+/* toc_close • closes the lists left open by toc_entry */
+static void
+toc_close(hoedown_buffer *ob, hoedown_html_renderer_state *state)
+{
+	while (state->toc_data.current_level > 0) {
+		HOEDOWN_BUFPUTSL(ob, "</li>\n</ul>\n");
+		state->toc_data.current_level--;
+	}
+}
+
+static void
+rndr_header(hoedown_buffer *ob, const hoedown_buffer *content, int level, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+	const hoedown_buffer *anchor;
+
+	if (ob->size)
+		hoedown_buffer_putc(ob, '\n');
+
+	if (level <= state->toc_data.nesting_level) {
+		anchor = header_anchor(state, content);
+		hoedown_buffer_printf(ob, "<h%d id=\"", level);
+		hoedown_buffer_put(ob, anchor->data, anchor->size);
+		HOEDOWN_BUFPUTSL(ob, "\">");
+
+		/* the same anchors in the table of contents */
+		if (state->toc)
+			toc_entry(state->toc, content, level, anchor, 1, state);
+	}
+	else
+		hoedown_buffer_printf(ob, "<h%d>", level);
+
+	if (content) hoedown_buffer_put(ob, content->data, content->size);
+	hoedown_buffer_printf(ob, "</h%d>\n", level);
+}
+
+static int
+rndr_link(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+
+	if (state->link_rules && link)
+		link = link_rewrite(state, link, state->link_rules->link_prefixes, state->link_rules->link_prefix_count);
+
+	if (link && !link_allowed(state, link)) {
+		if (content && content->size) hoedown_buffer_put(ob, content->data, content->size);
+		return 1;
+	}
+
+	HOEDOWN_BUFPUTSL(ob, "<a href=\"");
+
+	if (link && link->size)
+		escape_href(ob, link->data, link->size);
+
+	if (title && title->size) {
+		HOEDOWN_BUFPUTSL(ob, "\" title=\"");
+		escape_html(ob, title->data, title->size);
+	}
+
+	if (state->link_attributes) {
+		hoedown_buffer_putc(ob, '\"');
+		state->link_attributes(ob, link, data);
+		hoedown_buffer_putc(ob, '>');
+	} else {
+		HOEDOWN_BUFPUTSL(ob, "\">");
+	}
+
+	if (content && content->size) hoedown_buffer_put(ob, content->data, content->size);
+	HOEDOWN_BUFPUTSL(ob, "</a>");
+	return 1;
+}
+
+static void
+rndr_list(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+{
+	if (ob->size) hoedown_buffer_putc(ob, '\n');
+	hoedown_buffer_put(ob, (const uint8_t *)(flags & HOEDOWN_LIST_ORDERED ? "<ol>\n" : "<ul>\n"), 5);
+	if (content) hoedown_buffer_put(ob, content->data, content->size);
+	hoedown_buffer_put(ob, (const uint8_t *)(flags & HOEDOWN_LIST_ORDERED ? "</ol>\n" : "</ul>\n"), 6);
+}
+
+static void
+rndr_listitem(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+{
+	HOEDOWN_BUFPUTSL(ob, "<li>");
+	if (content) {
+		size_t size = content->size;
+		while (size && content->data[size - 1] == '\n')
+			size--;
+
+		hoedown_buffer_put(ob, content->data, size);
 	}
 	HOEDOWN_BUFPUTSL(ob, "</li>\n");
 }
@@ -325,6 +1261,8 @@ rndr_paragraph(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_
 static void
 rndr_raw_block(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
+	hoedown_html_renderer_state *state = data->opaque;
+	const uint8_t *html;
 	size_t org, sz;
 
 	if (!text)
@@ -342,10 +1280,31 @@ rndr_raw_block(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_ren
 	if (org >= sz)
 		return;
 
+	html = text->data + org;
+	sz -= org;
+
+	if (state->sanitizer) {
+		if (!state->sanitize_work)
+			state->sanitize_work = hoedown_buffer_new(64);
+
+		state->sanitize_work->size = 0;
+		sanitize_html(state->sanitize_work, html, sz, state->sanitizer);
+
+		html = state->sanitize_work->data;
+		sz = state->sanitize_work->size;
+		while (sz > 0 && isspace(html[sz - 1]))
+			sz--;
+		if (!sz)
+			return;
+	}
+
 	if (ob->size)
 		hoedown_buffer_putc(ob, '\n');
 
-	hoedown_buffer_put(ob, text->data + org, sz - org);
+	if (state->flags & HOEDOWN_HTML_SMARTYPANTS)
+		hoedown_html_smartypants_text(ob, &state->smartypants, '\n', html, sz);
+	else
+		hoedown_buffer_put(ob, html, sz);
 	hoedown_buffer_putc(ob, '\n');
 }
 
@@ -373,6 +1332,14 @@ rndr_image(hoedown_buffer *ob, const hoedown_buffer *link, const hoedown_buffer
 	hoedown_html_renderer_state *state = data->opaque;
 	if (!link || !link->size) return 0;
 
+	if (state->link_rules)
+		link = link_rewrite(state, link, state->link_rules->image_prefixes, state->link_rules->image_prefix_count);
+
+	if (!link_allowed(state, link)) {
+		if (alt && alt->size) escape_html(ob, alt->data, alt->size);
+		return 1;
+	}
+
 	HOEDOWN_BUFPUTSL(ob, "<img src=\"");
 	escape_href(ob, link->data, link->size);
 	HOEDOWN_BUFPUTSL(ob, "\" alt=\"");
@@ -396,13 +1363,27 @@ rndr_raw_html(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_rend
 	/* ESCAPE overrides SKIP_HTML. It doesn't look to see if
 	 * there are any valid tags, just escapes all of them. */
 	if((state->flags & HOEDOWN_HTML_ESCAPE) != 0) {
-		escape_html(ob, text->data, text->size);
+		hoedown_buffer *work = smartypants_begin(ob, state);
+		escape_html(work, text->data, text->size);
+		smartypants_end(ob, work, state);
 		return 1;
 	}
 
 	if ((state->flags & HOEDOWN_HTML_SKIP_HTML) != 0)
 		return 1;
 
+	if (state->sanitizer) {
+		size_t mark = ob->size;
+
+		sanitize_html(ob, text->data, text->size, state->sanitizer);
+		if (state->flags & HOEDOWN_HTML_SMARTYPANTS && ob->size > mark)
+			hoedown_html_smartypants_tag(&state->smartypants, ob->data + mark, ob->size - mark);
+		return 1;
+	}
+
+	if (state->flags & HOEDOWN_HTML_SMARTYPANTS)
+		hoedown_html_smartypants_tag(&state->smartypants, text->data, text->size);
+
 	hoedown_buffer_put(ob, text->data, text->size);
 	return 1;
 }
@@ -488,11 +1469,28 @@ rndr_superscript(hoedown_buffer *ob, const hoedown_buffer *content, const hoedow
 	return 1;
 }
 
+static void
+rndr_entity(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+	hoedown_buffer *work = smartypants_begin(ob, state);
+
+	hoedown_buffer_put(work, text->data, text->size);
+	smartypants_end(ob, work, state);
+}
+
 static void
 rndr_normal_text(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
 {
-	if (content)
-		escape_html(ob, content->data, content->size);
+	hoedown_html_renderer_state *state = data->opaque;
+	hoedown_buffer *work;
+
+	if (!content)
+		return;
+
+	work = smartypants_begin(ob, state);
+	escape_html(work, content->data, content->size);
+	smartypants_end(ob, work, state);
 }
 
 static void
@@ -548,11 +1546,16 @@ rndr_footnote_ref(hoedown_buffer *ob, unsigned int num, const hoedown_renderer_d
 }
 
 static int
-rndr_math(hoedown_buffer *ob, const hoedown_buffer *text, int displaymode, const hoedown_renderer_data *data)
+rndr_math(hoedown_buffer *out, const hoedown_buffer *text, int displaymode, const hoedown_renderer_data *data)
 {
+	hoedown_html_renderer_state *state = data->opaque;
+	hoedown_buffer *ob = smartypants_begin(out, state);
+
 	hoedown_buffer_put(ob, (const uint8_t *)(displaymode ? "\\[" : "\\("), 2);
 	escape_html(ob, text->data, text->size);
 	hoedown_buffer_put(ob, (const uint8_t *)(displaymode ? "\\]" : "\\)"), 2);
+
+	smartypants_end(out, ob, state);
 	return 1;
 }
 
@@ -561,34 +1564,32 @@ toc_header(hoedown_buffer *ob, const hoedown_buffer *content, int level, const h
 {
 	hoedown_html_renderer_state *state = data->opaque;
 
-	if (level <= state->toc_data.nesting_level) {
-		/* set the level offset if this is the first header
-		 * we're parsing for the document */
-		if (state->toc_data.current_level == 0)
-			state->toc_data.level_offset = level - 1;
+	if (level <= state->toc_data.nesting_level)
+		toc_entry(ob, content, level, header_anchor(state, content), 0, state);
+}
+
+/* toc_raw_html and toc_image • with slug anchors, render header content
+ * like the HTML renderer does, so the slugs are the same */
+static int
+toc_raw_html(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
 
-		level -= state->toc_data.level_offset;
+	if (!(state->flags & HOEDOWN_HTML_SLUG_ANCHORS))
+		return 0;
 
-		if (level > state->toc_data.current_level) {
-			while (level > state->toc_data.current_level) {
-				HOEDOWN_BUFPUTSL(ob, "<ul>\n<li>\n");
-				state->toc_data.current_level++;
-			}
-		} else if (level < state->toc_data.current_level) {
-			HOEDOWN_BUFPUTSL(ob, "</li>\n");
-			while (level < state->toc_data.current_level) {
-				HOEDOWN_BUFPUTSL(ob, "</ul>\n</li>\n");
-				state->toc_data.current_level--;
-			}
-			HOEDOWN_BUFPUTSL(ob,"<li>\n");
-		} else {
-			HOEDOWN_BUFPUTSL(ob,"</li>\n<li>\n");
-		}
+	return rndr_raw_html(ob, text, data);
+}
 
-		hoedown_buffer_printf(ob, "<a href=\"#toc_%d\">", state->toc_data.header_count++);
-		if (content) hoedown_buffer_put(ob, content->data, content->size);
-		HOEDOWN_BUFPUTSL(ob, "</a>\n");
-	}
+static int
+toc_image(hoedown_buffer *ob, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_buffer *alt, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+
+	if (!(state->flags & HOEDOWN_HTML_SLUG_ANCHORS))
+		return 0;
+
+	return rndr_image(ob, link, title, alt, data);
 }
 
 static int
@@ -608,12 +1609,37 @@ toc_finalize(hoedown_buffer *ob, int inline_render, const hoedown_renderer_data
 
 	state = data->opaque;
 
-	while (state->toc_data.current_level > 0) {
-		HOEDOWN_BUFPUTSL(ob, "</li>\n</ul>\n");
-		state->toc_data.current_level--;
-	}
+	toc_close(ob, state);
 
 	state->toc_data.header_count = 0;
+	if (state->slugs)
+		slugs_clear(state->slugs);
+}
+
+static void
+rndr_doc_header(hoedown_buffer *ob, int inline_render, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+
+	/* quotes don't pair across renders, inline ones included */
+	memset(&state->smartypants, 0x0, sizeof(state->smartypants));
+
+	/* header anchors are numbered from 0, and slugs unique, in every document */
+	if (!inline_render) {
+		state->toc_data.header_count = 0;
+		state->toc_data.current_level = 0;
+		if (state->slugs)
+			slugs_clear(state->slugs);
+	}
+}
+
+static void
+rndr_doc_footer(hoedown_buffer *ob, int inline_render, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+
+	if (!inline_render && state->toc)
+		toc_close(state->toc, state);
 }
 
 hoedown_renderer *
@@ -645,7 +1671,7 @@ hoedown_html_toc_renderer_new(int nesting_level)
 		rndr_underline,
 		rndr_highlight,
 		rndr_quote,
-		NULL,
+		toc_image,
 		NULL,
 		toc_link,
 		rndr_triple_emphasis,
@@ -653,12 +1679,12 @@ hoedown_html_toc_renderer_new(int nesting_level)
 		rndr_superscript,
 		NULL,
 		NULL,
-		NULL,
+		toc_raw_html,
 
 		NULL,
 		rndr_normal_text,
 
-		NULL,
+		rndr_doc_header,
 		toc_finalize
 	};
 
@@ -721,8 +1747,8 @@ hoedown_html_renderer_new(hoedown_html_flags render_flags, int nesting_level)
 		NULL,
 		rndr_normal_text,
 
-		NULL,
-		NULL
+		rndr_doc_header,
+		rndr_doc_footer
 	};
 
 	hoedown_html_renderer_state *state;
@@ -742,13 +1768,432 @@ hoedown_html_renderer_new(hoedown_html_flags render_flags, int nesting_level)
 	if (render_flags & HOEDOWN_HTML_SKIP_HTML || render_flags & HOEDOWN_HTML_ESCAPE)
 		renderer->blockhtml = NULL;
 
+	/* entities are copied as they are without a callback */
+	if (render_flags & HOEDOWN_HTML_SMARTYPANTS)
+		renderer->entity = rndr_entity;
+
+	renderer->opaque = state;
+	return renderer;
+}
+
+/*****************
+ * TEXT RENDERER *
+ *****************/
+
+/* text_block • writes a block, separated from the previous one by an empty line */
+static void
+text_block(hoedown_buffer *ob, const uint8_t *data, size_t size)
+{
+	while (size && isspace(data[size - 1]))
+		size--;
+	while (size && data[0] == '\n') {
+		data++;
+		size--;
+	}
+
+	if (!size)
+		return;
+
+	if (ob->size) HOEDOWN_BUFPUTSL(ob, "\n\n");
+	hoedown_buffer_put(ob, data, size);
+}
+
+/* text_line • writes a line of a list or a table, on a line of its own */
+static void
+text_line(hoedown_buffer *ob, const hoedown_buffer *content)
+{
+	size_t size = content ? content->size : 0;
+
+	while (size && isspace(content->data[size - 1]))
+		size--;
+
+	if (ob->size) hoedown_buffer_putc(ob, '\n');
+	if (size) hoedown_buffer_put(ob, content->data, size);
+}
+
+static void
+text_blockcode(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_buffer *lang, const hoedown_renderer_data *data)
+{
+	if (text) text_block(ob, text->data, text->size);
+}
+
+static void
+text_content_block(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+	size_t i = 0;
+
+	if (!content)
+		return;
+
+	while (i < content->size && isspace(content->data[i])) i++;
+	text_block(ob, content->data + i, content->size - i);
+}
+
+static void
+text_header(hoedown_buffer *ob, const hoedown_buffer *content, int level, const hoedown_renderer_data *data)
+{
+	text_content_block(ob, content, data);
+}
+
+static void
+text_list(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+{
+	text_content_block(ob, content, data);
+}
+
+static void
+text_listitem(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+{
+	text_line(ob, content);
+}
+
+static void
+text_table_part(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+	text_line(ob, content);
+}
+
+/* table cells are separated by tabs */
+static void
+text_tablecell(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_table_flags flags, const hoedown_renderer_data *data)
+{
+	if (ob->size) hoedown_buffer_putc(ob, '\t');
+	if (content) hoedown_buffer_put(ob, content->data, content->size);
+}
+
+static void
+text_footnote_def(hoedown_buffer *ob, const hoedown_buffer *content, unsigned int num, const hoedown_renderer_data *data)
+{
+	text_line(ob, content);
+}
+
+/* raw HTML blocks are written without their tags, the content of <script>
+ * and <style>, and the indentation and empty lines left behind */
+static void
+text_raw_block(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+	hoedown_buffer *work;
+	const char *skip;
+	size_t i = 0, mark, end, start = ob->size;
+
+	if (!text)
+		return;
+
+	work = hoedown_buffer_new(64);
+
+	while (i < text->size) {
+		mark = i;
+		while (i < text->size && text->data[i] != '<')
+			i++;
+
+		hoedown_buffer_put(work, text->data + mark, i - mark);
+
+		/* only a letter, / or ! after < starts a tag, a comment or a doctype */
+		if (i < text->size && (i + 1 == text->size ||
+			(!isalpha(text->data[i + 1]) && text->data[i + 1] != '/' && text->data[i + 1] != '!'))) {
+			hoedown_buffer_putc(work, '<');
+			i++;
+			continue;
+		}
+
+		skip = NULL;
+		if (hoedown_html_is_tag(text->data + i, text->size - i, "script") == HOEDOWN_HTML_TAG_OPEN)
+			skip = "script";
+		else if (hoedown_html_is_tag(text->data + i, text->size - i, "style") == HOEDOWN_HTML_TAG_OPEN)
+			skip = "style";
+
+		if (skip)
+			while (i < text->size && hoedown_html_is_tag(text->data + i, text->size - i, skip) != HOEDOWN_HTML_TAG_CLOSE)
+				i++;
+
+		while (i < text->size && text->data[i] != '>')
+			i++;
+		i++;
+	}
+
+	if (start) HOEDOWN_BUFPUTSL(ob, "\n\n");
+
+	for (i = 0; i < work->size; i = end + 1) {
+		for (end = i; end < work->size && work->data[end] != '\n'; end++);
+
+		for (mark = i; mark < end && isspace(work->data[mark]); mark++);
+		while (end > mark && isspace(work->data[end - 1])) end--;
+		if (end == mark) continue;
+
+		if (ob->size > start + (start ? 2 : 0)) hoedown_buffer_putc(ob, '\n');
+		hoedown_buffer_put(ob, work->data + mark, end - mark);
+
+		while (end < work->size && work->data[end] != '\n') end++;
+	}
+
+	/* nothing but tags */
+	if (start && ob->size == start + 2)
+		ob->size = start;
+
+	hoedown_buffer_free(work);
+}
+
+static int
+text_autolink(hoedown_buffer *ob, const hoedown_buffer *link, hoedown_autolink_type type, const hoedown_renderer_data *data)
+{
+	if (!link || !link->size)
+		return 0;
+
+	if (hoedown_buffer_prefix(link, "mailto:") == 0)
+		hoedown_buffer_put(ob, link->data + 7, link->size - 7);
+	else
+		hoedown_buffer_put(ob, link->data, link->size);
+	return 1;
+}
+
+static int
+text_code(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+	if (text) hoedown_buffer_put(ob, text->data, text->size);
+	return 1;
+}
+
+static int
+text_math(hoedown_buffer *ob, const hoedown_buffer *text, int displaymode, const hoedown_renderer_data *data)
+{
+	return text_code(ob, text, data);
+}
+
+static int
+text_span(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+	if (!content || !content->size) return 0;
+	hoedown_buffer_put(ob, content->data, content->size);
+	return 1;
+}
+
+static int
+text_quote(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+	if (!content || !content->size) return 0;
+	hoedown_buffer_putc(ob, '"');
+	hoedown_buffer_put(ob, content->data, content->size);
+	hoedown_buffer_putc(ob, '"');
+	return 1;
+}
+
+static int
+text_image(hoedown_buffer *ob, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_buffer *alt, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+
+	if ((state->flags & HOEDOWN_TEXT_IMAGE_ALT) && alt)
+		hoedown_buffer_put(ob, alt->data, alt->size);
+	return 1;
+}
+
+static int
+text_linebreak(hoedown_buffer *ob, const hoedown_renderer_data *data)
+{
+	hoedown_buffer_putc(ob, '\n');
+	return 1;
+}
+
+static int
+text_link(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_renderer_data *data)
+{
+	hoedown_html_renderer_state *state = data->opaque;
+
+	if (content) hoedown_buffer_put(ob, content->data, content->size);
+
+	/* the URL is left out when it's the text of the link */
+	if ((state->flags & HOEDOWN_TEXT_LINK_URLS) && link && link->size &&
+	    !(content && content->size == link->size && memcmp(content->data, link->data, link->size) == 0)) {
+		HOEDOWN_BUFPUTSL(ob, " (");
+		hoedown_buffer_put(ob, link->data, link->size);
+		hoedown_buffer_putc(ob, ')');
+	}
+	return 1;
+}
+
+static int
+text_footnote_ref(hoedown_buffer *ob, unsigned int num, const hoedown_renderer_data *data)
+{
+	return 1;
+}
+
+static int
+text_raw_html(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+	return 1;
+}
+
+/* text_put_utf8 • writes a code point as UTF-8, invalid ones as U+FFFD */
+static void
+text_put_utf8(hoedown_buffer *ob, unsigned long c)
+{
+	uint8_t s[4];
+
+	if (c == 0 || c > 0x10FFFF || (c >= 0xD800 && c <= 0xDFFF))
+		c = 0xFFFD;
+
+	if (c < 0x80) {
+		hoedown_buffer_putc(ob, (uint8_t) c);
+	} else if (c < 0x800) {
+		s[0] = 0xC0 | (c >> 6);
+		s[1] = 0x80 | (c & 0x3F);
+		hoedown_buffer_put(ob, s, 2);
+	} else if (c < 0x10000) {
+		s[0] = 0xE0 | (c >> 12);
+		s[1] = 0x80 | ((c >> 6) & 0x3F);
+		s[2] = 0x80 | (c & 0x3F);
+		hoedown_buffer_put(ob, s, 3);
+	} else {
+		s[0] = 0xF0 | (c >> 18);
+		s[1] = 0x80 | ((c >> 12) & 0x3F);
+		s[2] = 0x80 | ((c >> 6) & 0x3F);
+		s[3] = 0x80 | (c & 0x3F);
+		hoedown_buffer_put(ob, s, 4);
+	}
+}
+
+/* numeric entities and the ones escaping HTML are decoded, the others are
+ * written as they are */
+static void
+text_entity(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+	static const struct { const char *name; const char *value; } entities[] = {
+		{"&amp;", "&"}, {"&lt;", "<"}, {"&gt;", ">"}, {"&quot;", "\""},
+		{"&apos;", "'"}, {"&nbsp;", "\xc2\xa0"}
+	};
+	unsigned long c = 0;
+	size_t i;
+
+	if (text->size > 3 && text->data[1] == '#') {
+		if (text->data[2] == 'x' || text->data[2] == 'X') {
+			for (i = 3; i < text->size - 1 && isxdigit(text->data[i]) && c <= 0x10FFFF; i++)
+				c = c * 16 + (isdigit(text->data[i]) ? text->data[i] - '0' : tolower(text->data[i]) - 'a' + 10);
+		} else {
+			for (i = 2; i < text->size - 1 && isdigit(text->data[i]) && c <= 0x10FFFF; i++)
+				c = c * 10 + (text->data[i] - '0');
+		}
+
+		if (i == text->size - 1 && text->data[i] == ';') {
+			text_put_utf8(ob, c);
+			return;
+		}
+	}
+
+	for (i = 0; i < sizeof(entities) / sizeof(entities[0]); i++) {
+		if (text->size == strlen(entities[i].name) && memcmp(text->data, entities[i].name, text->size) == 0) {
+			hoedown_buffer_puts(ob, entities[i].value);
+			return;
+		}
+	}
+
+	hoedown_buffer_put(ob, text->data, text->size);
+}
+
+static void
+text_normal_text(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+	if (content) hoedown_buffer_put(ob, content->data, content->size);
+}
+
+hoedown_renderer *
+hoedown_text_renderer_new(hoedown_text_flags render_flags)
+{
+	static const hoedown_renderer cb_default = {
+		NULL,
+
+		text_blockcode,
+		text_content_block,
+		text_header,
+		NULL,
+		text_list,
+		text_listitem,
+		text_content_block,
+		text_content_block,
+		text_table_part,
+		text_table_part,
+		text_table_part,
+		text_tablecell,
+		text_content_block,
+		text_footnote_def,
+		text_raw_block,
+
+		text_autolink,
+		text_code,
+		text_span,
+		text_span,
+		text_span,
+		text_span,
+		text_quote,
+		text_image,
+		text_linebreak,
+		text_link,
+		text_span,
+		text_span,
+		text_span,
+		text_footnote_ref,
+		text_math,
+		text_raw_html,
+
+		text_entity,
+		text_normal_text,
+
+		NULL,
+		NULL
+	};
+
+	hoedown_html_renderer_state *state;
+	hoedown_renderer *renderer;
+
+	/* The state is the HTML renderer's, so it's freed the same way */
+	state = hoedown_malloc(sizeof(hoedown_html_renderer_state));
+	memset(state, 0x0, sizeof(hoedown_html_renderer_state));
+
+	state->flags = (hoedown_html_flags) render_flags;
+
+	renderer = hoedown_malloc(sizeof(hoedown_renderer));
+	memcpy(renderer, &cb_default, sizeof(hoedown_renderer));
+
 	renderer->opaque = state;
 	return renderer;
 }
 
+void
+hoedown_html_renderer_set_link_rules(hoedown_renderer *renderer, const hoedown_html_link_rules *rules)
+{
+	hoedown_html_renderer_state *state = renderer->opaque;
+
+	state->link_rules = rules;
+	state->link_attributes = rules ? link_attributes : NULL;
+}
+
+void
+hoedown_html_renderer_set_sanitizer(hoedown_renderer *renderer, const hoedown_html_sanitizer *sanitizer)
+{
+	hoedown_html_renderer_state *state = renderer->opaque;
+
+	state->sanitizer = sanitizer;
+}
+
 void
 hoedown_html_renderer_free(hoedown_renderer *renderer)
 {
+	hoedown_html_renderer_state *state = renderer->opaque;
+
+	if (state->smartypants_work)
+		hoedown_buffer_free(state->smartypants_work);
+	if (state->link_work)
+		hoedown_buffer_free(state->link_work);
+	if (state->sanitize_work)
+		hoedown_buffer_free(state->sanitize_work);
+	if (state->anchor_work)
+		hoedown_buffer_free(state->anchor_work);
+	if (state->slugs) {
+		if (state->slugs->data)
+			hoedown_buffer_free(state->slugs->data);
+		free(state->slugs->buckets);
+		free(state->slugs->entries);
+		free(state->slugs);
+	}
 	free(renderer->opaque);
 	free(renderer);
 }
@@ -19,9 +19,16 @@ typedef enum hoedown_html_flags {
 	HOEDOWN_HTML_SKIP_HTML = (1 << 0),
 	HOEDOWN_HTML_ESCAPE = (1 << 1),
 	HOEDOWN_HTML_HARD_WRAP = (1 << 2),
-	HOEDOWN_HTML_USE_XHTML = (1 << 3)
+	HOEDOWN_HTML_USE_XHTML = (1 << 3),
+	HOEDOWN_HTML_SLUG_ANCHORS = (1 << 4),
+	HOEDOWN_HTML_SMARTYPANTS = (1 << 10)
 } hoedown_html_flags;
 
+typedef enum hoedown_text_flags {
+	HOEDOWN_TEXT_LINK_URLS = (1 << 0),
+	HOEDOWN_TEXT_IMAGE_ALT = (1 << 1)
+} hoedown_text_flags;
+
 typedef enum hoedown_html_tag {
 	HOEDOWN_HTML_TAG_NONE = 0,
 	HOEDOWN_HTML_TAG_OPEN,
@@ -33,6 +40,86 @@ typedef enum hoedown_html_tag {
  * TYPES *
  *********/
 
+/* hoedown_html_smartypants_state: what SmartyPants remembers between the
+ * pieces of a document */
+struct hoedown_html_smartypants_state {
+	int in_squote;
+	int in_dquote;
+	const char *skip_tag;	/* the content of this tag is left alone */
+};
+typedef struct hoedown_html_smartypants_state hoedown_html_smartypants_state;
+
+/* hoedown_html_link_prefix: a URL prefix and what it's replaced with */
+struct hoedown_html_link_prefix {
+	const uint8_t *prefix;
+	size_t prefix_size;
+	const uint8_t *replacement;
+	size_t replacement_size;
+};
+typedef struct hoedown_html_link_prefix hoedown_html_link_prefix;
+
+/* hoedown_html_host: a lowercase host name, one starting with a dot also
+ * matches its subdomains */
+struct hoedown_html_host {
+	const uint8_t *data;
+	size_t size;
+};
+typedef struct hoedown_html_host hoedown_html_host;
+
+/* hoedown_html_sanitizer_tag: a lowercase tag name and the attributes
+ * allowed on it, besides the ones allowed on every tag */
+struct hoedown_html_sanitizer_tag {
+	const char *name;
+	const char **attributes;
+	size_t attribute_count;
+};
+typedef struct hoedown_html_sanitizer_tag hoedown_html_sanitizer_tag;
+
+/* hoedown_html_sanitizer: the tags and attributes left in raw HTML, the
+ * others are removed (or escaped when escape is set). The values of
+ * url_attributes, and the URLs of links and images, must be relative URLs
+ * or use one of the protocols. */
+struct hoedown_html_sanitizer {
+	const hoedown_html_sanitizer_tag *tags;
+	size_t tag_count;
+	const char **attributes;
+	size_t attribute_count;
+	const char **url_attributes;
+	size_t url_attribute_count;
+	const char **protocols;
+	size_t protocol_count;
+	int escape;
+};
+typedef struct hoedown_html_sanitizer hoedown_html_sanitizer;
+
+/* hoedown_html_link_rules: how the URLs of links and images are rewritten
+ * and filtered. A URL is rewritten by the first matching prefix, then its
+ * host (the one after "scheme://", "//", or "http:" and the other special
+ * schemes, relative URLs have none) is looked up. */
+struct hoedown_html_link_rules {
+	const hoedown_html_link_prefix *link_prefixes;
+	size_t link_prefix_count;
+	const hoedown_html_link_prefix *image_prefixes;
+	size_t image_prefix_count;
+
+	/* links to other hosts are external */
+	const hoedown_html_host *hosts;
+	size_t host_count;
+
+	/* when allowlist is set, links and images to other hosts, or with a
+	 * scheme but no host, are rendered as their content or alt text */
+	int allowlist;
+	const hoedown_html_host *allowed_hosts;
+	size_t allowed_host_count;
+
+	/* written after the href of every link and of external links */
+	const uint8_t *attributes;
+	size_t attributes_size;
+	const uint8_t *external_attributes;
+	size_t external_attributes_size;
+};
+typedef struct hoedown_html_link_rules hoedown_html_link_rules;
+
 struct hoedown_html_renderer_state {
 	void *opaque;
 
@@ -47,6 +134,29 @@ struct hoedown_html_renderer_state {
 
 	/* extra callbacks */
 	void (*link_attributes)(hoedown_buffer *ob, const hoedown_buffer *url, const hoedown_renderer_data *data);
+
+	/* set by hoedown_html_renderer_set_link_rules, and a buffer for the
+	 * rewritten URLs */
+	const hoedown_html_link_rules *link_rules;
+	hoedown_buffer *link_work;
+
+	/* set by hoedown_html_renderer_set_sanitizer, and a buffer for
+	 * sanitized HTML blocks */
+	const hoedown_html_sanitizer *sanitizer;
+	hoedown_buffer *sanitize_work;
+
+	/* the header anchors used in the document with
+	 * HOEDOWN_HTML_SLUG_ANCHORS, and a buffer for the anchor of a header */
+	struct hoedown_html_slugs *slugs;
+	hoedown_buffer *anchor_work;
+
+	/* when set, the HTML renderer also writes the table of contents here */
+	hoedown_buffer *toc;
+
+	/* HOEDOWN_HTML_SMARTYPANTS: the state, and a buffer for the output of a
+	 * callback before SmartyPants is applied */
+	hoedown_html_smartypants_state smartypants;
+	hoedown_buffer *smartypants_work;
 };
 typedef struct hoedown_html_renderer_state hoedown_html_renderer_state;
 
@@ -58,6 +168,14 @@ typedef struct hoedown_html_renderer_state hoedown_html_renderer_state;
 /* hoedown_html_smartypants: process an HTML snippet using SmartyPants for smart punctuation */
 void hoedown_html_smartypants(hoedown_buffer *ob, const uint8_t *data, size_t size);
 
+/* hoedown_html_smartypants_text: process a piece of HTML of a longer
+ * document, previous_char is the character written before it */
+void hoedown_html_smartypants_text(hoedown_buffer *ob, hoedown_html_smartypants_state *state, uint8_t previous_char, const uint8_t *data, size_t size);
+
+/* hoedown_html_smartypants_tag: let SmartyPants know about a tag written
+ * on its own, so it skips the content of <code>, <pre> and the like */
+void hoedown_html_smartypants_tag(hoedown_html_smartypants_state *state, const uint8_t *tag, size_t size);
+
 /* hoedown_html_is_tag: checks if data starts with a specific tag, returns the tag type or NONE */
 hoedown_html_tag hoedown_html_is_tag(const uint8_t *data, size_t size, const char *tagname);
 
@@ -73,6 +191,24 @@ hoedown_renderer *hoedown_html_toc_renderer_new(
 	int nesting_level
 ) __attribute__ ((malloc));
 
+/* hoedown_text_renderer_new: allocates a renderer producing plain text for
+ * indexing: the text of the blocks separated by empty lines, without markup
+ * or escaping. Free it with hoedown_html_renderer_free. */
+hoedown_renderer *hoedown_text_renderer_new(
+	hoedown_text_flags render_flags
+) __attribute__ ((malloc));
+
+/* hoedown_html_renderer_set_link_rules: apply rules to the links and images
+ * of an HTML renderer, or stop applying them when rules is NULL. The rules
+ * are used by the renderer, not copied. */
+void hoedown_html_renderer_set_link_rules(hoedown_renderer *renderer, const hoedown_html_link_rules *rules);
+
+/* hoedown_html_renderer_set_sanitizer: filter the raw HTML and the links of
+ * an HTML renderer, or stop filtering them when sanitizer is NULL.
+ * HOEDOWN_HTML_ESCAPE and HOEDOWN_HTML_SKIP_HTML take precedence for raw
+ * HTML. The sanitizer is used by the renderer, not copied. */
+void hoedown_html_renderer_set_sanitizer(hoedown_renderer *renderer, const hoedown_html_sanitizer *sanitizer);
+
 /* hoedown_html_renderer_free: deallocate an HTML renderer */
 void hoedown_html_renderer_free(hoedown_renderer *renderer);
 
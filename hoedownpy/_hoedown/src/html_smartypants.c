@@ -9,24 +9,19 @@
 #define snprintf _snprintf
 #endif
 
-struct smartypants_data {
-	int in_squote;
-	int in_dquote;
-};
-
-static size_t smartypants_cb__ltag(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__dquote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__amp(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__period(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__number(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__dash(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__parens(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__squote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__backtick(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
-static size_t smartypants_cb__escape(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__ltag(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__dquote(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__amp(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__period(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__number(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__dash(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__parens(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__squote(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__backtick(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
+static size_t smartypants_cb__escape(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size);
 
 static size_t (*smartypants_cb_ptrs[])
-	(hoedown_buffer *, struct smartypants_data *, uint8_t, const uint8_t *, size_t) =
+	(hoedown_buffer *, hoedown_html_smartypants_state *, uint8_t, const uint8_t *, size_t) =
 {
 	NULL,					/* 0 */
 	smartypants_cb__dash,	/* 1 */
@@ -112,7 +107,7 @@ smartypants_quotes(hoedown_buffer *ob, uint8_t previous_char, uint8_t next_char,
 	'text' points at the last character of the single-quote, e.g. ' or ;
 */
 static size_t
-smartypants_squote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size,
+smartypants_squote(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size,
 				   const uint8_t *squote_text, size_t squote_size)
 {
 	if (size >= 2) {
@@ -128,7 +123,7 @@ smartypants_squote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t pr
 
 		/* Tom's, isn't, I'm, I'd */
 		if ((t1 == 's' || t1 == 't' || t1 == 'm' || t1 == 'd') &&
-			(size == 3 || word_boundary(text[2]))) {
+			(size == 2 || word_boundary(text[2]))) {
 			HOEDOWN_BUFPUTSL(ob, "&rsquo;");
 			return 0;
 		}
@@ -140,14 +135,14 @@ smartypants_squote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t pr
 			if (((t1 == 'r' && t2 == 'e') ||
 				(t1 == 'l' && t2 == 'l') ||
 				(t1 == 'v' && t2 == 'e')) &&
-				(size == 4 || word_boundary(text[3]))) {
+				(size == 3 || word_boundary(text[3]))) {
 				HOEDOWN_BUFPUTSL(ob, "&rsquo;");
 				return 0;
 			}
 		}
 	}
 
-	if (smartypants_quotes(ob, previous_char, size > 0 ? text[1] : 0, 's', &smrt->in_squote))
+	if (smartypants_quotes(ob, previous_char, size > 1 ? text[1] : 0, 's', &smrt->in_squote))
 		return 0;
 
 	hoedown_buffer_put(ob, squote_text, squote_size);
@@ -156,14 +151,14 @@ smartypants_squote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t pr
 
 /* Converts ' to left or right single quote. */
 static size_t
-smartypants_cb__squote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__squote(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	return smartypants_squote(ob, smrt, previous_char, text, size, text, 1);
 }
 
 /* Converts (c), (r), (tm) */
 static size_t
-smartypants_cb__parens(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__parens(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	if (size >= 3) {
 		uint8_t t1 = tolower(text[1]);
@@ -191,7 +186,7 @@ smartypants_cb__parens(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_
 
 /* Converts "--" to em-dash, etc. */
 static size_t
-smartypants_cb__dash(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__dash(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	if (size >= 3 && text[1] == '-' && text[2] == '-') {
 		HOEDOWN_BUFPUTSL(ob, "&mdash;");
@@ -209,7 +204,7 @@ smartypants_cb__dash(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t
 
 /* Converts &quot; etc. */
 static size_t
-smartypants_cb__amp(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__amp(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	size_t len;
 	if (size >= 6 && memcmp(text, "&quot;", 6) == 0) {
@@ -231,7 +226,7 @@ smartypants_cb__amp(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t p
 
 /* Converts "..." to ellipsis */
 static size_t
-smartypants_cb__period(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__period(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	if (size >= 3 && text[1] == '.' && text[2] == '.') {
 		HOEDOWN_BUFPUTSL(ob, "&hellip;");
@@ -249,7 +244,7 @@ smartypants_cb__period(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_
 
 /* Converts `` to opening double quote */
 static size_t
-smartypants_cb__backtick(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__backtick(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	if (size >= 2 && text[1] == '`') {
 		if (smartypants_quotes(ob, previous_char, size >= 3 ? text[2] : 0, 'd', &smrt->in_dquote))
@@ -262,7 +257,7 @@ smartypants_cb__backtick(hoedown_buffer *ob, struct smartypants_data *smrt, uint
 
 /* Converts 1/2, 1/4, 3/4 */
 static size_t
-smartypants_cb__number(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__number(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	if (word_boundary(previous_char) && size >= 3) {
 		if (text[0] == '1' && text[1] == '/' && text[2] == '2') {
@@ -295,7 +290,7 @@ smartypants_cb__number(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_
 
 /* Converts " to left or right double quote */
 static size_t
-smartypants_cb__dquote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__dquote(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	if (!smartypants_quotes(ob, previous_char, size > 0 ? text[1] : 0, 'd', &smrt->in_dquote))
 		HOEDOWN_BUFPUTSL(ob, "&quot;");
@@ -303,22 +298,23 @@ smartypants_cb__dquote(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_
 	return 0;
 }
 
+/* Tags whose content is left alone */
+static const char *skip_tags[] = {
+  "pre", "code", "var", "samp", "kbd", "math", "script", "style"
+};
+static const size_t skip_tags_count = 8;
+
 static size_t
-smartypants_cb__ltag(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__ltag(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
-	static const char *skip_tags[] = {
-	  "pre", "code", "var", "samp", "kbd", "math", "script", "style"
-	};
-	static const size_t skip_tags_count = 8;
-
 	size_t tag, i = 0;
 
 	/* This is a comment. Copy everything verbatim until --> or EOF is seen. */
 	if (i + 4 < size && memcmp(text + i, "<!--", 4) == 0) {
 		i += 4;
-		while (i + 3 < size && memcmp(text + i, "-->",  3) != 0)
+		while (i + 3 <= size && memcmp(text + i, "-->",  3) != 0)
 			i++;
-		i += 3;
+		i = (i + 3 <= size) ? i + 2 : size - 1;
 		hoedown_buffer_put(ob, text, i + 1);
 		return i;
 	}
@@ -349,15 +345,21 @@ smartypants_cb__ltag(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t
 			i++;
 	}
 
+	/* the tag isn't closed before the end of the text */
+	if (i == size)
+		i--;
+
 	hoedown_buffer_put(ob, text, i + 1);
 	return i;
 }
 
 static size_t
-smartypants_cb__escape(hoedown_buffer *ob, struct smartypants_data *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
+smartypants_cb__escape(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
-	if (size < 2)
+	if (size < 2) {
+		hoedown_buffer_putc(ob, '\\');
 		return 0;
+	}
 
 	switch (text[1]) {
 	case '\\':
@@ -406,15 +408,20 @@ static struct {
 #endif
 
 void
-hoedown_html_smartypants(hoedown_buffer *ob, const uint8_t *text, size_t size)
+hoedown_html_smartypants_text(hoedown_buffer *ob, hoedown_html_smartypants_state *smrt, uint8_t previous_char, const uint8_t *text, size_t size)
 {
 	size_t i;
-	struct smartypants_data smrt = {0, 0};
 
 	if (!text)
 		return;
 
-	hoedown_buffer_grow(ob, size);
+	/* inside a tag that was opened in an earlier piece */
+	if (smrt->skip_tag) {
+		hoedown_buffer_put(ob, text, size);
+		return;
+	}
+
+	hoedown_buffer_grow(ob, ob->size + size);
 
 	for (i = 0; i < size; ++i) {
 		size_t org;
@@ -429,7 +436,34 @@ hoedown_html_smartypants(hoedown_buffer *ob, const uint8_t *text, size_t size)
 
 		if (i < size) {
 			i += smartypants_cb_ptrs[(int)action]
-				(ob, &smrt, i ? text[i - 1] : 0, text + i, size - i);
+				(ob, smrt, i ? text[i - 1] : previous_char, text + i, size - i);
 		}
 	}
 }
+
+void
+hoedown_html_smartypants_tag(hoedown_html_smartypants_state *smrt, const uint8_t *tag, size_t size)
+{
+	size_t i;
+
+	if (smrt->skip_tag) {
+		if (hoedown_html_is_tag(tag, size, smrt->skip_tag) == HOEDOWN_HTML_TAG_CLOSE)
+			smrt->skip_tag = NULL;
+		return;
+	}
+
+	for (i = 0; i < skip_tags_count; ++i) {
+		if (hoedown_html_is_tag(tag, size, skip_tags[i]) == HOEDOWN_HTML_TAG_OPEN) {
+			smrt->skip_tag = skip_tags[i];
+			return;
+		}
+	}
+}
+
+void
+hoedown_html_smartypants(hoedown_buffer *ob, const uint8_t *text, size_t size)
+{
+	hoedown_html_smartypants_state smrt = {0, 0, NULL};
+
+	hoedown_html_smartypants_text(ob, &smrt, 0, text, size);
+}
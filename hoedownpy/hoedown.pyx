@@ -1,7 +1,34 @@
 cimport _hoedown
 cimport wrapper
+cimport tree
+
+import re
+import sys
+import codecs
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+
+try:
+    from hashlib import blake2b
+
+    def _digest(data):
+        return blake2b(data, digest_size=16).digest()
+except ImportError:
+    from hashlib import sha1
+
+    def _digest(data):
+        return sha1(data).digest()
 
 from libc.stdint cimport uint8_t
+from libc.stdlib cimport malloc, free
+from cpython.ref cimport PyObject
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+from cpython.pythread cimport PyThread_type_lock, PyThread_allocate_lock, \
+    PyThread_free_lock, PyThread_acquire_lock, PyThread_release_lock, WAIT_LOCK
+
+cdef extern from 'pythread.h':
+    long PyThread_get_thread_ident() nogil
 
 
 # Markdown extensions
@@ -27,20 +54,39 @@ HTML_SKIP_HTML = (1 << 0)
 HTML_ESCAPE = (1 << 1)
 HTML_HARD_WRAP = (1 << 2)
 HTML_USE_XHTML = (1 << 3)
+HTML_SLUG_ANCHORS = (1 << 4)  # Slugs of the header text as anchors, not toc_N
 
 # Extra HTML render flags - these are not from Sundown
-HTML_SMARTYPANTS = (1 << 10)  # An extra flag to enable Smartypants
+HTML_SMARTYPANTS = (1 << 10)  # Apply Smartypants to the rendered text
 HTML_TOC_TREE = (1 << 11)  # Only render a table of contents tree
 
+# PlainTextRenderer flags
+TEXT_LINK_URLS = (1 << 0)  # Write the URL of a link after its text
+TEXT_IMAGE_ALT = (1 << 1)  # Write the alt text of images
+
 # Other flags
 TABLE_ALIGN_L = 1 # MKD_TABLE_ALIGN_L
 TABLE_ALIGN_R = 2 # MKD_TABLE_ALIGN_R
 TABLE_ALIGN_C = 3 # MKD_TABLE_ALIGN_CENTER
 TABLE_ALIGNMASK = 3 # MKD_TABLE_ALIGNMASK
 TABLE_HEADER = 4 # MKD_TABLE_HEADER
+LIST_ORDERED = 1 # HOEDOWN_LIST_ORDERED
+LI_BLOCK = 2 # HOEDOWN_LI_BLOCK
+
+
+class RenderLimitError(RuntimeError):
+    """Raised when a document goes past one of the limits given to
+    ``Markdown``. The ``limit`` attribute names the limit: ``'input'``,
+    ``'output'``, ``'steps'`` or ``'time'``.
+    """
+
+    def __init__(self, limit, message):
+        RuntimeError.__init__(self, message)
+        self.limit = limit
 
 
-def html(object text, unsigned int extensions=0, unsigned int render_flags=0):
+def html(object text, unsigned int extensions=0, unsigned int render_flags=0,
+         RenderCache cache=None):
     """Convert markdown text to (X)HTML.
 
     Returns a unicode string.
@@ -48,20 +94,160 @@ def html(object text, unsigned int extensions=0, unsigned int render_flags=0):
     :param text: A byte or unicode string.
     :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
     :param render_flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    :param cache: A ``RenderCache`` to look the result up in and store it in.
     """
+    if cache is not None:
+        key = cache.key(text, extensions, render_flags, html)
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+    result = _html_pool.render(text, extensions, render_flags)
+
+    # The HTML renderer applies SmartyPants while rendering text, the table
+    # of contents renderer doesn't take flags.
+    if render_flags & HTML_SMARTYPANTS and render_flags & HTML_TOC_TREE:
+        result = SmartyPants().postprocess(result)
+
+    if cache is not None:
+        cache.put(key, result)
+
+    return result
+
+
+def html_inline(object text, unsigned int extensions=0, unsigned int render_flags=0,
+                RenderCache cache=None):
+    """Convert a single line of markdown text, like a title, to (X)HTML
+    without wrapping it in a paragraph. Only inline elements are rendered.
+
+    Returns a unicode string.
+
+    :param text: A byte or unicode string.
+    :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param render_flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    :param cache: A ``RenderCache`` to look the result up in and store it in.
+    """
+    if cache is not None:
+        key = cache.key(text, extensions, render_flags, html_inline)
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+    result = _html_pool.get(extensions, render_flags).render_inline(text)
+
+    if cache is not None:
+        cache.put(key, result)
+
+    return result
+
+
+def plain_text(object text, unsigned int extensions=0, unsigned int render_flags=0):
+    """Convert markdown text to plain text with a ``PlainTextRenderer``.
 
+    Returns a unicode string.
+
+    :param text: A byte or unicode string.
+    :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param render_flags: Adjust the text with the ``TEXT_*`` constants.
+    """
+    return _text_pool.render(text, extensions, render_flags)
+
+
+def html_with_toc(object text, unsigned int extensions=0, unsigned int render_flags=0,
+                  int nesting_level=6):
+    """Convert markdown text to (X)HTML and a table of contents in one pass.
+
+    Returns a tuple of unicode strings: the HTML, whose headers have anchors,
+    and the table of contents linking to them.
+
+    :param text: A byte or unicode string.
+    :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param render_flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    :param nesting_level: The deepest header level in the table of contents.
+    """
+    markdown = Markdown(HtmlRenderer(render_flags, nesting_level=nesting_level), extensions)
+    return markdown.render_with_toc(text)
+
+
+def render_corpus(object texts, unsigned int extensions=0, unsigned int render_flags=0,
+                  workers=None, int chunksize=64, bint files=False):
+    """Convert a lot of markdown texts to (X)HTML with a pool of processes.
+
+    Returns a list of unicode strings in the same order as ``texts``.
+
+    :param texts: An iterable of byte or unicode strings, or of file paths
+        when ``files`` is true.
+    :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param render_flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    :param workers: The number of processes. Defaults to the number of CPUs.
+    :param chunksize: The number of texts sent to a process at once.
+    :param files: Read the markdown from the paths in ``texts``.
+    """
+    return list(iter_render_corpus(
+        texts, extensions, render_flags, workers, chunksize, files))
+
+
+def iter_render_corpus(object texts, unsigned int extensions=0, unsigned int render_flags=0,
+                       workers=None, int chunksize=64, bint files=False):
+    """Like ``render_corpus``, but yields the results in input order as soon
+    as they are available.
+    """
+    import itertools
+    import multiprocessing
+
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1, %d given' % chunksize)
+
+    texts = iter(texts)
+    chunks = iter(lambda: list(itertools.islice(texts, chunksize)), [])
+
+    # ``Markdown`` can't be pickled, so every process builds its own
+    pool = multiprocessing.Pool(workers, _corpus_init,
+                                (extensions, render_flags, files))
+    try:
+        for chunk in pool.imap(_corpus_render, chunks):
+            for result in chunk:
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _html_markdown(unsigned int extensions, unsigned int render_flags):
     if render_flags & HTML_TOC_TREE:
         renderer = HtmlTocRenderer(render_flags)
     else:
         renderer = HtmlRenderer(render_flags)
 
-    markdown = Markdown(renderer, extensions)
-    result = markdown.render(text)
+    return Markdown(renderer, extensions)
 
-    if render_flags & HTML_SMARTYPANTS:
-        result = SmartyPants().postprocess(result)
 
-    return result
+# Set in every ``render_corpus`` process by ``_corpus_init``
+_corpus_worker = None
+
+
+def _corpus_init(unsigned int extensions, unsigned int render_flags, bint files):
+    global _corpus_worker
+    _corpus_worker = (_html_markdown(extensions, render_flags), render_flags, files)
+
+
+def _corpus_render(list chunk):
+    markdown, render_flags, files = _corpus_worker
+
+    if files:
+        texts = []
+        for filename in chunk:
+            with open(filename, 'rb') as fd:
+                texts.append(fd.read())
+        chunk = texts
+
+    results = markdown.render_many(chunk)
+
+    if render_flags & HTML_SMARTYPANTS and render_flags & HTML_TOC_TREE:
+        smartypants = SmartyPants()
+        results = [smartypants.postprocess(r) for r in results]
+
+    return results
 
 
 cdef class SmartyPants:
@@ -117,36 +303,79 @@ cdef class BaseRenderer:
     """The ``BaseRenderer`` is boilerplate code for creating your own renderers by
     sublassing `BaseRenderer`. It takes care of setting the callbacks and flags.
 
+    Exceptions raised by the renderer's methods stop the document and are
+    raised by ``Markdown.render``. A lenient renderer prints them instead,
+    renders the span verbatim (or skips the block) and carries on.
+
     :param flags: Available as a read-only, integer type attribute named ``self.flags``.
+    :param lenient: Available as a read-only attribute named ``self.lenient``.
+    :param callback_cache: A ``CallbackCache`` the results of the renderer's
+        methods are looked up in. Available as ``self.callback_cache``.
     """
 
     cdef _hoedown.hoedown_renderer *callbacks
-    cdef wrapper.renderopt *options
+    cdef wrapper.renderopt options
+    cdef tuple methods
 
     #: Read-only render flags
     cdef readonly int flags
 
-    def __init__(self, int flags=0):
+    #: Print exceptions from callbacks instead of raising them
+    cdef readonly bint lenient
+
+    # Set when at least one callback is routed through a Python method.
+    cdef bint python_callbacks
+
+    #: The ``CallbackCache`` or ``None``
+    cdef readonly CallbackCache callback_cache
+
+    # The renderer's state (the toc counters, SmartyPants quotes, slugs and
+    # work buffers) is used by one document at a time. ``owner`` is the
+    # thread holding the lock.
+    cdef PyThread_type_lock lock
+    cdef long owner
+
+    def __cinit__(self, *args, **kwargs):
+        self.lock = PyThread_allocate_lock()
+        if self.lock is NULL:
+            raise MemoryError()
+
+    def __init__(self, int flags=0, bint lenient=False, CallbackCache callback_cache=None):
         self.flags = flags
+        self.lenient = lenient
+        self.callback_cache = callback_cache
+        self.options.lenient = lenient
         self.setup()
 
         cdef _hoedown.hoedown_html_renderer_state *state
         if self.callbacks is not NULL:
             state = <_hoedown.hoedown_html_renderer_state *> self.callbacks.opaque
-            state.opaque = <void *> self
+            state.opaque = <void *> &self.options
 
         # Set callbacks
         cdef void **source = <void **> &wrapper.callback_funcs
         cdef void **dest = <void **> self.callbacks
 
+        # The bound methods are looked up once, the callbacks in wrapper.c
+        # call them by index.
+        cdef list methods = []
         cdef unicode method_name
         for i from 0 <= i < <int> wrapper.method_count by 1:
             # In Python 3 ``wrapper.method_names[i]`` is a byte string.
-            # This means hasattr can't find any method in the renderer, so
+            # This means getattr can't find any method in the renderer, so
             # ``wrapper.method_names[i]`` is converted to a normal string first.
             method_name = wrapper.method_names[i].decode('utf-8')
-            if hasattr(self, method_name):
+            method = getattr(self, method_name, None)
+            if method is not None:
                 dest[i+1] = source[i+1]
+                self.python_callbacks = True
+                if callback_cache is not None and method_name in callback_cache.methods:
+                    method = _CachedMethod(callback_cache, method,
+                                           (type(self), flags, method_name))
+            methods.append(method)
+
+        self.methods = tuple(methods)
+        self.options.methods = <PyObject *> self.methods
 
     def setup(self):
         """A method that can be overridden by the renderer that sublasses ``BaseRenderer``.
@@ -154,9 +383,268 @@ cdef class BaseRenderer:
         """
         pass
 
+    cdef bint _acquire(self) nogil:
+        # A method that renders with its own renderer already holds the lock
+        cdef long ident = PyThread_get_thread_ident()
+        if self.owner == ident:
+            return False
+        PyThread_acquire_lock(self.lock, WAIT_LOCK)
+        self.owner = ident
+        return True
+
+    cdef void _release(self) nogil:
+        self.owner = 0
+        PyThread_release_lock(self.lock)
+
     def __dealloc__(self):
         if self.callbacks is not NULL:
             _hoedown.hoedown_html_renderer_free(self.callbacks)
+        if self.lock is not NULL:
+            PyThread_free_lock(self.lock)
+
+
+_attribute_name = re.compile(r'^[A-Za-z_:][-A-Za-z0-9_:.]*$')
+
+
+cdef bytes _utf8(object text):
+    if hasattr(text, 'encode'):
+        return text.encode('UTF-8', 'strict')
+    return bytes(text)
+
+
+cdef size_t _utf8_size(object text) except? 0:
+    if hasattr(text, 'encode'):
+        return len(text.encode('UTF-8', 'strict'))
+    return memoryview(text).nbytes
+
+
+cdef bytes _attributes(object attributes):
+    if not attributes:
+        return b''
+
+    if hasattr(attributes, 'items'):
+        attributes = attributes.items()
+
+    result = []
+    for name, value in attributes:
+        if not _attribute_name.match(name):
+            raise ValueError('invalid attribute name %r' % name)
+        value = (u'%s' % value).replace(u'&', u'&amp;').replace(u'"', u'&quot;') \
+            .replace(u'<', u'&lt;').replace(u'>', u'&gt;')
+        result.append(u' %s="%s"' % (name, value))
+
+    return _utf8(u''.join(result))
+
+
+cdef class LinkRules:
+    """Rules for the links and images of an ``HtmlRenderer``, applied by the
+    renderer in C so links don't need a Python ``link`` method.
+
+    A URL is first rewritten by the first matching prefix, then its host is
+    looked up the way browsers do, so ``https:evil.com`` and
+    ``https:/evil.com`` link to ``evil.com``. Relative URLs have no host,
+    they're never external or filtered out. With ``allowed_hosts``, URLs
+    with a scheme but no host, like ``mailto:`` ones, are filtered out too.
+    Hosts are compared case-insensitively, a host starting with a dot also
+    matches its subdomains: ``'.example.com'`` matches ``example.com`` and
+    ``www.example.com``.
+
+    :param attributes: Attributes added to every link, as a dict or a
+        sequence of ``(name, value)`` pairs.
+    :param external_attributes: Attributes added to links to hosts not in
+        ``hosts``, like ``{'rel': 'nofollow', 'target': '_blank'}``.
+    :param hosts: The site's own hosts.
+    :param allowed_hosts: When given, links and images to other hosts are
+        left out: a link is rendered as its content, an image as its alt text.
+    :param link_prefixes: ``(prefix, replacement)`` pairs, or a dict, to
+        rewrite the URLs of links with. The first matching prefix is used.
+    :param image_prefixes: Like ``link_prefixes``, for the URLs of images.
+    """
+
+    cdef _hoedown.hoedown_html_link_rules rules
+    cdef _hoedown.hoedown_html_link_prefix *prefix_array
+    cdef _hoedown.hoedown_html_host *host_array
+
+    cdef readonly bytes attributes
+    cdef readonly bytes external_attributes
+    cdef readonly tuple hosts
+    cdef readonly tuple allowed_hosts
+    cdef readonly tuple link_prefixes
+    cdef readonly tuple image_prefixes
+
+    def __cinit__(self, object attributes=None, object external_attributes=None,
+                  object hosts=(), object allowed_hosts=None,
+                  object link_prefixes=(), object image_prefixes=()):
+        if hasattr(link_prefixes, 'items'):
+            link_prefixes = link_prefixes.items()
+        if hasattr(image_prefixes, 'items'):
+            image_prefixes = image_prefixes.items()
+
+        self.attributes = _attributes(attributes)
+        self.external_attributes = _attributes(external_attributes)
+        self.hosts = tuple(_utf8(host).lower() for host in hosts)
+        self.link_prefixes = tuple((_utf8(prefix), _utf8(replacement))
+                                   for prefix, replacement in link_prefixes)
+        self.image_prefixes = tuple((_utf8(prefix), _utf8(replacement))
+                                    for prefix, replacement in image_prefixes)
+        if allowed_hosts is not None:
+            self.allowed_hosts = tuple(_utf8(host).lower() for host in allowed_hosts)
+
+        cdef size_t prefix_count = len(self.link_prefixes) + len(self.image_prefixes)
+        cdef size_t host_count = len(self.hosts) + len(self.allowed_hosts or ())
+        self.prefix_array = <_hoedown.hoedown_html_link_prefix *> malloc(
+            (prefix_count + 1) * sizeof(_hoedown.hoedown_html_link_prefix))
+        self.host_array = <_hoedown.hoedown_html_host *> malloc(
+            (host_count + 1) * sizeof(_hoedown.hoedown_html_host))
+        if self.prefix_array is NULL or self.host_array is NULL:
+            raise MemoryError()
+
+        cdef size_t i = 0
+        for prefix, replacement in self.link_prefixes + self.image_prefixes:
+            self.prefix_array[i].prefix = <const uint8_t *> <char *> prefix
+            self.prefix_array[i].prefix_size = len(prefix)
+            self.prefix_array[i].replacement = <const uint8_t *> <char *> replacement
+            self.prefix_array[i].replacement_size = len(replacement)
+            i += 1
+
+        i = 0
+        for host in self.hosts + (self.allowed_hosts or ()):
+            self.host_array[i].data = <const uint8_t *> <char *> host
+            self.host_array[i].size = len(host)
+            i += 1
+
+        self.rules.link_prefixes = self.prefix_array
+        self.rules.link_prefix_count = len(self.link_prefixes)
+        self.rules.image_prefixes = self.prefix_array + len(self.link_prefixes)
+        self.rules.image_prefix_count = len(self.image_prefixes)
+        self.rules.hosts = self.host_array
+        self.rules.host_count = len(self.hosts)
+        self.rules.allowlist = self.allowed_hosts is not None
+        self.rules.allowed_hosts = self.host_array + len(self.hosts)
+        self.rules.allowed_host_count = len(self.allowed_hosts or ())
+        self.rules.attributes = <const uint8_t *> <char *> self.attributes
+        self.rules.attributes_size = len(self.attributes)
+        self.rules.external_attributes = <const uint8_t *> <char *> self.external_attributes
+        self.rules.external_attributes_size = len(self.external_attributes)
+
+    def __dealloc__(self):
+        free(self.prefix_array)
+        free(self.host_array)
+
+
+_tag_name = re.compile(r'^[A-Za-z][-A-Za-z0-9]*$')
+
+
+cdef tuple _names(object names, object pattern, str kind):
+    result = []
+    for name in names:
+        if not pattern.match(name):
+            raise ValueError('invalid %s name %r' % (kind, name))
+        result.append(_utf8(name).lower())
+    return tuple(result)
+
+
+cdef class Sanitizer:
+    """An allowlist of the tags and attributes left in the raw HTML of a
+    Markdown document, applied by an ``HtmlRenderer`` in C. Other tags are
+    removed, and so are the contents of ``<script>`` and ``<style>``, as well
+    as comments. Tag and attribute names are compared case-insensitively.
+
+    The URLs of Markdown links and images must use one of the ``protocols``
+    too, a link to another URL is rendered as its content and an image as
+    its alt text. ``HTML_ESCAPE`` and ``HTML_SKIP_HTML`` take precedence over
+    a sanitizer for raw HTML.
+
+    :param tags: The allowed tags, by default the ones Markdown renders and
+        a few other formatting tags (see ``Sanitizer().tags``).
+    :param attributes: A dict of tag names and the attributes allowed on
+        them, the ``'*'`` key lists the attributes allowed on every tag.
+    :param protocols: The protocols allowed in ``url_attributes``. Relative
+        URLs are always allowed, URLs whose protocol is hidden with entities
+        or whitespace never are.
+    :param url_attributes: The attributes whose values are URLs.
+    :param escape: Escape the tags that aren't allowed instead of removing
+        them.
+    """
+
+    cdef _hoedown.hoedown_html_sanitizer sanitizer
+    cdef _hoedown.hoedown_html_sanitizer_tag *tag_array
+    cdef const char **name_array
+
+    cdef readonly tuple tags
+    cdef readonly dict attributes
+    cdef readonly tuple protocols
+    cdef readonly tuple url_attributes
+    cdef readonly bint escape
+
+    def __cinit__(self, object tags=(
+                      'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'dd', 'del',
+                      'details', 'div', 'dl', 'dt', 'em', 'h1', 'h2', 'h3', 'h4',
+                      'h5', 'h6', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'mark', 'ol',
+                      'p', 'pre', 'q', 's', 'span', 'strong', 'sub', 'summary',
+                      'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr',
+                      'u', 'ul'),
+                  object attributes={
+                      'a': ('href', 'title'),
+                      'abbr': ('title',),
+                      'img': ('src', 'alt', 'title', 'width', 'height'),
+                      'td': ('align',),
+                      'th': ('align',)},
+                  object protocols=('http', 'https', 'mailto'),
+                  object url_attributes=(
+                      'href', 'src', 'cite', 'action', 'formaction', 'poster',
+                      'background', 'longdesc'),
+                  bint escape=False):
+        self.tags = _names(tags, _tag_name, 'tag')
+        self.attributes = {}
+        for tag, names in attributes.items():
+            if tag != '*':
+                tag = _names((tag,), _tag_name, 'tag')[0]
+            self.attributes[tag] = self.attributes.get(tag, ()) + \
+                _names(names, _attribute_name, 'attribute')
+        self.protocols = _names(protocols, _tag_name, 'protocol')
+        self.url_attributes = _names(url_attributes, _attribute_name, 'attribute')
+        self.escape = escape
+
+        cdef tuple common = self.attributes.get('*', ())
+        cdef size_t name_count = len(common) + len(self.url_attributes) + len(self.protocols)
+        for tag in self.tags:
+            name_count += len(self.attributes.get(tag, ()))
+
+        self.tag_array = <_hoedown.hoedown_html_sanitizer_tag *> malloc(
+            (len(self.tags) + 1) * sizeof(_hoedown.hoedown_html_sanitizer_tag))
+        self.name_array = <const char **> malloc((name_count + 1) * sizeof(const char *))
+        if self.tag_array is NULL or self.name_array is NULL:
+            raise MemoryError()
+
+        cdef size_t i = 0, t = 0
+        self.sanitizer.attributes = self.name_array
+        self.sanitizer.attribute_count = len(common)
+        self.sanitizer.url_attributes = self.name_array + len(common)
+        self.sanitizer.url_attribute_count = len(self.url_attributes)
+        self.sanitizer.protocols = self.sanitizer.url_attributes + len(self.url_attributes)
+        self.sanitizer.protocol_count = len(self.protocols)
+        for name in common + self.url_attributes + self.protocols:
+            self.name_array[i] = <char *> name
+            i += 1
+
+        for tag in self.tags:
+            names = self.attributes.get(tag, ())
+            self.tag_array[t].name = <char *> tag
+            self.tag_array[t].attributes = self.name_array + i
+            self.tag_array[t].attribute_count = len(names)
+            for name in names:
+                self.name_array[i] = <char *> name
+                i += 1
+            t += 1
+
+        self.sanitizer.tags = self.tag_array
+        self.sanitizer.tag_count = len(self.tags)
+        self.sanitizer.escape = escape
+
+    def __dealloc__(self):
+        free(self.tag_array)
+        free(self.name_array)
 
 
 cdef class HtmlRenderer(BaseRenderer):
@@ -166,9 +654,45 @@ cdef class HtmlRenderer(BaseRenderer):
     you do make sure to call parent class' ``setup`` method first.
 
     :param flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    :param lenient: See ``BaseRenderer``.
+    :param nesting_level: Headers up to this level get ``toc_N`` anchors,
+        and are listed by ``Markdown.render_with_toc``. With
+        ``HTML_SLUG_ANCHORS`` the anchors are slugs of the header text, like
+        GitHub's: lowercased, without punctuation, with spaces as dashes and
+        with ``-1``, ``-2``... added to the ones already used.
+    :param callback_cache: See ``BaseRenderer``.
+    :param link_rules: ``LinkRules`` applied to the links and images. They
+        don't apply to a ``link``, ``image`` or ``autolink`` method written
+        in Python.
+    :param sanitizer: A ``Sanitizer`` for the raw HTML and the links in the
+        document. It doesn't apply to methods written in Python.
     """
+
+    #: The deepest header level with an anchor
+    cdef readonly int nesting_level
+
+    #: The ``LinkRules`` or ``None``
+    cdef readonly LinkRules link_rules
+
+    #: The ``Sanitizer`` or ``None``
+    cdef readonly Sanitizer sanitizer
+
+    def __init__(self, int flags=0, bint lenient=False, int nesting_level=0,
+                 LinkRules link_rules=None, CallbackCache callback_cache=None,
+                 Sanitizer sanitizer=None):
+        self.nesting_level = nesting_level
+        BaseRenderer.__init__(self, flags, lenient, callback_cache)
+
+        if link_rules is not None:
+            self.link_rules = link_rules
+            _hoedown.hoedown_html_renderer_set_link_rules(self.callbacks, &link_rules.rules)
+
+        if sanitizer is not None:
+            self.sanitizer = sanitizer
+            _hoedown.hoedown_html_renderer_set_sanitizer(self.callbacks, &sanitizer.sanitizer)
+
     def setup(self):
-        self.callbacks = _hoedown.hoedown_html_renderer_new(self.flags, 0)
+        self.callbacks = _hoedown.hoedown_html_renderer_new(self.flags, self.nesting_level)
 
 
 cdef class HtmlTocRenderer(BaseRenderer):
@@ -178,68 +702,1450 @@ cdef class HtmlTocRenderer(BaseRenderer):
     If you do make sure to call parent class' ``setup`` method first.
 
     :param flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    :param lenient: See ``BaseRenderer``.
+    :param nesting_level: The deepest header level that's listed.
+    :param callback_cache: See ``BaseRenderer``.
+
+    Only ``HTML_SLUG_ANCHORS`` changes the table of contents, its links then
+    point to the slug anchors of an ``HtmlRenderer``.
     """
+
+    #: The deepest header level that's listed
+    cdef readonly int nesting_level
+
+    def __init__(self, int flags=0, bint lenient=False, int nesting_level=6,
+                 CallbackCache callback_cache=None):
+        self.nesting_level = nesting_level
+        BaseRenderer.__init__(self, flags, lenient, callback_cache)
+
     def setup(self):
-        self.callbacks = _hoedown.hoedown_html_toc_renderer_new(0)
+        self.callbacks = _hoedown.hoedown_html_toc_renderer_new(self.nesting_level)
+
+        # The only flag of the table of contents renderer, so its links
+        # point to the anchors of an HtmlRenderer with the same flags
+        (<_hoedown.hoedown_html_renderer_state *> self.callbacks.opaque).flags = \
+            <_hoedown.hoedown_html_flags> <int> (self.flags & HTML_SLUG_ANCHORS)
+
+
+cdef class PlainTextRenderer(BaseRenderer):
+    """Renders plain text, to index documents for search: the text of every
+    block, separated by empty lines, without markup and without escaping.
+    List items and table rows are on lines of their own, table cells are
+    separated by tabs. Raw HTML is left out, except for the text in HTML
+    blocks.
+
+    :param flags: Include more of the document with the ``TEXT_*`` constants.
+    :param lenient: See ``BaseRenderer``.
+    :param callback_cache: See ``BaseRenderer``.
+    """
+
+    def setup(self):
+        self.callbacks = _hoedown.hoedown_text_renderer_new(self.flags)
+
+
+cdef class _OutputSink:
+    """Decodes the output flushed by ``Markdown.render_to`` and passes it on."""
+
+    cdef object write
+    cdef object postprocess
+    cdef object decoder
+    cdef object error
+
+    def __cinit__(self, object write, object postprocess):
+        self.write = write
+        self.postprocess = postprocess
+        # A flush can end in the middle of a UTF-8 sequence
+        self.decoder = codecs.getincrementaldecoder('UTF-8')('strict')
+
+    cdef int send(self, bytes data, bint final) except -1:
+        text = self.decoder.decode(data, final)
+        if self.postprocess is not None:
+            text = self.postprocess(text)
+        if text:
+            self.write(text)
+        return 0
+
+
+cdef int _flush_output(const uint8_t *data, size_t size, void *opaque) with gil:
+    cdef _OutputSink out = <_OutputSink> opaque
+
+    # Returning 0 stops the parser, the error is raised once it's done
+    try:
+        out.send((<char *> data)[:size], False)
+    except BaseException as e:
+        out.error = e
+        return 0
+    return 1
+
+
+cdef struct _render_stats:
+    _hoedown.hoedown_document_stats document
+    _hoedown.hoedown_buffer_stats buffers
+    size_t renders
+    double time
+
+
+cdef inline void _render_text(_hoedown.hoedown_document *document, _hoedown.hoedown_buffer *ob,
+                              const uint8_t *data, size_t size, bint inline) nogil:
+    if inline:
+        _hoedown.hoedown_document_render_inline(document, ob, data, size)
+    else:
+        _hoedown.hoedown_document_render(document, ob, data, size)
+
+
+cdef void _render_document(_hoedown.hoedown_document *document, _hoedown.hoedown_buffer *ob,
+                           const uint8_t *data, size_t size, _render_stats *stats,
+                           bint inline=False) nogil:
+    cdef double start
+
+    if stats is NULL:
+        _render_text(document, ob, data, size, inline)
+        return
+
+    _hoedown.hoedown_document_set_stats(document, &stats.document)
+    _hoedown.hoedown_buffer_set_stats(&stats.buffers)
+    start = wrapper.perf_clock()
+
+    _render_text(document, ob, data, size, inline)
+
+    stats.time += wrapper.perf_clock() - start
+    stats.renders += 1
+    _hoedown.hoedown_buffer_set_stats(NULL)
+    _hoedown.hoedown_document_set_stats(document, NULL)
+
+
+cdef class RenderStats:
+    """Statistics about the documents rendered with it, pass it to
+    ``Markdown.render``. The numbers add up over every render, so one
+    instance can collect them for a sample of documents. Rendering without
+    one costs nothing.
+
+    Documents found in a ``RenderCache`` aren't counted.
+    """
+
+    cdef _render_stats data
+
+    #: The number of bytes of Markdown rendered and of HTML produced
+    cdef readonly size_t input_bytes
+    cdef readonly size_t output_bytes
+
+    property renders:
+        """The number of documents rendered."""
+        def __get__(self):
+            return self.data.renders
+
+    property time:
+        """Seconds spent rendering, not counting the renderer's
+        ``preprocess`` and ``postprocess``."""
+        def __get__(self):
+            return self.data.time
+
+    property callback_time:
+        """Seconds spent in the Python methods of the renderer."""
+        def __get__(self):
+            return self.data.document.callback_time
+
+    property parse_time:
+        """Seconds spent in hoedown, including the callbacks of C
+        renderers."""
+        def __get__(self):
+            return self.data.time - self.data.document.callback_time
+
+    property nodes:
+        """A dictionary with the number of calls of every renderer callback,
+        by method name, leaving out the ones that weren't called."""
+        def __get__(self):
+            cdef int i
+            result = {}
+            for i in range(_hoedown.HOEDOWN_STATS_NODES):
+                if self.data.document.nodes[i]:
+                    result[wrapper.method_names[i].decode('ascii')] = \
+                        self.data.document.nodes[i]
+            return result
+
+    property max_depth:
+        """The deepest nesting of work buffers."""
+        def __get__(self):
+            return self.data.document.max_depth
+
+    property work_buffers:
+        """The number of work buffers allocated."""
+        def __get__(self):
+            return self.data.document.work_bufs
+
+    property reallocs:
+        """The number of times a buffer was grown."""
+        def __get__(self):
+            return self.data.buffers.reallocs
+
+    property bytes_allocated:
+        """The number of bytes buffers were grown by."""
+        def __get__(self):
+            return self.data.buffers.bytes
+
+    def as_dict(self):
+        """Returns the statistics as a dictionary."""
+        return {
+            'renders': self.renders,
+            'time': self.time,
+            'parse_time': self.parse_time,
+            'callback_time': self.callback_time,
+            'nodes': self.nodes,
+            'max_depth': self.max_depth,
+            'work_buffers': self.work_buffers,
+            'reallocs': self.reallocs,
+            'bytes_allocated': self.bytes_allocated,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+        }
+
+    def __repr__(self):
+        return '<RenderStats renders=%d time=%.6f parse_time=%.6f callback_time=%.6f>' % (
+            self.renders, self.time, self.parse_time, self.callback_time)
 
 
 cdef class Markdown:
     """The Markdown parser.
 
+    When the renderer has no Python callbacks (a plain ``HtmlRenderer`` or
+    ``HtmlTocRenderer``) the parse runs without holding the GIL. An instance
+    renders one document at a time, and so does a renderer shared between
+    instances, so give each thread its own ``Markdown`` and renderer to
+    render on several cores at once.
+
     :param renderer: An instance of ``BaseRenderer``.
     :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param cache: A ``RenderCache`` used by ``render``, ``render_many`` and
+        ``iter_render``. Also available as the ``cache`` attribute.
+
+    The other parameters bound the work done for a single document, so a
+    hostile one can't hold a worker for long. Except for ``max_nesting``,
+    rendering stops with a ``RenderLimitError`` once a limit is reached.
+    A limit of 0 means no limit.
+
+    :param max_nesting: The deepest nesting of blocks and spans. Deeper
+        elements are left out of the output.
+    :param max_input_bytes: The size of the largest text that's rendered.
+    :param max_output_bytes: The size of the largest output, checked as the
+        top-level blocks are added to it.
+    :param max_steps: The number of passes of the block and inline parsing
+        loops, which is about the number of blocks and spans in the text.
+    :param timeout: The number of seconds a render can take.
     """
 
     cdef _hoedown.hoedown_document *document
     cdef BaseRenderer renderer
+    cdef PyThread_type_lock lock
+    cdef unsigned int extensions
+
+    # Used by parse, created on first use
+    cdef _hoedown.hoedown_renderer *tree_renderer
+    cdef _hoedown.hoedown_document *tree_document
+
+    #: The ``RenderCache`` or ``None``
+    cdef public RenderCache cache
+
+    # Tells the documents of renderers apart in the cache
+    cdef object cache_kind
 
-    def __cinit__(self, object renderer, _hoedown.hoedown_extensions extensions=<_hoedown.hoedown_extensions>0):
+    #: The limits, 0 when there is none
+    cdef readonly size_t max_nesting
+    cdef readonly size_t max_input_bytes
+    cdef readonly size_t max_output_bytes
+    cdef readonly size_t max_steps
+    cdef readonly double timeout
+
+    cdef _hoedown.hoedown_document_limits limits
+    cdef bint has_limits
+
+    def __cinit__(self, object renderer, _hoedown.hoedown_extensions extensions=<_hoedown.hoedown_extensions>0,
+                  RenderCache cache=None, int max_nesting=16, size_t max_input_bytes=0,
+                  size_t max_output_bytes=0, size_t max_steps=0, double timeout=0):
         if not isinstance(renderer, BaseRenderer):
             raise ValueError('expected instance of BaseRenderer, %s found' % \
                 renderer.__class__.__name__)
+        if max_nesting < 1:
+            raise ValueError('max_nesting must be at least 1, %d given' % max_nesting)
+        if timeout < 0:
+            raise ValueError('timeout must not be negative, %r given' % timeout)
 
+        self.lock = PyThread_allocate_lock()
+        if self.lock is NULL:
+            raise MemoryError()
+
+        self.extensions = extensions
+        self.cache = cache
         self.renderer = renderer
-        self.document = _hoedown.hoedown_document_new(self.renderer.callbacks, extensions, 16)
+        # The text, extensions and render flags are part of the key as well
+        self.cache_kind = (type(renderer), getattr(renderer, 'nesting_level', None),
+                           max_nesting)
+        if isinstance(renderer, HtmlRenderer):
+            self.cache_kind += (renderer.link_rules, renderer.sanitizer)
+        self.max_nesting = max_nesting
+        self.max_input_bytes = max_input_bytes
+        self.max_output_bytes = max_output_bytes
+        self.max_steps = max_steps
+        self.timeout = timeout
+
+        self.limits.max_steps = max_steps
+        self.limits.max_output = max_output_bytes
+        if timeout > 0:
+            self.limits.clock = wrapper.perf_clock
+        self.has_limits = max_steps > 0 or max_output_bytes > 0 or timeout > 0
 
-    def render(self, object text):
+        self.document = _hoedown.hoedown_document_new(self.renderer.callbacks, extensions, max_nesting)
+
+    def render(self, object text, RenderStats stats=None):
         """Render the Markdon text.
 
         Returns a unicode string.
 
-        :param text: A byte or unicode string.
+        :param text: A unicode string or an object that supports the buffer
+            protocol (``bytes``, ``bytearray``, ``memoryview``, ``mmap``...),
+            which is assumed to be UTF-8 and is parsed without being copied.
+        :param stats: A ``RenderStats`` to add the statistics of this render to.
         """
-        if hasattr(self.renderer, 'preprocess'):
-            text = self.renderer.preprocess(text)
+        cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
 
-        # Convert string
-        cdef bytes py_string
-        if hasattr(text, 'encode'):
-            py_string = text.encode('UTF-8', 'strict')
-        else:
-            py_string = text  # If it's a byte string it's assumed it's UTF-8
-        cdef char *c_string = py_string
+        try:
+            return self._render(text, ob,
+                getattr(self.renderer, 'preprocess', None),
+                getattr(self.renderer, 'postprocess', None), stats)
+        finally:
+            _hoedown.hoedown_buffer_free(ob)
 
-        # Buffers
-        cdef _hoedown.hoedown_buffer *ib = _hoedown.hoedown_buffer_new(1024)
-        _hoedown.hoedown_buffer_puts(ib, c_string)
+    def render_many(self, object texts):
+        """Render several Markdown texts reusing one output buffer.
 
+        Returns a list of unicode strings in the same order as ``texts``.
+
+        :param texts: An iterable of texts accepted by ``render``.
+        """
+        return list(self.iter_render(texts))
+
+    def iter_render(self, object texts):
+        """Like ``render_many``, but yields every result as soon as it's
+        rendered instead of collecting them in a list.
+
+        :param texts: An iterable of texts accepted by ``render``.
+        """
         cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
-        _hoedown.hoedown_buffer_grow(ob, <size_t> (ib.size * 1.4))
 
-        # Parse! And make a unicode string
-        _hoedown.hoedown_document_render(self.document, ob, ib.data, ib.size)
-        text = (<char *> ob.data)[:ob.size].decode('UTF-8', 'strict')
+        preprocess = getattr(self.renderer, 'preprocess', None)
+        postprocess = getattr(self.renderer, 'postprocess', None)
+
+        try:
+            for text in texts:
+                yield self._render(text, ob, preprocess, postprocess)
+        finally:
+            _hoedown.hoedown_buffer_free(ob)
+
+    def render_inline(self, object text, RenderStats stats=None):
+        """Render the Markdown text as a single span, like a title or a chat
+        message: only the inline elements are parsed, and the output isn't
+        wrapped in a paragraph.
+
+        Returns a unicode string.
+
+        :param text: A text accepted by ``render``.
+        :param stats: A ``RenderStats`` to add the statistics of this render to.
+        """
+        cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
 
-        if hasattr(self.renderer, 'postprocess'):
-            text = self.renderer.postprocess(text)
+        try:
+            return self._render(text, ob,
+                getattr(self.renderer, 'preprocess', None),
+                getattr(self.renderer, 'postprocess', None), stats, True)
+        finally:
+            _hoedown.hoedown_buffer_free(ob)
+
+    def render_inline_many(self, object texts):
+        """Render several Markdown texts like ``render_inline``, reusing one
+        output buffer.
+
+        Returns a list of unicode strings in the same order as ``texts``.
+
+        :param texts: An iterable of texts accepted by ``render``.
+        """
+        cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
+
+        preprocess = getattr(self.renderer, 'preprocess', None)
+        postprocess = getattr(self.renderer, 'postprocess', None)
+
+        try:
+            return [self._render(text, ob, preprocess, postprocess, None, True)
+                    for text in texts]
+        finally:
+            _hoedown.hoedown_buffer_free(ob)
+
+    def render_to(self, object sink, object text, size_t chunk_size=65536):
+        """Render the Markdown text and pass the HTML to ``sink`` in pieces
+        instead of returning it, so only about ``chunk_size`` bytes of output
+        are held in memory at once. Pieces are split between top-level blocks.
+
+        The renderer's ``postprocess`` method, if any, is applied to every
+        piece separately.
+
+        :param sink: A file-like object with a ``write`` method or a callable.
+            Either receives unicode strings.
+        :param text: A text accepted by ``render``.
+        :param chunk_size: The number of bytes collected before they're passed
+            to ``sink``.
+        """
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1, %d given' % chunk_size)
+
+        cdef _OutputSink out = _OutputSink(
+            getattr(sink, 'write', sink),
+            getattr(self.renderer, 'postprocess', None))
+        cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
+
+        try:
+            _hoedown.hoedown_buffer_grow(ob, chunk_size)
+            self._parse(text, ob, getattr(self.renderer, 'preprocess', None),
+                        out, chunk_size)
+
+            if out.error is not None:
+                raise out.error
+            out.send((<char *> ob.data)[:ob.size], True)
+        finally:
+            _hoedown.hoedown_buffer_free(ob)
+
+    def render_with_toc(self, object text):
+        """Render the Markdown text and its table of contents in one pass.
+        The renderer must be an ``HtmlRenderer``, its ``nesting_level`` sets
+        the deepest header level in the table of contents.
+
+        Returns a tuple of unicode strings: the HTML and the table of
+        contents, whose links point to the anchors of the headers in the HTML.
+
+        :param text: A text accepted by ``render``.
+        """
+        if not isinstance(self.renderer, HtmlRenderer):
+            raise ValueError('expected instance of HtmlRenderer, %s found' % \
+                self.renderer.__class__.__name__)
+
+        cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
+        cdef _hoedown.hoedown_buffer *toc = _hoedown.hoedown_buffer_new(128)
 
-        # Return a string and release buffers
         try:
-            return text
+            self._parse(text, ob, getattr(self.renderer, 'preprocess', None),
+                        None, 0, toc)
+            result = (<char *> ob.data)[:ob.size].decode('UTF-8', 'strict')
+            toc_result = (<char *> toc.data)[:toc.size].decode('UTF-8', 'strict')
         finally:
+            _hoedown.hoedown_buffer_free(toc)
             _hoedown.hoedown_buffer_free(ob)
-            _hoedown.hoedown_buffer_free(ib)
+
+        postprocess = getattr(self.renderer, 'postprocess', None)
+        if postprocess is not None:
+            result = postprocess(result)
+            toc_result = postprocess(toc_result)
+
+        return result, toc_result
+
+    cdef object _render(self, object text, _hoedown.hoedown_buffer *ob,
+                        object preprocess, object postprocess, RenderStats stats=None,
+                        bint inline=False):
+        if self.cache is not None:
+            # A cached document is returned without parsing, so the input
+            # limit is checked here as well
+            if self.max_input_bytes:
+                self._check_input(_utf8_size(text))
+
+            key = self.cache.key(text, self.extensions, self.renderer.flags,
+                                 (self.cache_kind, 'inline') if inline else self.cache_kind)
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+
+        self._parse(text, ob, preprocess, None, 0, NULL, stats, inline)
+        result = (<char *> ob.data)[:ob.size].decode('UTF-8', 'strict')
+
+        if postprocess is not None:
+            result = postprocess(result)
+
+        if self.cache is not None:
+            self.cache.put(key, result)
+
+        return result
+
+    cdef int _parse(self, object text, _hoedown.hoedown_buffer *ob, object preprocess,
+                    _OutputSink out, size_t chunk_size,
+                    _hoedown.hoedown_buffer *toc=NULL, RenderStats stats=None,
+                    bint inline=False) except -1:
+        if preprocess is not None:
+            text = preprocess(text)
+
+        # Unicode strings are encoded, everything else is assumed to be UTF-8
+        if hasattr(text, 'encode'):
+            text = text.encode('UTF-8', 'strict')
+
+        cdef Py_buffer view
+        PyObject_GetBuffer(text, &view, PyBUF_SIMPLE)
+
+        cdef _hoedown.hoedown_flush_cb flush = NULL
+        if out is not None:
+            flush = _flush_output
+
+        cdef _hoedown.hoedown_html_renderer_state *state = NULL
+        if toc is not NULL:
+            state = <_hoedown.hoedown_html_renderer_state *> self.renderer.callbacks.opaque
+
+        cdef _render_stats *stats_data = NULL
+        if stats is not None:
+            stats_data = &stats.data
+
+        cdef _hoedown.hoedown_limit limit = _hoedown.HOEDOWN_LIMIT_NONE
+        cdef bint locked
+
+        try:
+            self._check_input(view.len)
+
+            # The output buffer is reused between calls, so empty it first
+            ob.size = 0
+            if out is None:
+                _hoedown.hoedown_buffer_grow(ob, <size_t> (view.len * 1.4))
+
+            # Parse! The document's work buffers and the renderer's state
+            # can't be shared between threads, hence the locks. The C
+            # renderers never touch Python objects, so they run without the GIL.
+            if self.renderer.python_callbacks:
+                with nogil:
+                    PyThread_acquire_lock(self.lock, WAIT_LOCK)
+                    locked = self.renderer._acquire()
+                try:
+                    if state is not NULL:
+                        state.toc = toc
+                    _hoedown.hoedown_document_set_flush(self.document, flush, <void *> out, chunk_size)
+                    self._start_limits(self.document)
+                    _render_document(self.document, ob,
+                        <uint8_t *> view.buf, view.len, stats_data, inline)
+                finally:
+                    limit = self._finish_limits(self.document)
+                    _hoedown.hoedown_document_set_flush(self.document, NULL, NULL, 0)
+                    if state is not NULL:
+                        state.toc = NULL
+                    if locked:
+                        self.renderer._release()
+                    PyThread_release_lock(self.lock)
+
+                # Raise the exception that stopped a callback, if any
+                wrapper.check_callback_error()
+            else:
+                with nogil:
+                    PyThread_acquire_lock(self.lock, WAIT_LOCK)
+                    locked = self.renderer._acquire()
+                    if state is not NULL:
+                        state.toc = toc
+                    _hoedown.hoedown_document_set_flush(self.document, flush, <void *> out, chunk_size)
+                    self._start_limits(self.document)
+                    _render_document(self.document, ob,
+                        <uint8_t *> view.buf, view.len, stats_data, inline)
+                    limit = self._finish_limits(self.document)
+                    _hoedown.hoedown_document_set_flush(self.document, NULL, NULL, 0)
+                    if state is not NULL:
+                        state.toc = NULL
+                    if locked:
+                        self.renderer._release()
+                    PyThread_release_lock(self.lock)
+        finally:
+            PyBuffer_Release(&view)
+
+        if stats is not None:
+            stats.input_bytes += view.len
+            stats.output_bytes += ob.size
+
+        _check_limit(limit)
+        return 0
+
+    cdef int _check_input(self, size_t size) except -1:
+        if self.max_input_bytes and size > self.max_input_bytes:
+            raise RenderLimitError('input', 'the text is larger than %d bytes' % \
+                self.max_input_bytes)
+        return 0
+
+    cdef void _start_limits(self, _hoedown.hoedown_document *document) nogil:
+        if self.has_limits:
+            if self.timeout > 0:
+                self.limits.deadline = wrapper.perf_clock() + self.timeout
+            _hoedown.hoedown_document_set_limits(document, &self.limits)
+
+    cdef _hoedown.hoedown_limit _finish_limits(self, _hoedown.hoedown_document *document) nogil:
+        _hoedown.hoedown_document_set_limits(document, NULL)
+        return _hoedown.hoedown_document_get_limit(document)
+
+    def parse(self, object text):
+        """Parse the Markdown text into a ``Tree`` of nodes instead of
+        rendering it. The tree is built in C without calling the renderer,
+        and without holding the GIL.
+
+        :param text: A text accepted by ``render``.
+        """
+        cdef Tree result = Tree.__new__(Tree)
+        cdef Py_buffer view
+
+        # Unicode strings are encoded, everything else is assumed to be UTF-8
+        if hasattr(text, 'encode'):
+            text = text.encode('UTF-8', 'strict')
+
+        cdef _hoedown.hoedown_limit limit
+
+        PyObject_GetBuffer(text, &view, PyBUF_SIMPLE)
+        try:
+            self._check_input(view.len)
+
+            with nogil:
+                PyThread_acquire_lock(self.lock, WAIT_LOCK)
+                if self.tree_document is NULL:
+                    self.tree_renderer = tree.hoedown_tree_renderer_new()
+                    self.tree_document = _hoedown.hoedown_document_new(
+                        self.tree_renderer, <_hoedown.hoedown_extensions> self.extensions,
+                        self.max_nesting)
+                self._start_limits(self.tree_document)
+                result.data = tree.hoedown_tree_parse(self.tree_document, self.tree_renderer,
+                    <uint8_t *> view.buf, view.len)
+                limit = self._finish_limits(self.tree_document)
+                PyThread_release_lock(self.lock)
+        finally:
+            PyBuffer_Release(&view)
+
+        _check_limit(limit)
+        return result
 
     def __dealloc__(self):
         if self.document is not NULL:
             _hoedown.hoedown_document_free(self.document)
+        if self.tree_document is not NULL:
+            _hoedown.hoedown_document_free(self.tree_document)
+            tree.hoedown_tree_renderer_free(self.tree_renderer)
+        if self.lock is not NULL:
+            PyThread_free_lock(self.lock)
+
+
+cdef int _check_limit(_hoedown.hoedown_limit limit) except -1:
+    if limit == _hoedown.HOEDOWN_LIMIT_STEPS:
+        raise RenderLimitError('steps', 'the text took too many parsing steps')
+    elif limit == _hoedown.HOEDOWN_LIMIT_OUTPUT:
+        raise RenderLimitError('output', 'the output is too large')
+    elif limit == _hoedown.HOEDOWN_LIMIT_TIME:
+        raise RenderLimitError('time', 'the render took too long')
+    return 0
+
+
+cdef class Tree:
+    """The nodes of a Markdown document, returned by ``Markdown.parse``.
+
+    Nodes are numbered in document order, the first one is the ``document``
+    node that holds the top-level blocks. Iterating over a tree yields all
+    of its nodes, ``tree[i]`` returns node ``i``.
+    """
+
+    cdef tree.hoedown_tree *data
+    cdef bytes _source
+
+    def __len__(self):
+        return self.data.count
+
+    def __getitem__(self, Py_ssize_t index):
+        if index < 0:
+            index += self.data.count
+        if index < 0 or index >= <Py_ssize_t> self.data.count:
+            raise IndexError('node index out of range')
+        return _node(self, <int> index)
+
+    def __iter__(self):
+        cdef size_t i
+        for i in range(self.data.count):
+            yield _node(self, <int> i)
+
+    property root:
+        """The ``document`` node."""
+        def __get__(self):
+            return _node(self, 0)
+
+    property source:
+        """The UTF-8 text the node spans refer to: the parsed text with
+        reference and footnote definitions taken out, tabs expanded and
+        newlines normalized.
+        """
+        def __get__(self):
+            if self._source is None:
+                self._source = (<char *> self.data.source.data)[:self.data.source.size]
+            return self._source
+
+    cdef object _string(self, tree.hoedown_tree_string s):
+        if s.offset == tree.HOEDOWN_NO_STRING:
+            return None
+        return (<char *> self.data.strings.data)[s.offset:s.offset + s.size].decode('UTF-8', 'strict')
+
+    def __dealloc__(self):
+        if self.data is not NULL:
+            tree.hoedown_tree_free(self.data)
+
+
+cdef Node _node(Tree owner, int index):
+    cdef Node node = Node.__new__(Node)
+    node.owner = owner
+    node.index = index
+    return node
+
+
+cdef class Node:
+    """A node of a ``Tree``. Its ``type`` is the name of the renderer method
+    that would render it (``'paragraph'``, ``'link'``, ``'normal_text'``...)
+    or ``'document'``.
+
+    Nodes whose text the parser copies (in lists, block quotes and
+    footnotes) span their closest ancestor that can be found in the source,
+    inline nodes with children span their content.
+    """
+
+    cdef Tree owner
+
+    #: The index of the node in its tree
+    cdef readonly int index
+
+    cdef tree.hoedown_node *_get(self):
+        return &self.owner.data.nodes[self.index]
+
+    property type:
+        def __get__(self):
+            return tree.node_names[self._get().type].decode('ascii')
+
+    property parent:
+        """The parent ``Node``, ``None`` for the document node."""
+        def __get__(self):
+            cdef int parent = self._get().parent
+            return _node(self.owner, parent) if parent >= 0 else None
+
+    property children:
+        """A list of child nodes."""
+        def __get__(self):
+            cdef int child = self._get().first_child
+            children = []
+            while child >= 0:
+                children.append(_node(self.owner, child))
+                child = self.owner.data.nodes[child].next_sibling
+            return children
+
+    property start:
+        """The byte offset where the node starts in the tree's ``source``."""
+        def __get__(self):
+            return self._get().start
+
+    property end:
+        """The byte offset where the node ends in the tree's ``source``."""
+        def __get__(self):
+            return self._get().end
+
+    property level:
+        """The level of a header, the number of a footnote, or 1 for display math."""
+        def __get__(self):
+            return self._get().level
+
+    property flags:
+        """The ``LIST_ORDERED`` and ``LI_BLOCK`` flags of a list or list item,
+        the ``TABLE_*`` flags of a table cell, or the type of an autolink
+        (1 for a URL, 2 for an email address)."""
+        def __get__(self):
+            return self._get().flags
+
+    property text:
+        """The text of text, code, HTML, math and entity nodes, the URL of an
+        autolink or the alt text of an image; ``None`` for other nodes."""
+        def __get__(self):
+            return self.owner._string(self._get().text)
+
+    property link:
+        """The URL of a link or an image."""
+        def __get__(self):
+            return self.owner._string(self._get().link)
+
+    property title:
+        """The title of a link or an image."""
+        def __get__(self):
+            return self.owner._string(self._get().title)
+
+    property lang:
+        """The language of a code block."""
+        def __get__(self):
+            return self.owner._string(self._get().lang)
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.owner is (<Node> other).owner and self.index == (<Node> other).index
+
+    def __ne__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return not (self.owner is (<Node> other).owner and self.index == (<Node> other).index)
+
+    def __hash__(self):
+        return hash((id(self.owner), self.index))
+
+    def __repr__(self):
+        return '<Node %d %s>' % (self.index, self.type)
+
+
+#: A change to the blocks of an ``IncrementalDocument``: ``removed`` blocks
+#: starting at ``index`` were replaced by the HTML strings in ``inserted``.
+BlockDiff = namedtuple('BlockDiff', ('index', 'removed', 'inserted'))
+
+
+cdef class IncrementalDocument:
+    """A Markdown document that's edited over time, like the contents of an
+    editor with a live preview. After an edit only the top-level blocks
+    around the changed text are parsed again.
+
+    Everything is parsed again when reference or footnote definitions
+    change, when the document has footnotes and when the renderer is a
+    ``HtmlTocRenderer``, or a ``HtmlRenderer`` that gives its headers
+    anchors or renders with ``HTML_SMARTYPANTS``.
+
+    :param renderer: An instance of ``BaseRenderer``.
+    :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param text: The initial unicode text.
+    """
+
+    cdef Markdown markdown
+    cdef bint always_full
+
+    #: The current text
+    cdef readonly object text
+
+    # The text left after the first pass, the definitions taken out of it,
+    # and the end offset in ``source`` and the HTML of every block.
+    cdef bytes source
+    cdef bytes defs
+    cdef list ends
+    cdef list blocks
+    cdef object header
+    cdef object footer
+
+    def __init__(self, object renderer, unsigned int extensions=0, object text=u''):
+        self.markdown = Markdown(renderer, extensions)
+        # Headers are numbered, and SmartyPants pairs quotes, through the
+        # whole document
+        self.always_full = isinstance(renderer, HtmlTocRenderer) or \
+            (isinstance(renderer, HtmlRenderer) and (renderer.nesting_level > 0 or
+                                                     renderer.flags & HTML_SMARTYPANTS))
+        self.text = u''
+        self.update(text)
+
+    property html:
+        """The HTML of the current text."""
+        def __get__(self):
+            html = self.header + u''.join(self.blocks) + self.footer
+            postprocess = getattr(self.markdown.renderer, 'postprocess', None)
+            if postprocess is not None:
+                html = postprocess(html)
+            return html
+
+    def edit(self, Py_ssize_t offset, Py_ssize_t delete=0, object insert=u''):
+        """Replace ``delete`` characters at ``offset`` with ``insert``.
+
+        Returns the same as ``update``.
+        """
+        if offset < 0 or delete < 0 or offset + delete > len(self.text):
+            raise IndexError('edit out of range: offset %d, delete %d, length %d' % \
+                (offset, delete, len(self.text)))
+
+        return self.update(self.text[:offset] + insert + self.text[offset + delete:])
+
+    def update(self, object text):
+        """Replace the whole text. Only the blocks that changed are parsed.
+
+        Returns a tuple with the HTML of the new text and a ``BlockDiff``.
+        """
+        if isinstance(text, bytes):
+            text = text.decode('UTF-8', 'strict')
+        source = text
+
+        preprocess = getattr(self.markdown.renderer, 'preprocess', None)
+        if preprocess is not None:
+            text = preprocess(text)
+        if hasattr(text, 'encode'):
+            text = text.encode('UTF-8', 'strict')
+
+        cdef Py_buffer view
+        PyObject_GetBuffer(text, &view, PyBUF_SIMPLE)
+
+        cdef _hoedown.hoedown_buffer *ob = _hoedown.hoedown_buffer_new(128)
+        cdef _hoedown.hoedown_buffer *work = _hoedown.hoedown_buffer_new(1024)
+        cdef _hoedown.hoedown_buffer *defs = _hoedown.hoedown_buffer_new(64)
+        cdef bint locked
+
+        with nogil:
+            PyThread_acquire_lock(self.markdown.lock, WAIT_LOCK)
+            locked = self.markdown.renderer._acquire()
+        try:
+            diff = self._update(view, ob, work, defs)
+        finally:
+            if locked:
+                self.markdown.renderer._release()
+            PyThread_release_lock(self.markdown.lock)
+            _hoedown.hoedown_buffer_free(defs)
+            _hoedown.hoedown_buffer_free(work)
+            _hoedown.hoedown_buffer_free(ob)
+            PyBuffer_Release(&view)
+
+        self.text = source
+        return self.html, diff
+
+    cdef object _update(self, Py_buffer view, _hoedown.hoedown_buffer *ob,
+                        _hoedown.hoedown_buffer *work, _hoedown.hoedown_buffer *defs):
+        cdef _hoedown.hoedown_document *document = self.markdown.document
+        cdef unsigned int footnotes
+        cdef size_t size, start = 0, pos = 0, old_pos, seed
+        cdef Py_ssize_t delta = 0, prefix = 0, suffix = 0
+        cdef bint full, seeded
+
+        try:
+            footnotes = _hoedown.hoedown_document_start(
+                document, ob, work, defs, <uint8_t *> view.buf, view.len)
+            wrapper.check_callback_error()
+
+            header = (<char *> ob.data)[:ob.size].decode('UTF-8', 'strict')
+            source = (<char *> work.data)[:work.size]  # Parsing changes ``work``
+            new_defs = (<char *> defs.data)[:defs.size]
+            size = work.size
+
+            old_ends = self.ends if self.ends is not None else []
+            old_blocks = self.blocks if self.blocks is not None else []
+            old_count = len(old_blocks)
+
+            full = (self.blocks is None or self.always_full or footnotes > 0 or
+                    new_defs != self.defs or header != self.header)
+
+            if not full:
+                delta = len(source) - len(self.source)
+                prefix = _common_prefix(self.source, source)
+                suffix = _common_suffix(self.source, source, prefix)
+
+                # A change can merge a block with the one before it
+                start = bisect_left(old_ends, prefix)
+                if start > 0:
+                    start -= 1
+
+                # HTML blocks look for their closing tag as far as it takes, so
+                # adding or removing one can change any earlier line with a tag.
+                if _has_tag_chars(self.source, prefix, suffix) or \
+                        _has_tag_chars(source, prefix, suffix):
+                    match = _html_line.search(source, 0, old_ends[start - 1] if start > 0 else 0)
+                    if match is not None:
+                        start = bisect_right(old_ends, match.start())
+
+                pos = old_ends[start - 1] if start > 0 else 0
+
+            seeded = bool(header) or any(old_blocks[:start])
+            new_ends = []
+            new_blocks = []
+            resync = old_count
+
+            while pos < size:
+                # Renderers separate blocks with a newline when there's output
+                # before them, so pretend there is.
+                ob.size = 0
+                seed = 0
+                if seeded:
+                    _hoedown.hoedown_buffer_putc(ob, '\n')
+                    seed = 1
+
+                pos += _hoedown.hoedown_document_render_block(
+                    document, ob, work.data + pos, size - pos)
+                wrapper.check_callback_error()
+
+                block = (<char *> ob.data)[seed:ob.size].decode('UTF-8', 'strict')
+                new_ends.append(pos)
+                new_blocks.append(block)
+                seeded = seeded or bool(block)
+
+                # The rest is unchanged once a block ends on an old block
+                # boundary in the unchanged end of the text.
+                if not full and <Py_ssize_t> pos >= <Py_ssize_t> size - suffix:
+                    old_pos = pos - delta
+                    j = bisect_left(old_ends, old_pos)
+                    if (j < old_count and j >= start and old_ends[j] == old_pos and
+                            seeded == (bool(header) or any(old_blocks[:j + 1]))):
+                        resync = j + 1
+                        break
+
+            ends = old_ends[:start] + new_ends + [e + delta for e in old_ends[resync:]]
+            blocks = old_blocks[:start] + new_blocks + old_blocks[resync:]
+        except:
+            # Release what hoedown_document_start collected
+            ob.size = 0
+            _hoedown.hoedown_document_finish(document, ob)
+            raise
+
+        ob.size = 0
+        seed = 0
+        if bool(header) or any(blocks):
+            _hoedown.hoedown_buffer_putc(ob, '\n')
+            seed = 1
+        _hoedown.hoedown_document_finish(document, ob)
+        wrapper.check_callback_error()
+
+        self.header = header
+        self.footer = (<char *> ob.data)[seed:ob.size].decode('UTF-8', 'strict')
+        self.source = source
+        self.defs = new_defs
+        self.ends = ends
+        self.blocks = blocks
+
+        return BlockDiff(start, resync - start, new_blocks)
+
+
+_html_line = re.compile(br'^<', re.M)
+
+
+cdef bint _has_tag_chars(bytes source, Py_ssize_t prefix, Py_ssize_t suffix):
+    # Also look at the bytes around the change, e.g. for a ``>`` that's
+    # added to the end of ``--``.
+    changed = source[max(prefix - 2, 0):len(source) - max(suffix - 2, 0)]
+    return b'<' in changed or b'>' in changed
+
+
+cdef Py_ssize_t _common_prefix(bytes a, bytes b):
+    cdef const char *pa = a
+    cdef const char *pb = b
+    cdef Py_ssize_t i = 0, n = min(len(a), len(b))
+    while i < n and pa[i] == pb[i]:
+        i += 1
+    return i
+
+
+cdef Py_ssize_t _common_suffix(bytes a, bytes b, Py_ssize_t prefix):
+    cdef const char *pa = a
+    cdef const char *pb = b
+    cdef Py_ssize_t la = len(a), lb = len(b)
+    cdef Py_ssize_t i = 0, n = min(la, lb) - prefix
+    while i < n and pa[la - 1 - i] == pb[lb - 1 - i]:
+        i += 1
+    return i
+
+
+cdef class RenderCache:
+    """A thread-safe cache of rendered documents that evicts the least
+    recently used ones. Pass it to ``html`` or ``Markdown``, or use its
+    ``html`` method as a drop-in replacement for ``html``.
+
+    Documents are looked up by a hash of the input text together with the
+    extensions, render flags and renderer class. ``Markdown`` adds the rest
+    of its settings that change the output: ``max_nesting`` and the
+    renderer's ``nesting_level``, ``link_rules`` and ``sanitizer``.
+
+    :param max_entries: The maximum number of cached documents.
+    :param max_bytes: The maximum total size of the cached documents, as
+        reported by ``sys.getsizeof``.
+    """
+
+    cdef object entries
+    cdef object lock
+
+    #: Limits
+    cdef readonly size_t max_entries
+    cdef readonly size_t max_bytes
+
+    #: Statistics
+    cdef readonly size_t size
+    cdef readonly size_t hits
+    cdef readonly size_t misses
+    cdef readonly size_t evictions
+
+    def __init__(self, size_t max_entries=1024, size_t max_bytes=64 * 1024 * 1024):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def key(self, object text, unsigned int extensions=0, unsigned int render_flags=0,
+            object renderer_class=None):
+        """Returns the key ``text`` is cached under.
+
+        :param text: A text accepted by ``Markdown.render``.
+        """
+        if hasattr(text, 'encode'):
+            text = text.encode('UTF-8', 'strict')
+        return (_digest(text), extensions, render_flags, renderer_class)
+
+    def get(self, object key, object default=None):
+        """Returns the document cached under ``key`` or ``default``."""
+        with self.lock:
+            try:
+                value, size = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def put(self, object key, object value):
+        """Cache ``value`` under ``key``. Documents larger than ``max_bytes``
+        are not cached.
+        """
+        cdef size_t size = sys.getsizeof(value)
+        if size > self.max_bytes or self.max_entries == 0:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            while self.entries and (<size_t> len(self.entries) >= self.max_entries or
+                                    self.size + size > self.max_bytes):
+                self.size -= self.entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+    def clear(self):
+        """Remove all documents and reset the statistics."""
+        with self.lock:
+            self.entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns the statistics as a dictionary."""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def html(self, object text, unsigned int extensions=0, unsigned int render_flags=0):
+        """Like the ``html`` function, but with this cache."""
+        return html(text, extensions, render_flags, self)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Returned by ``CallbackCache._get`` for missing results, which can be None
+_missing = object()
+
+
+cdef class CallbackCache:
+    """A thread-safe cache of the results of renderer methods, like a
+    ``block_code`` that highlights code or a ``math`` that typesets
+    formulas, evicting the least recently used ones. Pass it to a renderer
+    to use it, one cache can be shared by any number of renderers.
+
+    Results are looked up by the method name and arguments together with
+    the renderer class and render flags, so the methods must return the same
+    result for the same arguments in every instance of the class.
+
+    :param methods: The names of the methods whose results are cached.
+    :param max_entries: The maximum number of cached results.
+    :param max_bytes: The maximum total size of the cached results and
+        arguments, as reported by ``sys.getsizeof``.
+    """
+
+    cdef object entries
+    cdef object lock
+    cdef dict method_stats
+
+    #: The names of the cached methods
+    cdef readonly frozenset methods
+
+    #: Limits
+    cdef readonly size_t max_entries
+    cdef readonly size_t max_bytes
+
+    #: Statistics
+    cdef readonly size_t size
+    cdef readonly size_t hits
+    cdef readonly size_t misses
+    cdef readonly size_t evictions
+
+    def __init__(self, object methods=('block_code', 'math'), size_t max_entries=4096,
+                 size_t max_bytes=64 * 1024 * 1024):
+        names = set(wrapper.method_names[i].decode('utf-8')
+                    for i in range(<int> wrapper.method_count))
+        for name in methods:
+            if name not in names:
+                raise ValueError('%r is not a renderer method' % name)
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.methods = frozenset(methods)
+        self.method_stats = dict((name, [0, 0]) for name in self.methods)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    cdef object _get(self, tuple key, object name):
+        with self.lock:
+            try:
+                value, size = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                self.method_stats[name][1] += 1
+                return _missing
+            self.entries[key] = (value, size)
+            self.hits += 1
+            self.method_stats[name][0] += 1
+            return value
+
+    cdef _put(self, tuple key, object value):
+        # The key is the renderer class, the flags, the method name and
+        # the arguments
+        cdef size_t size = sys.getsizeof(value)
+        for arg in key[3:]:
+            size += sys.getsizeof(arg)
+        if size > self.max_bytes or self.max_entries == 0:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            while self.entries and (<size_t> len(self.entries) >= self.max_entries or
+                                    self.size + size > self.max_bytes):
+                self.size -= self.entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+    property hit_rate:
+        """The share of lookups that found a result, 0.0 before the first."""
+        def __get__(self):
+            lookups = self.hits + self.misses
+            return self.hits / float(lookups) if lookups else 0.0
+
+    def clear(self):
+        """Remove all results and reset the statistics."""
+        with self.lock:
+            self.entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+            for counts in self.method_stats.values():
+                counts[:] = [0, 0]
+
+    def stats(self):
+        """Returns the statistics as a dictionary, with the hits and misses
+        of every method under ``'methods'``.
+        """
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hit_rate,
+                'methods': dict((name, {'hits': hits, 'misses': misses})
+                                for name, (hits, misses) in self.method_stats.items()),
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+
+cdef class _CachedMethod:
+    """Looks the results of a renderer method up in a ``CallbackCache``."""
+
+    cdef CallbackCache cache
+    cdef object method
+    cdef tuple prefix
+    cdef object name
+
+    def __init__(self, CallbackCache cache, object method, tuple prefix):
+        self.cache = cache
+        self.method = method
+        self.prefix = prefix
+        self.name = prefix[2]
+
+    def __call__(self, *args):
+        key = self.prefix + args
+        value = self.cache._get(key, self.name)
+        if value is _missing:
+            value = self.method(*args)
+            self.cache._put(key, value)
+        return value
+
+
+cdef class Pool:
+    """Keeps a ``Markdown`` instance per thread for every combination of
+    extensions and render flags, so renderers and documents are built once
+    and reused for every document. ``html`` uses one internally.
+
+    :param renderer_class: The ``BaseRenderer`` subclass to instantiate with
+        the render flags. Defaults to ``HtmlRenderer``, or ``HtmlTocRenderer``
+        when ``HTML_TOC_TREE`` is set.
+    """
+
+    cdef object renderer_class
+    cdef object local
+
+    def __init__(self, object renderer_class=None):
+        if renderer_class is not None and not issubclass(renderer_class, BaseRenderer):
+            raise ValueError('expected subclass of BaseRenderer, %s found' % \
+                renderer_class.__name__)
+
+        self.renderer_class = renderer_class
+        self.local = threading.local()
+
+    def get(self, unsigned int extensions=0, unsigned int render_flags=0):
+        """Returns the current thread's ``Markdown`` instance for the given
+        extensions and render flags.
+        """
+        try:
+            markdowns = self.local.markdowns
+        except AttributeError:
+            markdowns = self.local.markdowns = {}
+
+        key = (extensions, render_flags)
+        markdown = markdowns.get(key)
+        if markdown is None:
+            if self.renderer_class is None:
+                markdown = _html_markdown(extensions, render_flags)
+            else:
+                markdown = Markdown(self.renderer_class(render_flags), extensions)
+            markdowns[key] = markdown
+        return markdown
+
+    def render(self, object text, unsigned int extensions=0, unsigned int render_flags=0):
+        """Render the Markdown text with the current thread's ``Markdown``
+        instance for the given extensions and render flags.
+
+        Returns a unicode string.
+        """
+        return self.get(extensions, render_flags).render(text)
+
+
+_html_pool = Pool()
+_text_pool = Pool(PlainTextRenderer)
+
+
+cdef class AsyncRenderer:
+    """Renders markdown from asyncio code without blocking the event loop.
+
+    Documents are handed to a pool of threads, each with its own
+    ``Markdown`` instances. Rendering releases the GIL, so the event loop
+    keeps running and several documents render in parallel. Renderers with
+    methods written in Python hold the GIL while rendering, they only keep
+    the event loop from waiting on one document.
+
+    Handing a document to a thread costs about as much as rendering a few
+    kilobytes, so small documents are rendered in the event loop.
+
+    :param renderer_class: The ``BaseRenderer`` subclass to render with, as
+        for ``Pool``. Defaults to the renderers ``html`` uses.
+    :param workers: The number of threads. Defaults to the number of CPUs.
+    :param max_pending: The number of documents rendered or waiting for a
+        thread at once, for every event loop. ``render`` waits until one of
+        them is done when there are more. Defaults to four times ``workers``.
+    :param inline_size: Documents of up to this many characters or bytes are
+        rendered in the event loop.
+    """
+
+    cdef readonly int workers
+    cdef readonly int max_pending
+    cdef readonly Py_ssize_t inline_size
+    cdef object render_text
+    cdef object executor
+    cdef object semaphores
+
+    def __init__(self, object renderer_class=None, workers=None, max_pending=None,
+                 Py_ssize_t inline_size=4096):
+        import weakref
+        import multiprocessing
+        from concurrent.futures import ThreadPoolExecutor
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if max_pending is None:
+            max_pending = workers * 4
+        if workers < 1:
+            raise ValueError('workers must be at least 1, %d given' % workers)
+        if max_pending < 1:
+            raise ValueError('max_pending must be at least 1, %d given' % max_pending)
+
+        if renderer_class is None:
+            self.render_text = html
+        else:
+            self.render_text = Pool(renderer_class).render
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.inline_size = inline_size
+        self.executor = ThreadPoolExecutor(workers)
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    async def render(self, object text, unsigned int extensions=0, unsigned int render_flags=0):
+        """Render the Markdown text like ``html``.
+
+        Returns a unicode string.
+        """
+        import asyncio
+
+        if self.executor is None:
+            raise RuntimeError('render on closed AsyncRenderer')
+
+        if len(text) <= self.inline_size:
+            return self.render_text(text, extensions, render_flags)
+
+        # get_running_loop is new in Python 3.7, inside a coroutine
+        # get_event_loop returns the same loop before that
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.max_pending)
+
+        await semaphore.acquire()
+        try:
+            future = self.executor.submit(self.render_text, text, extensions, render_flags)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        # Release when the thread is done rather than when the caller stops
+        # waiting, so cancelled renders still count until they finish.
+        future.add_done_callback(lambda f: _release_threadsafe(loop, semaphore))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def close(self, bint wait=True):
+        """Stop the threads once the pending documents are rendered.
+
+        :param wait: Wait for the pending documents.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait)
+            self.executor = None
+
+
+def _release_threadsafe(loop, semaphore):
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        # The event loop is closed
+        pass
+
+
+# Created by the first ``render_async`` call
+_async_renderer = None
+
+
+async def render_async(object text, unsigned int extensions=0, unsigned int render_flags=0):
+    """Convert markdown text to (X)HTML from asyncio code, with a shared
+    ``AsyncRenderer``.
+
+    Returns a unicode string.
+
+    :param text: A byte or unicode string.
+    :param extensions: Enable additional Markdown extensions with the ``EXT_*`` constants.
+    :param render_flags: Adjust HTML rendering behaviour with the ``HTML_*`` constants.
+    """
+    global _async_renderer
+    if _async_renderer is None:
+        _async_renderer = AsyncRenderer()
+    return await _async_renderer.render(text, extensions, render_flags)
@@ -0,0 +1,889 @@
+#include <string.h>
+
+#include "tree.h"
+
+
+/* Every callback adds a node and writes a marker with its index to the
+   output buffer, so the callback of the parent finds its children in the
+   content it's given. Text is written as it is, because hoedown takes back
+   text it has written when it finds an autolink or a line break, and becomes
+   text nodes when the parent takes its children. */
+
+#define MARK_START 0x01
+#define MARK_END 0x02
+
+#define NO_SPAN ((size_t) -1)
+
+
+/* Where the text written to an output buffer at pos came from */
+struct text_chunk {
+    size_t pos;
+    size_t size;
+    size_t src;
+};
+
+struct text_log {
+    const hoedown_buffer *ob;
+    struct text_chunk *chunks;
+    size_t count;
+    size_t asize;
+};
+
+struct tree_state {
+    hoedown_node *nodes;
+    size_t count;
+    size_t asize;
+
+    hoedown_buffer *strings;
+
+    /* One log per output buffer, hoedown keeps a few and reuses them */
+    struct text_log *logs;
+    size_t log_count;
+    size_t log_asize;
+
+    /* The text being parsed */
+    const uint8_t *source;
+    size_t source_size;
+};
+
+
+const char *node_names[] = {
+    "document",
+
+    /* block level */
+    "block_code",
+    "block_quote",
+    "header",
+    "hrule",
+    "list",
+    "list_item",
+    "paragraph",
+    "table",
+    "table_header",
+    "table_body",
+    "table_row",
+    "table_cell",
+    "footnotes",
+    "footnote_def",
+    "block_html",
+
+    /* span level */
+    "autolink",
+    "codespan",
+    "double_emphasis",
+    "emphasis",
+    "underline",
+    "highlight",
+    "quote",
+    "image",
+    "linebreak",
+    "link",
+    "triple_emphasis",
+    "strikethrough",
+    "superscript",
+    "footnote_ref",
+    "math",
+    "raw_html",
+
+    /* low level */
+    "entity",
+    "normal_text"
+};
+
+const size_t node_count = sizeof(node_names) / sizeof(char *);
+
+
+/* Nodes and strings
+   ----------------- */
+
+
+static int
+new_node(struct tree_state *st, hoedown_node_type type)
+{
+    static const hoedown_tree_string none = {HOEDOWN_NO_STRING, 0};
+    hoedown_node *node;
+
+    if (st->count == st->asize) {
+        st->asize = st->asize ? st->asize * 2 : 64;
+        st->nodes = hoedown_realloc(st->nodes, st->asize * sizeof(hoedown_node));
+    }
+
+    node = &st->nodes[st->count];
+    node->type = type;
+    node->parent = node->first_child = node->next_sibling = -1;
+    node->start = node->end = NO_SPAN;
+    node->level = 0;
+    node->flags = 0;
+    node->text = node->link = node->title = node->lang = none;
+
+    return (int) st->count++;
+}
+
+static hoedown_tree_string
+add_string(struct tree_state *st, const hoedown_buffer *b)
+{
+    hoedown_tree_string s = {HOEDOWN_NO_STRING, 0};
+
+    if (b != NULL) {
+        s.offset = st->strings->size;
+        s.size = b->size;
+        hoedown_buffer_put(st->strings, b->data, b->size);
+    }
+    return s;
+}
+
+static size_t
+source_offset(struct tree_state *st, const uint8_t *p)
+{
+    uintptr_t start = (uintptr_t) st->source, pos = (uintptr_t) p;
+
+    if (pos >= start && pos < start + st->source_size)
+        return pos - start;
+    return NO_SPAN;
+}
+
+/* Spans the node over b when it's a part of the source */
+static void
+set_span(struct tree_state *st, int node, const hoedown_buffer *b)
+{
+    size_t start;
+
+    if (b == NULL || b->size == 0)
+        return;
+
+    start = source_offset(st, b->data);
+    if (start != NO_SPAN && start + b->size <= st->source_size) {
+        st->nodes[node].start = start;
+        st->nodes[node].end = start + b->size;
+    }
+}
+
+static void
+put_marker(hoedown_buffer *ob, int node)
+{
+    uint8_t digits[16];
+    size_t i = sizeof(digits);
+
+    do {
+        digits[--i] = '0' + node % 10;
+        node /= 10;
+    } while (node > 0);
+
+    hoedown_buffer_putc(ob, MARK_START);
+    hoedown_buffer_put(ob, digits + i, sizeof(digits) - i);
+    hoedown_buffer_putc(ob, MARK_END);
+}
+
+
+/* Text logs
+   --------- */
+
+
+static struct text_log *
+find_log(struct tree_state *st, const hoedown_buffer *ob, int create)
+{
+    struct text_log *log;
+    size_t i;
+
+    for (i = 0; i < st->log_count; i++)
+        if (st->logs[i].ob == ob)
+            return &st->logs[i];
+
+    if (!create)
+        return NULL;
+
+    if (st->log_count == st->log_asize) {
+        st->log_asize = st->log_asize ? st->log_asize * 2 : 8;
+        st->logs = hoedown_realloc(st->logs, st->log_asize * sizeof(struct text_log));
+    }
+
+    log = &st->logs[st->log_count++];
+    log->ob = ob;
+    log->chunks = NULL;
+    log->count = log->asize = 0;
+    return log;
+}
+
+static void
+log_text(struct tree_state *st, const hoedown_buffer *ob, size_t pos, size_t size, size_t src)
+{
+    struct text_log *log = find_log(st, ob, 1);
+    struct text_chunk *chunk;
+
+    /* Chunks past the end of the buffer were taken back, or the buffer
+       was emptied and reused */
+    while (log->count > 0 && log->chunks[log->count - 1].pos >= pos)
+        log->count--;
+
+    if (log->count == log->asize) {
+        log->asize = log->asize ? log->asize * 2 : 16;
+        log->chunks = hoedown_realloc(log->chunks, log->asize * sizeof(struct text_chunk));
+    }
+
+    chunk = &log->chunks[log->count++];
+    chunk->pos = pos;
+    chunk->size = size;
+    chunk->src = src;
+}
+
+/* The source offset of the text at pos in the log's buffer */
+static size_t
+log_source(const struct text_log *log, size_t pos)
+{
+    size_t lo = 0, hi, mid;
+
+    if (log == NULL || log->count == 0)
+        return NO_SPAN;
+
+    /* The last chunk that starts at or before pos */
+    hi = log->count;
+    while (hi - lo > 1) {
+        mid = (lo + hi) / 2;
+        if (log->chunks[mid].pos <= pos)
+            lo = mid;
+        else
+            hi = mid;
+    }
+
+    if (log->chunks[lo].pos <= pos && pos < log->chunks[lo].pos + log->chunks[lo].size &&
+            log->chunks[lo].src != NO_SPAN)
+        return log->chunks[lo].src + (pos - log->chunks[lo].pos);
+    return NO_SPAN;
+}
+
+
+/* Children
+   -------- */
+
+
+static void
+append_child(struct tree_state *st, int parent, int child, int *last)
+{
+    st->nodes[child].parent = parent;
+    if (*last < 0)
+        st->nodes[parent].first_child = child;
+    else
+        st->nodes[*last].next_sibling = child;
+    *last = child;
+}
+
+/* Adds the text at data[beg:end] of content to the text node, creating it
+   first when it's -1 */
+static int
+add_text(struct tree_state *st, int parent, int text, int *last,
+         const uint8_t *data, size_t beg, size_t end, const struct text_log *log)
+{
+    size_t start, stop;
+
+    if (text < 0) {
+        text = new_node(st, HOEDOWN_NODE_NORMAL_TEXT);
+        st->nodes[text].text.offset = st->strings->size;
+        append_child(st, parent, text, last);
+
+        start = log_source(log, beg);
+        st->nodes[text].start = start;
+    }
+
+    hoedown_buffer_put(st->strings, data + beg, end - beg);
+    st->nodes[text].text.size += end - beg;
+
+    stop = log_source(log, end - 1);
+    st->nodes[text].end = stop == NO_SPAN ? NO_SPAN : stop + 1;
+    return text;
+}
+
+/* Makes the nodes marked in content children of parent, with the text
+   between them as text nodes */
+static void
+take_children(struct tree_state *st, int parent, const hoedown_buffer *content)
+{
+    struct text_log *log;
+    const uint8_t *data;
+    size_t i = 0, end, size;
+    int last = -1, text = -1, child;
+
+    if (content == NULL)
+        return;
+
+    log = find_log(st, content, 0);
+    data = content->data;
+    size = content->size;
+
+    while (i < size) {
+        if (data[i] != MARK_START) {
+            end = i;
+            while (end < size && data[end] != MARK_START)
+                end++;
+            text = add_text(st, parent, text, &last, data, i, end, log);
+            i = end;
+            continue;
+        }
+
+        child = 0;
+        end = i + 1;
+        while (end < size && data[end] >= '0' && data[end] <= '9')
+            child = child * 10 + (data[end++] - '0');
+
+        if (end == i + 1) {
+            /* An escaped MARK_START in the text */
+            text = add_text(st, parent, text, &last, data, i, i + 1, NULL);
+        } else if (child < (int) st->count && child != parent && st->nodes[child].parent < 0) {
+            append_child(st, parent, child, &last);
+            text = -1;
+        }
+        i = end + 1;
+    }
+
+    /* The buffer is emptied before hoedown uses it again */
+    if (log != NULL)
+        log->count = 0;
+}
+
+static int
+container(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_node_type type, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = new_node(st, type);
+
+    take_children(st, node, content);
+    put_marker(ob, node);
+    return node;
+}
+
+static int
+leaf(hoedown_buffer *ob, const hoedown_buffer *text, hoedown_node_type type, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = new_node(st, type);
+
+    if (text != NULL) {
+        st->nodes[node].text = add_string(st, text);
+        set_span(st, node, text);
+    }
+    put_marker(ob, node);
+    return node;
+}
+
+
+/* Block level
+   ----------- */
+
+
+static void
+tree_blockcode(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_buffer *lang, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = leaf(ob, text, HOEDOWN_NODE_BLOCK_CODE, data);
+
+    if (lang && lang->size)
+        st->nodes[node].lang = add_string(st, lang);
+}
+
+static void
+tree_blockquote(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_BLOCK_QUOTE, data);
+}
+
+static void
+tree_header(hoedown_buffer *ob, const hoedown_buffer *content, int level, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = container(ob, content, HOEDOWN_NODE_HEADER, data);
+
+    st->nodes[node].level = level;
+}
+
+static void
+tree_hrule(hoedown_buffer *ob, const hoedown_renderer_data *data)
+{
+    leaf(ob, NULL, HOEDOWN_NODE_HRULE, data);
+}
+
+static void
+tree_list(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = container(ob, content, HOEDOWN_NODE_LIST, data);
+
+    /* Without the parser's internal flags */
+    st->nodes[node].flags = flags & (HOEDOWN_LIST_ORDERED | HOEDOWN_LI_BLOCK);
+}
+
+static void
+tree_listitem(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_list_flags flags, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = container(ob, content, HOEDOWN_NODE_LIST_ITEM, data);
+
+    /* Without the parser's internal flags */
+    st->nodes[node].flags = flags & (HOEDOWN_LIST_ORDERED | HOEDOWN_LI_BLOCK);
+}
+
+static void
+tree_paragraph(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_PARAGRAPH, data);
+}
+
+static void
+tree_table(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_TABLE, data);
+}
+
+static void
+tree_table_header(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_TABLE_HEADER, data);
+}
+
+static void
+tree_table_body(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_TABLE_BODY, data);
+}
+
+static void
+tree_table_row(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_TABLE_ROW, data);
+}
+
+static void
+tree_table_cell(hoedown_buffer *ob, const hoedown_buffer *content, hoedown_table_flags flags, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = container(ob, content, HOEDOWN_NODE_TABLE_CELL, data);
+
+    st->nodes[node].flags = flags;
+}
+
+static void
+tree_footnotes(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_FOOTNOTES, data);
+}
+
+static void
+tree_footnote_def(hoedown_buffer *ob, const hoedown_buffer *content, unsigned int num, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = container(ob, content, HOEDOWN_NODE_FOOTNOTE_DEF, data);
+
+    st->nodes[node].level = (int) num;
+}
+
+static void
+tree_blockhtml(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+    leaf(ob, text, HOEDOWN_NODE_BLOCK_HTML, data);
+}
+
+
+/* Span level
+   ---------- */
+
+
+static int
+tree_autolink(hoedown_buffer *ob, const hoedown_buffer *link, hoedown_autolink_type type, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = leaf(ob, link, HOEDOWN_NODE_AUTOLINK, data);
+
+    st->nodes[node].flags = type;
+    return 1;
+}
+
+static int
+tree_codespan(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+    leaf(ob, text, HOEDOWN_NODE_CODESPAN, data);
+    return 1;
+}
+
+static int
+tree_double_emphasis(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_DOUBLE_EMPHASIS, data);
+    return 1;
+}
+
+static int
+tree_emphasis(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_EMPHASIS, data);
+    return 1;
+}
+
+static int
+tree_underline(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_UNDERLINE, data);
+    return 1;
+}
+
+static int
+tree_highlight(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_HIGHLIGHT, data);
+    return 1;
+}
+
+static int
+tree_quote(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_QUOTE, data);
+    return 1;
+}
+
+static int
+tree_image(hoedown_buffer *ob, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_buffer *alt, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = leaf(ob, alt, HOEDOWN_NODE_IMAGE, data);
+
+    st->nodes[node].link = add_string(st, link);
+    st->nodes[node].title = add_string(st, title);
+    return 1;
+}
+
+static int
+tree_linebreak(hoedown_buffer *ob, const hoedown_renderer_data *data)
+{
+    leaf(ob, NULL, HOEDOWN_NODE_LINEBREAK, data);
+    return 1;
+}
+
+static int
+tree_link(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = container(ob, content, HOEDOWN_NODE_LINK, data);
+
+    st->nodes[node].link = add_string(st, link);
+    st->nodes[node].title = add_string(st, title);
+    return 1;
+}
+
+static int
+tree_triple_emphasis(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_TRIPLE_EMPHASIS, data);
+    return 1;
+}
+
+static int
+tree_strikethrough(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_STRIKETHROUGH, data);
+    return 1;
+}
+
+static int
+tree_superscript(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
+{
+    container(ob, content, HOEDOWN_NODE_SUPERSCRIPT, data);
+    return 1;
+}
+
+static int
+tree_footnote_ref(hoedown_buffer *ob, unsigned int num, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = leaf(ob, NULL, HOEDOWN_NODE_FOOTNOTE_REF, data);
+
+    st->nodes[node].level = (int) num;
+    return 1;
+}
+
+static int
+tree_math(hoedown_buffer *ob, const hoedown_buffer *text, int displaymode, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    int node = leaf(ob, text, HOEDOWN_NODE_MATH, data);
+
+    st->nodes[node].level = displaymode;
+    return 1;
+}
+
+static int
+tree_raw_html(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+    leaf(ob, text, HOEDOWN_NODE_RAW_HTML, data);
+    return 1;
+}
+
+
+/* Low level
+   --------- */
+
+
+static void
+tree_entity(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+    leaf(ob, text, HOEDOWN_NODE_ENTITY, data);
+}
+
+static void
+tree_normal_text(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
+{
+    struct tree_state *st = data->opaque;
+    size_t i = 0, end, src;
+
+    while (i < text->size) {
+        if (text->data[i] == MARK_START) {
+            /* Escaped as an empty marker */
+            hoedown_buffer_putc(ob, MARK_START);
+            hoedown_buffer_putc(ob, MARK_END);
+            i++;
+            continue;
+        }
+
+        end = i;
+        while (end < text->size && text->data[end] != MARK_START)
+            end++;
+
+        src = source_offset(st, text->data + i);
+        log_text(st, ob, ob->size, end - i, src);
+        hoedown_buffer_put(ob, text->data + i, end - i);
+        i = end;
+    }
+}
+
+
+/* Tree
+   ---- */
+
+
+/* Numbers the nodes under root in document order */
+static hoedown_tree *
+build_tree(struct tree_state *st, int root)
+{
+    hoedown_tree *tree = hoedown_calloc(1, sizeof(hoedown_tree));
+    hoedown_node *nodes = st->nodes, *node;
+    int *index = hoedown_malloc(st->count * sizeof(int));
+    int *order = hoedown_malloc(st->count * sizeof(int));
+    int i, n = 0, child;
+
+    /* Pre-order walk */
+    i = root;
+    while (i >= 0) {
+        index[i] = n;
+        order[n++] = i;
+
+        if (nodes[i].first_child >= 0) {
+            i = nodes[i].first_child;
+            continue;
+        }
+        while (i >= 0 && nodes[i].next_sibling < 0)
+            i = nodes[i].parent;
+        if (i >= 0)
+            i = nodes[i].next_sibling;
+    }
+
+    tree->count = n;
+    tree->nodes = hoedown_malloc(n * sizeof(hoedown_node));
+
+    for (i = 0; i < n; i++) {
+        node = &tree->nodes[i];
+        *node = nodes[order[i]];
+        if (node->parent >= 0)
+            node->parent = index[node->parent];
+        if (node->first_child >= 0)
+            node->first_child = index[node->first_child];
+        if (node->next_sibling >= 0)
+            node->next_sibling = index[node->next_sibling];
+    }
+
+    free(index);
+    free(order);
+
+    /* Nodes without a span of their own cover their children, children
+       come after their parent */
+    for (i = n - 1; i >= 0; i--) {
+        node = &tree->nodes[i];
+        if (node->start != NO_SPAN && node->end != NO_SPAN && node->start <= node->end)
+            continue;
+
+        node->start = node->end = NO_SPAN;
+        for (child = node->first_child; child >= 0; child = tree->nodes[child].next_sibling) {
+            if (tree->nodes[child].start == NO_SPAN)
+                continue;
+            if (node->start == NO_SPAN || tree->nodes[child].start < node->start)
+                node->start = tree->nodes[child].start;
+            if (node->end == NO_SPAN || tree->nodes[child].end > node->end)
+                node->end = tree->nodes[child].end;
+        }
+    }
+
+    /* and the others the span of their parent. Text copied by the parser
+       (in lists, block quotes and footnotes) can't be found in the source. */
+    for (i = 1; i < n; i++) {
+        node = &tree->nodes[i];
+        if (node->start == NO_SPAN) {
+            node->start = tree->nodes[node->parent].start;
+            node->end = tree->nodes[node->parent].end;
+        }
+    }
+
+    return tree;
+}
+
+/* Spans the top-level nodes marked in ob[mark:] over the block at
+   data[beg:end], without the empty lines around it */
+static void
+set_block_span(struct tree_state *st, hoedown_buffer *ob, size_t mark, const uint8_t *data, size_t beg, size_t end)
+{
+    size_t i, line;
+    int node;
+
+    for (line = i = beg; i < end; i++) {
+        if (data[i] == '\n')
+            line = i + 1;
+        else if (data[i] != ' ' && data[i] != '\t')
+            break;
+    }
+    beg = line;
+
+    while (end > beg && (data[end - 1] == '\n' || data[end - 1] == ' ' || data[end - 1] == '\t'))
+        end--;
+
+    for (i = mark; i < ob->size; i++) {
+        if (ob->data[i] != MARK_START)
+            continue;
+
+        node = 0;
+        while (++i < ob->size && ob->data[i] != MARK_END)
+            node = node * 10 + (ob->data[i] - '0');
+
+        st->nodes[node].start = beg;
+        st->nodes[node].end = end;
+    }
+}
+
+hoedown_tree *
+hoedown_tree_parse(hoedown_document *doc, hoedown_renderer *renderer, const uint8_t *data, size_t size)
+{
+    struct tree_state *st = renderer->opaque;
+    hoedown_buffer *ob = hoedown_buffer_new(64);
+    hoedown_buffer *text = hoedown_buffer_new(64);
+    hoedown_tree *tree;
+    size_t pos = 0, mark, i;
+    int root;
+
+    st->count = 0;
+    st->strings = hoedown_buffer_new(64);
+    for (i = 0; i < st->log_count; i++)
+        st->logs[i].count = 0;
+
+    hoedown_document_start(doc, ob, text, NULL, data, size);
+
+    st->source = text->data;
+    st->source_size = text->size;
+
+    while (pos < text->size) {
+        mark = ob->size;
+        i = hoedown_document_render_block(doc, ob, text->data + pos, text->size - pos);
+        set_block_span(st, ob, mark, text->data, pos, pos + i);
+        pos += i;
+    }
+
+    hoedown_document_finish(doc, ob);
+
+    root = new_node(st, HOEDOWN_NODE_DOCUMENT);
+    st->nodes[root].start = 0;
+    st->nodes[root].end = text->size;
+    take_children(st, root, ob);
+
+    tree = build_tree(st, root);
+    tree->source = text;
+    tree->strings = st->strings;
+
+    st->strings = NULL;
+    st->source = NULL;
+    st->source_size = 0;
+    hoedown_buffer_free(ob);
+
+    return tree;
+}
+
+void
+hoedown_tree_free(hoedown_tree *tree)
+{
+    hoedown_buffer_free(tree->source);
+    hoedown_buffer_free(tree->strings);
+    free(tree->nodes);
+    free(tree);
+}
+
+
+hoedown_renderer *
+hoedown_tree_renderer_new(void)
+{
+    static const hoedown_renderer cb_default = {
+        NULL,
+
+        tree_blockcode,
+        tree_blockquote,
+        tree_header,
+        tree_hrule,
+        tree_list,
+        tree_listitem,
+        tree_paragraph,
+        tree_table,
+        tree_table_header,
+        tree_table_body,
+        tree_table_row,
+        tree_table_cell,
+        tree_footnotes,
+        tree_footnote_def,
+        tree_blockhtml,
+
+        tree_autolink,
+        tree_codespan,
+        tree_double_emphasis,
+        tree_emphasis,
+        tree_underline,
+        tree_highlight,
+        tree_quote,
+        tree_image,
+        tree_linebreak,
+        tree_link,
+        tree_triple_emphasis,
+        tree_strikethrough,
+        tree_superscript,
+        tree_footnote_ref,
+        tree_math,
+        tree_raw_html,
+
+        tree_entity,
+        tree_normal_text,
+
+        NULL,
+        NULL
+    };
+
+    hoedown_renderer *renderer = hoedown_malloc(sizeof(hoedown_renderer));
+    struct tree_state *st = hoedown_calloc(1, sizeof(struct tree_state));
+
+    memcpy(renderer, &cb_default, sizeof(hoedown_renderer));
+    renderer->opaque = st;
+    return renderer;
+}
+
+void
+hoedown_tree_renderer_free(hoedown_renderer *renderer)
+{
+    struct tree_state *st = renderer->opaque;
+    size_t i;
+
+    for (i = 0; i < st->log_count; i++)
+        free(st->logs[i].chunks);
+    free(st->logs);
+    free(st->nodes);
+    if (st->strings)
+        hoedown_buffer_free(st->strings);
+    free(st);
+    free(renderer);
+}
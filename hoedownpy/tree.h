@@ -0,0 +1,116 @@
+#ifndef HOEDOWNPY_TREE_H
+#define HOEDOWNPY_TREE_H
+
+#include "_hoedown/src/document.h"
+#include "_hoedown/src/buffer.h"
+
+
+/* Node types, the same as the renderer callbacks */
+typedef enum hoedown_node_type {
+    HOEDOWN_NODE_DOCUMENT,
+
+    /* block level */
+    HOEDOWN_NODE_BLOCK_CODE,
+    HOEDOWN_NODE_BLOCK_QUOTE,
+    HOEDOWN_NODE_HEADER,
+    HOEDOWN_NODE_HRULE,
+    HOEDOWN_NODE_LIST,
+    HOEDOWN_NODE_LIST_ITEM,
+    HOEDOWN_NODE_PARAGRAPH,
+    HOEDOWN_NODE_TABLE,
+    HOEDOWN_NODE_TABLE_HEADER,
+    HOEDOWN_NODE_TABLE_BODY,
+    HOEDOWN_NODE_TABLE_ROW,
+    HOEDOWN_NODE_TABLE_CELL,
+    HOEDOWN_NODE_FOOTNOTES,
+    HOEDOWN_NODE_FOOTNOTE_DEF,
+    HOEDOWN_NODE_BLOCK_HTML,
+
+    /* span level */
+    HOEDOWN_NODE_AUTOLINK,
+    HOEDOWN_NODE_CODESPAN,
+    HOEDOWN_NODE_DOUBLE_EMPHASIS,
+    HOEDOWN_NODE_EMPHASIS,
+    HOEDOWN_NODE_UNDERLINE,
+    HOEDOWN_NODE_HIGHLIGHT,
+    HOEDOWN_NODE_QUOTE,
+    HOEDOWN_NODE_IMAGE,
+    HOEDOWN_NODE_LINEBREAK,
+    HOEDOWN_NODE_LINK,
+    HOEDOWN_NODE_TRIPLE_EMPHASIS,
+    HOEDOWN_NODE_STRIKETHROUGH,
+    HOEDOWN_NODE_SUPERSCRIPT,
+    HOEDOWN_NODE_FOOTNOTE_REF,
+    HOEDOWN_NODE_MATH,
+    HOEDOWN_NODE_RAW_HTML,
+
+    /* low level */
+    HOEDOWN_NODE_ENTITY,
+    HOEDOWN_NODE_NORMAL_TEXT
+} hoedown_node_type;
+
+/* A string in hoedown_tree.strings, offset is HOEDOWN_NO_STRING when the
+   node doesn't have it */
+typedef struct hoedown_tree_string {
+    size_t offset;
+    size_t size;
+} hoedown_tree_string;
+
+#define HOEDOWN_NO_STRING ((size_t) -1)
+
+typedef struct hoedown_node {
+    hoedown_node_type type;
+
+    /* Indexes of other nodes, -1 when there's none */
+    int parent;
+    int first_child;
+    int next_sibling;
+
+    /* Byte span in hoedown_tree.source */
+    size_t start;
+    size_t end;
+
+    /* Header level, footnote number or 1 for display math */
+    int level;
+
+    /* List, table cell or autolink flags */
+    unsigned int flags;
+
+    /* Literal text of text, code, HTML, math and entity nodes, the URL of
+       autolinks and the alt text of images */
+    hoedown_tree_string text;
+
+    /* Link and image URL and title, code block language */
+    hoedown_tree_string link;
+    hoedown_tree_string title;
+    hoedown_tree_string lang;
+} hoedown_node;
+
+/* The nodes of a document in document order, the first one is the
+   document node. */
+typedef struct hoedown_tree {
+    hoedown_node *nodes;
+    size_t count;
+
+    /* The text that was parsed: the input with reference and footnote
+       definitions taken out, tabs expanded and newlines normalized. */
+    hoedown_buffer *source;
+
+    hoedown_buffer *strings;
+} hoedown_tree;
+
+extern const char *node_names[];
+extern const size_t node_count;
+
+/* Allocates a renderer that builds a hoedown_tree */
+hoedown_renderer *hoedown_tree_renderer_new(void);
+
+void hoedown_tree_renderer_free(hoedown_renderer *renderer);
+
+/* Parses data with doc, a document created with a tree renderer. The caller
+   frees the tree with hoedown_tree_free. */
+hoedown_tree *hoedown_tree_parse(hoedown_document *doc, hoedown_renderer *renderer, const uint8_t *data, size_t size);
+
+void hoedown_tree_free(hoedown_tree *tree);
+
+#endif
@@ -0,0 +1,47 @@
+from libc.stdint cimport uint8_t
+from _hoedown cimport hoedown_buffer, hoedown_document, hoedown_renderer
+
+
+cdef extern from *:
+    ctypedef char* const_char_ptr "const char *"
+    ctypedef char* const_size_t "const size_t"
+
+cdef extern from 'tree.h':
+
+    enum: HOEDOWN_NO_STRING
+
+    struct hoedown_tree_string:
+        size_t offset
+        size_t size
+
+    struct hoedown_node:
+        int type
+        int parent
+        int first_child
+        int next_sibling
+        size_t start
+        size_t end
+        int level
+        unsigned int flags
+        hoedown_tree_string text
+        hoedown_tree_string link
+        hoedown_tree_string title
+        hoedown_tree_string lang
+
+    struct hoedown_tree:
+        hoedown_node *nodes
+        size_t count
+        hoedown_buffer *source
+        hoedown_buffer *strings
+
+    const_char_ptr node_names[]
+    const_size_t node_count
+
+    hoedown_renderer *hoedown_tree_renderer_new() nogil
+    void hoedown_tree_renderer_free(hoedown_renderer *renderer)
+    hoedown_tree *hoedown_tree_parse(
+        hoedown_document *doc,
+        hoedown_renderer *renderer,
+        const uint8_t *data,
+        size_t size) nogil
+    void hoedown_tree_free(hoedown_tree *tree)
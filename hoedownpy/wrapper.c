@@ -7,54 +7,218 @@
 
 #include "wrapper.h"
 
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <time.h>
+#endif
+
+
+/* Indexes into renderopt.methods, in the same order as method_names */
+enum {
+    BLOCK_CODE,
+    BLOCK_QUOTE,
+    HEADER,
+    HRULE,
+    LIST,
+    LIST_ITEM,
+    PARAGRAPH,
+    TABLE,
+    TABLE_HEADER,
+    TABLE_BODY,
+    TABLE_ROW,
+    TABLE_CELL,
+    FOOTNOTES,
+    FOOTNOTE_DEF,
+    BLOCK_HTML,
+
+    AUTOLINK,
+    CODESPAN,
+    DOUBLE_EMPHASIS,
+    EMPHASIS,
+    UNDERLINE,
+    HIGHLIGHT,
+    QUOTE,
+    IMAGE,
+    LINEBREAK,
+    LINK,
+    TRIPLE_EMPHASIS,
+    STRIKETHROUGH,
+    SUPERSCRIPT,
+    FOOTNOTE_REF,
+    MATH,
+    RAW_HTML,
+
+    ENTITY,
+    NORMAL_TEXT,
+
+    DOC_HEADER,
+    DOC_FOOTER
+};
+
+
+/* Lenient renderers print the error and carry on, the others stop the
+   document so the exception can be raised once hoedown returns. */
+static void
+callback_error(const hoedown_renderer_data *data, struct renderopt *opt)
+{
+    if (opt->lenient)
+        PyErr_Print();
+    else
+        hoedown_document_abort(data);
+}
+
+
+int
+check_callback_error(void)
+{
+    return PyErr_Occurred() ? -1 : 0;
+}
+
+
+double
+perf_clock(void)
+{
+#ifdef _WIN32
+    LARGE_INTEGER count, frequency;
+    QueryPerformanceCounter(&count);
+    QueryPerformanceFrequency(&frequency);
+    return (double) count.QuadPart / frequency.QuadPart;
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+#endif
+}
+
+
+/* Calls the renderer method with the given arguments and writes the string
+   it returns to ob. The references to the arguments are stolen. Returns 1
+   when something was written and 0 when the method returned None or raised
+   an exception. */
+static int
+call_method(hoedown_buffer *ob, const hoedown_renderer_data *data, int method, PyObject **args, size_t nargs)
+{
+    struct hoedown_html_renderer_state *state = data->opaque;
+    struct renderopt *opt = state->opaque;
+    PyObject *func = PyTuple_GET_ITEM(opt->methods, method);
+    PyObject *ret = NULL;
+    hoedown_document_stats *stats = hoedown_document_get_stats(data);
+    double start = 0;
+    const char *str;
+    Py_ssize_t size;
+    size_t i;
+
+    /* The document is being aborted after an error */
+    if (PyErr_Occurred())
+        goto cleanup;
+
+    for (i = 0; i < nargs; i++)
+        if (args[i] == NULL)
+            goto cleanup;
+
+    if (stats)
+        start = perf_clock();
+
+#if PY_VERSION_HEX >= 0x03090000
+    /* args[-1] is free, which saves bound methods a copy of the arguments */
+    ret = PyObject_Vectorcall(func, args, nargs | PY_VECTORCALL_ARGUMENTS_OFFSET, NULL);
+#else
+    {
+        PyObject *tuple = PyTuple_New(nargs);
+        if (tuple == NULL)
+            goto cleanup;
+        for (i = 0; i < nargs; i++) {
+            Py_INCREF(args[i]);
+            PyTuple_SET_ITEM(tuple, i, args[i]);
+        }
+        ret = PyObject_Call(func, tuple, NULL);
+        Py_DECREF(tuple);
+    }
+#endif
+
+    if (stats)
+        stats->callback_time += perf_clock() - start;
+
+cleanup:
+    for (i = 0; i < nargs; i++)
+        Py_XDECREF(args[i]);
+
+    if (ret == NULL || ret == Py_None) {
+        if (ret == NULL)
+            callback_error(data, opt);
+        Py_XDECREF(ret);
+        return 0;
+    }
 
-#define PROCESS_SPAN(method_name, ...) {\
-    struct hoedown_html_renderer_state *opt = data->opaque;\
-    PyObject *ret = PyObject_CallMethodObjArgs(\
-        (PyObject *) opt->opaque, PyUnicode_FromString(method_name),\
-        __VA_ARGS__);\
-    if (ret == NULL || ret == Py_None) {\
-        PyObject *r_ex = PyErr_Occurred();\
-        if (r_ex != NULL)\
-            PyErr_Print();\
-        return 0;\
-    }\
-    if (PyUnicode_Check(ret)) {\
-        PyObject *byte_string = PyUnicode_AsEncodedString(ret, "utf-8", "strict");\
-        hoedown_buffer_puts(ob, PyBytes_AsString(byte_string));\
-    } else {\
-        hoedown_buffer_puts(ob, PyBytes_AsString(ret));\
-    }\
-    return 1;\
-}
-
-
-#define PROCESS_BLOCK(method_name, ...) {\
-    struct hoedown_html_renderer_state *opt = data->opaque;\
-    PyObject *ret = PyObject_CallMethodObjArgs(\
-        (PyObject *) opt->opaque, PyUnicode_FromString(method_name),\
-        __VA_ARGS__);\
-    if (ret == NULL || ret == Py_None) {\
-        PyObject *r_ex = PyErr_Occurred();\
-        if (r_ex != NULL)\
-            PyErr_Print();\
-        return;\
-    }\
-    if (PyUnicode_Check(ret)) {\
-        PyObject *byte_string = PyUnicode_AsEncodedString(ret, "utf-8", "strict");\
-        hoedown_buffer_puts(ob, PyBytes_AsString(byte_string));\
-    } else {\
-        hoedown_buffer_puts(ob, PyBytes_AsString(ret));\
-    }\
-}
-
-
-#define PY_STR(b) (b != NULL ? PyUnicode_FromStringAndSize((const char *) b->data, (int) b->size) : Py_None)
+#if PY_MAJOR_VERSION >= 3
+    if (PyUnicode_Check(ret)) {
+        str = PyUnicode_AsUTF8AndSize(ret, &size);
+    }
+#else
+    if (PyUnicode_Check(ret)) {
+        PyObject *byte_string = PyUnicode_AsUTF8String(ret);
+        Py_DECREF(ret);
+        ret = byte_string;
+        str = ret ? PyBytes_AS_STRING(ret) : NULL;
+        size = ret ? PyBytes_GET_SIZE(ret) : 0;
+    }
+#endif
+    else if (PyBytes_Check(ret)) {
+        str = PyBytes_AS_STRING(ret);
+        size = PyBytes_GET_SIZE(ret);
+    } else {
+        PyErr_Format(PyExc_TypeError, "%s() must return a string, not %.200s",
+            method_names[method], Py_TYPE(ret)->tp_name);
+        str = NULL;
+    }
+
+    if (str == NULL) {
+        callback_error(data, opt);
+        Py_XDECREF(ret);
+        return 0;
+    }
+
+    hoedown_buffer_put(ob, (const uint8_t *) str, size);
+    Py_DECREF(ret);
+    return 1;
+}
+
+
+#define PROCESS_SPAN(method, ...) {\
+    PyObject *args[] = {NULL, __VA_ARGS__};\
+    return call_method(ob, data, method, args + 1, sizeof(args) / sizeof(PyObject *) - 1);\
+}
+
+
+#define PROCESS_BLOCK(method, ...) {\
+    PyObject *args[] = {NULL, __VA_ARGS__};\
+    call_method(ob, data, method, args + 1, sizeof(args) / sizeof(PyObject *) - 1);\
+}
+
+
+/* New references to the callback arguments */
+
+static PyObject *
+py_str(const hoedown_buffer *b)
+{
+    if (b == NULL)
+        Py_RETURN_NONE;
+    return PyUnicode_FromStringAndSize((const char *) b->data, (Py_ssize_t) b->size);
+}
+
+static PyObject *
+py_bool(int b)
+{
+    if (b)
+        Py_RETURN_TRUE;
+    Py_RETURN_FALSE;
+}
 
 #if PY_MAJOR_VERSION >= 3
-    #define PY_INT(i) PyLong_FromLong(i)
+    #define py_int(i) PyLong_FromLong(i)
 #else
-    #define PY_INT(i) PyInt_FromLong(i)
+    #define py_int(i) PyInt_FromLong(i)
 #endif
 
 
@@ -65,112 +229,102 @@
 static void
 rndr_blockcode(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_buffer *lang, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("block_code", PY_STR(text), PY_STR(lang), NULL);
+    PROCESS_BLOCK(BLOCK_CODE, py_str(text), py_str(lang));
 }
 
 
 static void
 rndr_blockquote(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("block_quote", PY_STR(text), NULL);
+    PROCESS_BLOCK(BLOCK_QUOTE, py_str(text));
 }
 
 
 static void
 rndr_raw_block(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("block_html", PY_STR(text), NULL);
+    PROCESS_BLOCK(BLOCK_HTML, py_str(text));
 }
 
 
 static void
 rndr_header(hoedown_buffer *ob, const hoedown_buffer *text, int level, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("header", PY_STR(text), PY_INT(level), NULL);
+    PROCESS_BLOCK(HEADER, py_str(text), py_int(level));
 }
 
 
 static void
 rndr_hrule(hoedown_buffer *ob, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("hrule", NULL);
+    PROCESS_BLOCK(HRULE);
 }
 
 
 static void
 rndr_list(hoedown_buffer *ob, const hoedown_buffer *text, hoedown_list_flags flags, const hoedown_renderer_data *data)
 {
-    PyObject *is_ordered = Py_False;
-    if (flags & HOEDOWN_LIST_ORDERED) {
-        is_ordered = Py_True;
-    }
-
-    PROCESS_BLOCK("list", PY_STR(text), is_ordered, NULL);
+    PROCESS_BLOCK(LIST, py_str(text), py_bool(flags & HOEDOWN_LIST_ORDERED));
 }
 
 
 static void
 rndr_listitem(hoedown_buffer *ob, const hoedown_buffer *text, hoedown_list_flags flags, const hoedown_renderer_data *data)
 {
-    PyObject *is_ordered = Py_False;
-    if (flags & HOEDOWN_LIST_ORDERED) {
-        is_ordered = Py_True;
-    }
-
-    PROCESS_BLOCK("list_item", PY_STR(text), is_ordered, NULL);
+    PROCESS_BLOCK(LIST_ITEM, py_str(text), py_bool(flags & HOEDOWN_LIST_ORDERED));
 }
 
 
 static void
 rndr_paragraph(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("paragraph", PY_STR(text), NULL);
+    PROCESS_BLOCK(PARAGRAPH, py_str(text));
 }
 
 
 static void
 rndr_table(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("table", PY_STR(content), NULL);
+    PROCESS_BLOCK(TABLE, py_str(content));
 }
 
 static void
 rndr_table_header(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("table_header", PY_STR(text), NULL);
+    PROCESS_BLOCK(TABLE_HEADER, py_str(text));
 }
 
 static void
 rndr_table_body(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("table_body", PY_STR(text), NULL);
+    PROCESS_BLOCK(TABLE_BODY, py_str(text));
 }
 
 static void
 rndr_tablerow(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("table_row", PY_STR(text), NULL);
+    PROCESS_BLOCK(TABLE_ROW, py_str(text));
 }
 
 
 static void
 rndr_tablecell(hoedown_buffer *ob, const hoedown_buffer *text, hoedown_table_flags flags, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("table_cell", PY_STR(text), PY_INT(flags), NULL);
+    PROCESS_BLOCK(TABLE_CELL, py_str(text), py_int(flags));
 }
 
 
 static void
 rndr_footnotes(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("footnotes", PY_STR(text), NULL);
+    PROCESS_BLOCK(FOOTNOTES, py_str(text));
 }
 
 
 static void
 rndr_footnote_def(hoedown_buffer *ob, const hoedown_buffer *text, unsigned int num, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("footnote_def", PY_STR(text), PY_INT(num), NULL);
+    PROCESS_BLOCK(FOOTNOTE_DEF, py_str(text), py_int(num));
 }
 
 
@@ -181,116 +335,111 @@ rndr_footnote_def(hoedown_buffer *ob, const hoedown_buffer *text, unsigned int n
 static int
 rndr_autolink(hoedown_buffer *ob, const hoedown_buffer *link, hoedown_autolink_type type, const hoedown_renderer_data *data)
 {
-    PyObject *is_email = Py_False;
-    if (type == HOEDOWN_AUTOLINK_EMAIL) {
-        is_email = Py_True;
-    }
-
-    PROCESS_SPAN("autolink", PY_STR(link), is_email, NULL);
+    PROCESS_SPAN(AUTOLINK, py_str(link), py_bool(type == HOEDOWN_AUTOLINK_EMAIL));
 }
 
 
 static int
 rndr_codespan(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("codespan", PY_STR(text), NULL);
+    PROCESS_SPAN(CODESPAN, py_str(text));
 }
 
 
 static int
 rndr_double_emphasis(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("double_emphasis", PY_STR(text), NULL);
+    PROCESS_SPAN(DOUBLE_EMPHASIS, py_str(text));
 }
 
 
 static int
 rndr_emphasis(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("emphasis", PY_STR(text), NULL);
+    PROCESS_SPAN(EMPHASIS, py_str(text));
 }
 
 
 static int
 rndr_underline(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("underline", PY_STR(text), NULL);
+    PROCESS_SPAN(UNDERLINE, py_str(text));
 }
 
 
 static int
 rndr_highlight(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("highlight", PY_STR(text), NULL);
+    PROCESS_SPAN(HIGHLIGHT, py_str(text));
 }
 
 
 static int
 rndr_quote(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("quote", PY_STR(text), NULL);
+    PROCESS_SPAN(QUOTE, py_str(text));
 }
 
 
 static int
 rndr_image(hoedown_buffer *ob, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_buffer *alt, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("image", PY_STR(link), PY_STR(title), PY_STR(alt), NULL);
+    PROCESS_SPAN(IMAGE, py_str(link), py_str(title), py_str(alt));
 }
 
 
 static int
 rndr_linebreak(hoedown_buffer *ob, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("linebreak", NULL);
+    PROCESS_SPAN(LINEBREAK);
 }
 
 
 static int
 rndr_link(hoedown_buffer *ob, const hoedown_buffer *content, const hoedown_buffer *link, const hoedown_buffer *title, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("link", PY_STR(content), PY_STR(link), PY_STR(title), NULL);
+    PROCESS_SPAN(LINK, py_str(content), py_str(link), py_str(title));
 }
 
 
 static int
 rndr_raw_html(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("raw_html", PY_STR(text), NULL);
+    PROCESS_SPAN(RAW_HTML, py_str(text));
 }
 
 
 static int
 rndr_triple_emphasis(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("triple_emphasis", PY_STR(text), NULL);
+    PROCESS_SPAN(TRIPLE_EMPHASIS, py_str(text));
 }
 
 
 static int
 rndr_strikethrough(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("strikethrough", PY_STR(text), NULL);
+    PROCESS_SPAN(STRIKETHROUGH, py_str(text));
 }
 
 
 static int
 rndr_superscript(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("superscript", PY_STR(text), NULL);
+    PROCESS_SPAN(SUPERSCRIPT, py_str(text));
 }
 
 
 static int
 rndr_footnote_ref(hoedown_buffer *ob, unsigned int num, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("footnote_ref", PY_INT(num), NULL);
+    PROCESS_SPAN(FOOTNOTE_REF, py_int(num));
 }
 
 static int
 rndr_math(hoedown_buffer *ob, const hoedown_buffer *text, int displaymode, const hoedown_renderer_data *data)
 {
-    PROCESS_SPAN("math", PY_STR(text), NULL);
+    PROCESS_SPAN(MATH, py_str(text));
 }
 
 
@@ -301,28 +450,28 @@ rndr_math(hoedown_buffer *ob, const hoedown_buffer *text, int displaymode, const
 static void
 rndr_entity(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("entity", PY_STR(text), NULL);
+    PROCESS_BLOCK(ENTITY, py_str(text));
 }
 
 
 static void
 rndr_normal_text(hoedown_buffer *ob, const hoedown_buffer *text, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("normal_text", PY_STR(text), NULL);
+    PROCESS_BLOCK(NORMAL_TEXT, py_str(text));
 }
 
 
 static void
 rndr_doc_header(hoedown_buffer *ob, int inline_render, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("doc_header", NULL);
+    PROCESS_BLOCK(DOC_HEADER);
 }
 
 
 static void
 rndr_doc_footer(hoedown_buffer *ob, int inline_render, const hoedown_renderer_data *data)
 {
-    PROCESS_BLOCK("doc_footer", NULL);
+    PROCESS_BLOCK(DOC_FOOTER);
 }
 
 
@@ -1,27 +1,21 @@
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
 
-struct rndr_state {
-    void *opaque;
-
-    struct {
-        int header_count;
-        int current_level;
-        int level_offset;
-        int nesting_level;
-    } toc_data;
-
-    hoedown_html_flags flags;
-
-    /* extra callbacks */
-    void (*link_attributes)(hoedown_buffer *ob, const hoedown_buffer *url, const hoedown_renderer_data *data);
-};
-
+/* Stored in the opaque pointer of the renderer state */
 struct renderopt {
-    struct rndr_state html;
-    void *self;
+    /* Bound renderer methods (or None), in the same order as method_names */
+    PyObject *methods;
+
+    /* Print exceptions raised by the methods instead of stopping */
+    int lenient;
 };
 
 extern hoedown_renderer callback_funcs;
 extern const char *method_names[];
 extern const size_t method_count;
+
+/* Returns -1 when a callback left an exception behind */
+int check_callback_error(void);
+
+/* Seconds from a monotonic clock, for timing renders */
+double perf_clock(void);
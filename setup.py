@@ -95,6 +95,7 @@ setup(
     ext_modules=[Extension('hoedown', [
         'hoedownpy/hoedown.c',
         'hoedownpy/wrapper.c',
+        'hoedownpy/tree.c',
         'hoedownpy/_hoedown/src/html.c',
         'hoedownpy/_hoedown/src/stack.c',
         'hoedownpy/_hoedown/src/document.c',
@@ -2,8 +2,15 @@
 
 # Most unit tests are based on the tests from Redcarpet.
 
+import io
 import re
+import sys
+import time
+import mmap
 import codecs
+import shutil
+import tempfile
+import threading
 from os import path
 from glob import glob
 from subprocess import Popen, PIPE, STDOUT
@@ -66,6 +73,31 @@ class SmartyPantsTest(TestCase):
         html = self.r('<p>what\'d you say?</p>\n')
         ok(html).diff('<p>what&rsquo;d you say?</p>\n')
 
+    def test_code_spans(self):
+        html = self.r('"a" `"b"` -- <kbd>"c"</kbd> "d"\n')
+        ok(html).diff('<p>&ldquo;a&rdquo; <code>&quot;b&quot;</code> &ndash; '
+                      '<kbd>&quot;c&quot;</kbd> &ldquo;d&rdquo;</p>\n')
+
+    def test_escape_html(self):
+        html = hoedown.html('<b>"a"</b> it\'s\n',
+                            render_flags=HTML_SMARTYPANTS | HTML_ESCAPE)
+        ok(html).diff('<p>&lt;b&gt;&ldquo;a&rdquo;&lt;/b&gt; it&rsquo;s</p>\n')
+
+    def test_renderer_flag(self):
+        renderer = HtmlRenderer(HTML_SMARTYPANTS)
+        ok(Markdown(renderer).render('"a" (c)')) == '<p>&ldquo;a&rdquo; &copy;</p>\n'
+        # The quote state doesn't carry over to the next document
+        ok(Markdown(renderer).render('"a')) == '<p>&ldquo;a</p>\n'
+        ok(Markdown(renderer).render('"a')) == '<p>&ldquo;a</p>\n'
+
+    def test_same_as_postprocess(self):
+        pants = SmartyPants()
+        tests_dir = path.dirname(__file__)
+        for text_path in glob(path.join(tests_dir, 'MarkdownTest_1.0*', '*.text')):
+            with codecs.open(text_path, 'r', encoding='utf-8') as fd:
+                text = fd.read()
+            ok(self.r(text)) == pants.postprocess(hoedown.html(text))
+
 
 class HtmlRenderTest(TestCase):
     name = 'Html Renderer'
@@ -475,6 +507,113 @@ class MarkdownSpanCustomRendererTest(TestCase):
         ok(text).contains('[FOOTNOTE_REF] num=1')
 
 
+class CallbackReferenceTest(TestCase):
+    name = 'Callback references'
+
+    def setup(self):
+        self.result = '<p>constant</p>\n'
+        result = self.result
+
+        class ConstantRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                return result
+
+            def emphasis(self, text):
+                return None
+
+        self.renderer = ConstantRenderer()
+        self.m = Markdown(self.renderer)
+
+    def test_no_leaks(self):
+        self.m.render('*a* b\n\nc')
+        before = (sys.getrefcount(self.result), sys.getrefcount(self.renderer),
+                  sys.getrefcount(None))
+        for _ in range(1000):
+            self.m.render('*a* b\n\nc')
+        after = (sys.getrefcount(self.result), sys.getrefcount(self.renderer),
+                 sys.getrefcount(None))
+        ok(after) == before
+
+    def test_nul_in_result(self):
+        class NulRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                return 'a\x00b'
+
+        ok(Markdown(NulRenderer()).render('x')) == 'a\x00b'
+
+    def test_bytes_result(self):
+        class BytesRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                return b'<p>bytes</p>'
+
+        ok(Markdown(BytesRenderer()).render('x')) == '<p>bytes</p>'
+
+
+
+class CallbackErrorTest(TestCase):
+    name = 'Callback errors'
+
+    def setup(self):
+        class FailingRenderer(HtmlRenderer):
+            calls = 0
+
+            def emphasis(self, text):
+                self.calls += 1
+                if text == 'fail':
+                    raise ValueError('bad emphasis')
+                return '<em>%s</em>' % text
+
+        self.cls = FailingRenderer
+
+    def test_raises(self):
+        try:
+            Markdown(self.cls()).render('*fail*')
+        except ValueError as e:
+            ok(str(e)) == 'bad emphasis'
+        else:
+            raise AssertionError('ValueError not raised')
+
+    def test_stops_rendering(self):
+        renderer = self.cls()
+        try:
+            Markdown(renderer).render('*a* *fail* *b*\n\n*c*')
+        except ValueError:
+            pass
+        ok(renderer.calls) == 2
+
+    def test_reusable(self):
+        m = Markdown(self.cls())
+        try:
+            m.render('*fail*')
+        except ValueError:
+            pass
+        ok(m.render('*ok*')) == '<p><em>ok</em></p>\n'
+
+    def test_lenient(self):
+        stderr = sys.stderr
+        sys.stderr = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        try:
+            renderer = self.cls(lenient=True)
+            result = Markdown(renderer).render('*fail* *b*')
+            printed = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        ok(result) == '<p>*fail* <em>b</em></p>\n'
+        ok(printed).contains('bad emphasis')
+        ok(renderer.calls) == 2
+
+    def test_incremental(self):
+        doc = hoedown.IncrementalDocument(self.cls(), 0, '*a*\n\nb')
+        try:
+            doc.update('*a*\n\n*fail*')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+        ok(doc.text) == '*a*\n\nb'
+        ok(doc.update('*a*\n\n*c*')[0]) == '<p><em>a</em></p>\n\n<p><em>c</em></p>\n'
+
+
 class MarkdownConformanceTest_10(TestCase):
     name = 'Markdown Conformance 1.0'
     suite = 'MarkdownTest_1.0'
@@ -534,6 +673,1294 @@ class UnicodeTest(TestCase):
         ok(markdown).diff(html)
 
 
+class BufferInputTest(TestCase):
+    name = 'Buffer input'
+
+    def setup(self):
+        self.r = Markdown(HtmlRenderer()).render
+        self.text = u'# T\u00eftle\n\nSome *text*.\n'
+        self.expected = self.r(self.text)
+
+    def test_bytearray(self):
+        ok(self.r(bytearray(self.text.encode('utf-8')))) == self.expected
+
+    def test_memoryview(self):
+        data = b'ignored' + self.text.encode('utf-8')
+        ok(self.r(memoryview(data)[7:])) == self.expected
+
+    def test_mmap(self):
+        fd = tempfile.TemporaryFile()
+        try:
+            fd.write(self.text.encode('utf-8'))
+            fd.flush()
+            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                ok(self.r(data)) == self.expected
+            finally:
+                data.close()
+        finally:
+            fd.close()
+
+    def test_nul_byte(self):
+        ok(self.r(b'before\x00after')).contains('after')
+
+    def test_not_a_buffer(self):
+        try:
+            self.r(42)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError('TypeError not raised')
+
+
+class InlineRenderTest(TestCase):
+    name = 'Inline rendering'
+
+    def setup(self):
+        self.md = Markdown(HtmlRenderer())
+
+    def test_no_paragraph(self):
+        ok(self.md.render_inline('*a* [b](/c)')) == '<em>a</em> <a href="/c">b</a>'
+        ok(hoedown.html_inline('**a** `b`')) == '<strong>a</strong> <code>b</code>'
+
+    def test_no_blocks(self):
+        ok(self.md.render_inline('# a')) == '# a'
+        ok(self.md.render_inline('- a\n- b')) == '- a\n- b'
+        ok(self.md.render_inline('    a')) == '    a'
+
+    def test_flags(self):
+        ok(hoedown.html_inline('~~<b>~~', EXT_STRIKETHROUGH, HTML_ESCAPE)) == \
+            '<del>&lt;b&gt;</del>'
+        ok(hoedown.html_inline('"a"', render_flags=HTML_SMARTYPANTS)) == '&ldquo;a&rdquo;'
+
+    def test_smartypants_state_reset(self):
+        ok(hoedown.html_inline('"a', render_flags=HTML_SMARTYPANTS)) == '&ldquo;a'
+        ok(hoedown.html_inline('"b', render_flags=HTML_SMARTYPANTS)) == '&ldquo;b'
+
+    def test_unclosed_at_end(self):
+        md = Markdown(HtmlRenderer(), EXT_FOOTNOTES)
+        ok(md.render_inline('a [')) == 'a ['
+        ok(md.render_inline('a ![')) == 'a !['
+
+    def test_many(self):
+        texts = ['*a*', b'_b_', u'\u00e9']
+        ok(self.md.render_inline_many(texts)) == \
+            [self.md.render_inline(text) for text in texts]
+
+    def test_postprocess(self):
+        class UpperRenderer(HtmlRenderer):
+            def postprocess(self, text):
+                return text.upper()
+
+        ok(Markdown(UpperRenderer()).render_inline('*a*')) == '<EM>A</EM>'
+
+    def test_cache(self):
+        cache = hoedown.RenderCache()
+        md = Markdown(HtmlRenderer(), cache=cache)
+        ok(md.render('*a*')) == '<p><em>a</em></p>\n'
+        ok(md.render_inline('*a*')) == '<em>a</em>'
+        ok(hoedown.html_inline('*a*', cache=cache)) == '<em>a</em>'
+        ok(hoedown.html_inline('*a*', cache=cache)) == '<em>a</em>'
+        ok(cache.hits) == 1
+
+    def test_limits(self):
+        md = Markdown(HtmlRenderer(), max_steps=2)
+        try:
+            md.render_inline('*a* *b* *c* *d*')
+        except hoedown.RenderLimitError as e:
+            ok(e.limit) == 'steps'
+        else:
+            raise AssertionError('RenderLimitError not raised')
+
+
+class LinkRulesTest(TestCase):
+    name = 'Link rules'
+
+    def render(self, text, **rules):
+        renderer = HtmlRenderer(link_rules=hoedown.LinkRules(**rules))
+        return Markdown(renderer, EXT_AUTOLINK).render(text)
+
+    def test_attributes(self):
+        ok(self.render('[a](/b)', attributes={'class': 'x'})) == \
+            '<p><a href="/b" class="x">a</a></p>\n'
+        ok(self.render('[a](/b)', attributes=[('title', '"<&>"')])) == \
+            '<p><a href="/b" title="&quot;&lt;&amp;&gt;&quot;">a</a></p>\n'
+
+    def test_external_attributes(self):
+        rules = {'external_attributes': {'rel': 'nofollow'}, 'hosts': ['.example.com']}
+        ok(self.render('[a](http://evil.com/)', **rules)) == \
+            '<p><a href="http://evil.com/" rel="nofollow">a</a></p>\n'
+        ok(self.render('[a](//evil.com/) <https://evil.com>', **rules)).contains(
+            'href="//evil.com/" rel="nofollow"')
+        ok(self.render('<https://evil.com>', **rules)).contains(
+            'href="https://evil.com" rel="nofollow"')
+        for text in ('[a](http://EXAMPLE.com)', '[a](https://www.example.com:80/x)',
+                     '[a](/x)', '[a](#x)', '[a](mailto:a@evil.com)', 'a@evil.com'):
+            ok(self.render(text, **rules)).not_contains('nofollow')
+
+    def test_prefixes(self):
+        rules = {'link_prefixes': [('//', '//'), ('/', 'https://cdn.com/')],
+                 'image_prefixes': {'http://old.com/': 'https://new.com/'}}
+        ok(self.render('[a](/b) [c](//d/e)', **rules)) == \
+            '<p><a href="https://cdn.com/b">a</a> <a href="//d/e">c</a></p>\n'
+        ok(self.render('![a](http://old.com/a.png) [b](http://old.com/)', **rules)) == \
+            '<p><img src="https://new.com/a.png" alt="a"> <a href="http://old.com/">b</a></p>\n'
+
+    def test_allowed_hosts(self):
+        rules = {'allowed_hosts': ['good.com']}
+        ok(self.render('[*a*](http://good.com/) [b](/c)', **rules)) == \
+            '<p><a href="http://good.com/"><em>a</em></a> <a href="/c">b</a></p>\n'
+        ok(self.render('[*a*](http://evil.com/) ![<b>](https://evil.com/i.png)', **rules)) == \
+            '<p><em>a</em> &lt;b&gt;</p>\n'
+        ok(self.render('[a](http://good.com@evil.com/)', **rules)) == '<p>a</p>\n'
+        ok(self.render('<http://evil.com/>', **rules)) == '<p>http://evil.com/</p>\n'
+
+    def test_allowed_hosts_special_schemes(self):
+        rules = {'allowed_hosts': ['good.com']}
+        for url in ('https:/evil.com/x', 'https:evil.com/x', 'HTTP:\\\\evil.com',
+                    'http:///evil.com', 'ht\ntps://evil.com/', 'ftp:evil.com'):
+            ok(self.render('[a](%s)' % url, **rules)) == '<p>a</p>\n'
+        for url in ('https:good.com/x', 'https:/good.com', '/https:evil.com', 'x/https:evil.com'):
+            ok(self.render('[a](%s)' % url, **rules)).contains('<a href=')
+        ok(self.render('[a](mailto:a@good.com) [b](javascript:x) [c](https:)', **rules)) == \
+            '<p>a b c</p>\n'
+
+    def test_external_special_schemes(self):
+        rules = {'external_attributes': {'rel': 'nofollow'}, 'hosts': ['good.com']}
+        ok(self.render('[a](https:evil.com) [b](http:/evil.com)', **rules).count('nofollow')) == 2
+        ok(self.render('[a](https:good.com)', **rules)).not_contains('nofollow')
+
+    def test_invalid_attribute(self):
+        try:
+            hoedown.LinkRules(attributes={'on click': 'x'})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+
+    def test_cache(self):
+        cache = hoedown.RenderCache()
+        rules = hoedown.LinkRules(attributes={'class': 'x'})
+        plain = Markdown(HtmlRenderer(), cache=cache)
+        with_rules = Markdown(HtmlRenderer(link_rules=rules), cache=cache)
+        ok(plain.render('[a](/b)')) == '<p><a href="/b">a</a></p>\n'
+        ok(with_rules.render('[a](/b)')) == '<p><a href="/b" class="x">a</a></p>\n'
+
+
+class SanitizerTest(TestCase):
+    name = 'Sanitizer'
+
+    def render(self, text, flags=0, **options):
+        renderer = HtmlRenderer(flags, sanitizer=hoedown.Sanitizer(**options))
+        return Markdown(renderer).render(text)
+
+    def test_tags(self):
+        ok(self.render('a <b>b</b> <blink>c</blink> <I>d</I>')) == \
+            '<p>a <b>b</b> c <i>d</i></p>\n'
+        ok(self.render('<div class="x">\n<iframe src="/x"></iframe>\n</div>\n')) == \
+            '<div>\n\n</div>\n'
+        ok(self.render('a <br/> <hr> <!-- b --> c')) == '<p>a <br/> <hr>  c</p>\n'
+        ok(self.render('<form>\n<input>\n</form>\n\ntext')) == '<p>text</p>\n'
+
+    def test_attributes(self):
+        ok(self.render('<a href="/a" onclick="x()" TITLE=\'"t"\'>a</a>')) == \
+            '<p><a href="/a" title="&quot;t&quot;">a</a></p>\n'
+        ok(self.render('<span class=x id="y">a</span>',
+                       attributes={'*': ['class'], 'span': ['id']})) == \
+            '<p><span class="x" id="y">a</span></p>\n'
+
+    def test_urls(self):
+        for url in ('javascript:alert(1)', 'JaVaScRiPt:alert(1)', ' javascript:x',
+                    'java\tscript:x', '&#x6A;avascript:x', 'javascript&colon;x',
+                    'data:text/html,x', 'vbscript:x'):
+            ok(self.render('<a href="%s">a</a>' % url)) == '<p><a>a</a></p>\n'
+        for url in ('http://a.com/', 'HTTPS://a.com', 'mailto:a@b.c', '/a:b',
+                    'a.html?b=c:d', '#a', '../a'):
+            ok(self.render('<a href="%s">a</a>' % url)).contains('href="%s"' % url)
+
+    def test_links(self):
+        ok(self.render('[*a*](javascript:x) ![b](data:image/png,x "t") <vbscript:x>')) == \
+            '<p><em>a</em> b vbscript:x</p>\n'
+        ok(self.render('[a](&#106;avascript:x) [b](/c) ![d](http://e/f.png)')) == \
+            '<p>a <a href="/c">b</a> <img src="http://e/f.png" alt="d"></p>\n'
+
+    def test_script(self):
+        ok(self.render('<script>\nalert("<b>")\n</script>\n\n<p>a</p>\n')) == '<p>a</p>\n'
+        ok(self.render('<div>\n<style>p { color: red }</STYLE>b\n</div>\n')) == \
+            '<div>\nb\n</div>\n'
+
+    def test_escape(self):
+        ok(self.render('a <b>b</b> <u onclick="x">c</u> <blink>d</blink>',
+                       tags=['b'], escape=True)) == \
+            '<p>a <b>b</b> &lt;u onclick=&quot;x&quot;&gt;c&lt;/u&gt; ' \
+            '&lt;blink&gt;d&lt;/blink&gt;</p>\n'
+
+    def test_flags(self):
+        ok(self.render('a <b>b</b>', HTML_ESCAPE)) == '<p>a &lt;b&gt;b&lt;/b&gt;</p>\n'
+        ok(self.render('a <b>b</b>', HTML_SKIP_HTML)) == '<p>a b</p>\n'
+
+    def test_invalid_name(self):
+        for options in ({'tags': ['a b']}, {'attributes': {'a': ['on click']}}):
+            try:
+                hoedown.Sanitizer(**options)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('ValueError not raised')
+
+    def test_cache(self):
+        cache = hoedown.RenderCache()
+        plain = Markdown(HtmlRenderer(), cache=cache)
+        sanitized = Markdown(HtmlRenderer(sanitizer=hoedown.Sanitizer()), cache=cache)
+        ok(plain.render('<u onclick="x">a</u>')) == '<p><u onclick="x">a</u></p>\n'
+        ok(sanitized.render('<u onclick="x">a</u>')) == '<p><u>a</u></p>\n'
+
+
+class PlainTextTest(TestCase):
+    name = 'Plain text'
+
+    def setup(self):
+        self.md = Markdown(hoedown.PlainTextRenderer(), EXT_TABLES | EXT_FENCED_CODE | EXT_FOOTNOTES)
+
+    def test_blocks(self):
+        ok(self.md.render('# A *b*\n\nc `d`\n\n> e\n\n---\n\nf  \ng')) == \
+            'A b\n\nc d\n\ne\n\nf\ng'
+
+    def test_lists_and_tables(self):
+        ok(self.md.render('- a\n- b\n\n| c | d |\n|---|---|\n| 1 | 2 |\n')) == \
+            'a\nb\n\nc\td\n1\t2'
+
+    def test_no_escaping(self):
+        ok(self.md.render('a < b & "c"\n\n```\nx < y\n```\n')) == 'a < b & "c"\n\nx < y'
+        ok(self.md.render('&amp; &#233; &#x41; &copy;')) == u'& \u00e9 A &copy;'
+
+    def test_html(self):
+        ok(self.md.render('a <b>b</b>\n\n<div>\n  c <i>d</i>\n  <script>e</script>\n</div>\n')) == \
+            'a b\n\nc d'
+        ok(self.md.render('<div>\na < b and c > d, <3\n<!-- e -->\n</div>\n')) == \
+            'a < b and c > d, <3'
+
+    def test_links_and_images(self):
+        text = '[a](/b) ![c](/d.png) <http://e.com> [^1]\n\n[^1]: f\n'
+        ok(self.md.render(text)) == 'a  http://e.com\n\nf'
+        md = Markdown(hoedown.PlainTextRenderer(hoedown.TEXT_LINK_URLS | hoedown.TEXT_IMAGE_ALT),
+                      EXT_FOOTNOTES)
+        ok(md.render(text)) == 'a (/b) c http://e.com\n\nf'
+        ok(md.render('[/b](/b)')) == '/b'
+
+    def test_plain_text(self):
+        ok(hoedown.plain_text('*a* [b](/c)', render_flags=hoedown.TEXT_LINK_URLS)) == 'a b (/c)'
+
+    def test_python_method(self):
+        class UpperText(hoedown.PlainTextRenderer):
+            def emphasis(self, text):
+                return text.upper()
+
+        ok(Markdown(UpperText()).render('*a* b')) == 'A b'
+
+
+class StreamingRenderTest(TestCase):
+    name = 'Streaming output'
+
+    def setup(self):
+        self.m = Markdown(HtmlRenderer(), EXT_FENCED_CODE | EXT_FOOTNOTES)
+        self.text = (u'# H\u00e9ader\n\nSome *text*[^1].\n\n'
+                     u'```\ncode\n```\n\n> quote\n\n' * 30 +
+                     u'[^1]: A footnote.\n')
+        self.expected = self.m.render(self.text)
+
+    def test_callable_sink(self):
+        for chunk_size in (1, 10, 200, 1 << 20):
+            parts = []
+            self.m.render_to(parts.append, self.text, chunk_size)
+            ok(u''.join(parts)).diff(self.expected)
+
+    def test_chunks_at_block_boundaries(self):
+        parts = []
+        self.m.render_to(parts.append, self.text, 200)
+        ok(len(parts)) > 1
+        for part in parts[1:-1]:
+            ok(part[-1:]) == '>'
+
+    def test_file_sink(self):
+        fd = io.StringIO()
+        self.m.render_to(fd, self.text, 64)
+        ok(fd.getvalue()).diff(self.expected)
+
+    def test_postprocess_per_chunk(self):
+        class UpperRenderer(HtmlRenderer):
+            def postprocess(self, text):
+                return text.upper()
+
+        parts = []
+        Markdown(UpperRenderer()).render_to(parts.append, self.text, 50)
+        ok(u''.join(parts)) == Markdown(HtmlRenderer()).render(self.text).upper()
+
+    def test_sink_error(self):
+        calls = []
+
+        def sink(text):
+            calls.append(text)
+            raise IOError('disk full')
+
+        try:
+            self.m.render_to(sink, self.text, 10)
+        except IOError:
+            pass
+        else:
+            raise AssertionError('IOError not raised')
+
+        ok(len(calls)) == 1
+        ok(self.m.render(self.text)).diff(self.expected)
+
+    def test_sink_error_stops_rendering(self):
+        headers = []
+
+        class Renderer(HtmlRenderer):
+            def header(self, text, level):
+                headers.append(text)
+                return '<h%d>%s</h%d>\n' % (level, text, level)
+
+        def sink(text):
+            raise IOError('disk full')
+
+        try:
+            Markdown(Renderer()).render_to(sink, self.text, 10)
+        except IOError:
+            pass
+        else:
+            raise AssertionError('IOError not raised')
+
+        ok(len(headers)) == 1
+
+
+class BatchRenderTest(TestCase):
+    name = 'Batch rendering'
+
+    def setup(self):
+        self.m = Markdown(HtmlRenderer())
+        self.texts = ['Hello World.', '_Hello World_!', '',
+                      '# Title\n\n* one\n* two\n' * 20, b'byte *string*']
+
+    def test_render_many(self):
+        expected = [self.m.render(t) for t in self.texts]
+        ok(self.m.render_many(self.texts)) == expected
+
+    def test_render_many_empty(self):
+        ok(self.m.render_many([])) == []
+
+    def test_iter_render(self):
+        results = self.m.iter_render(iter(self.texts))
+        ok(next(results)) == '<p>Hello World.</p>\n'
+        ok(list(results)) == [self.m.render(t) for t in self.texts[1:]]
+
+    def test_render_many_with_processing(self):
+        class ProcessRenderer(HtmlRenderer):
+            def preprocess(self, text):
+                return text.replace('foo', 'bar')
+
+            def postprocess(self, text):
+                return text.upper()
+
+        m = Markdown(ProcessRenderer())
+        ok(m.render_many(['foo', '*foo*'])) == \
+            ['<P>BAR</P>\n', '<P><EM>BAR</EM></P>\n']
+
+
+class CorpusRenderTest(TestCase):
+    name = 'Corpus rendering'
+
+    def setup(self):
+        self.texts = ['# Page %d\n\nSome "quoted" *text*.\n' % i for i in range(50)]
+
+    def test_render_corpus(self):
+        results = hoedown.render_corpus(self.texts, workers=2, chunksize=7)
+        ok(results) == [hoedown.html(t) for t in self.texts]
+
+    def test_render_corpus_flags(self):
+        results = hoedown.render_corpus(
+            self.texts, EXT_SPACE_HEADERS, HTML_SMARTYPANTS, workers=2)
+        ok(results) == [hoedown.html(t, EXT_SPACE_HEADERS, HTML_SMARTYPANTS)
+                        for t in self.texts]
+
+    def test_iter_render_corpus(self):
+        results = hoedown.iter_render_corpus(iter(self.texts), workers=2, chunksize=3)
+        ok(next(results)) == hoedown.html(self.texts[0])
+        ok(len(list(results))) == len(self.texts) - 1
+
+    def test_render_corpus_files(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            paths = []
+            for i, text in enumerate(self.texts[:5]):
+                paths.append(path.join(tmp, '%d.md' % i))
+                with open(paths[-1], 'w') as fd:
+                    fd.write(text)
+
+            results = hoedown.render_corpus(paths, workers=2, files=True)
+            ok(results) == [hoedown.html(t) for t in self.texts[:5]]
+        finally:
+            shutil.rmtree(tmp)
+
+
+class RenderCacheTest(TestCase):
+    name = 'Render cache'
+
+    def test_html(self):
+        cache = hoedown.RenderCache()
+        ok(hoedown.html('*a*', cache=cache)) == hoedown.html('*a*')
+        ok(hoedown.html('*a*', cache=cache)) == hoedown.html('*a*')
+        ok(cache.hits) == 1
+        ok(cache.misses) == 1
+
+    def test_key_includes_flags(self):
+        cache = hoedown.RenderCache()
+        ok(cache.html('<b>"a"</b>')) == '<p><b>&quot;a&quot;</b></p>\n'
+        ok(cache.html('<b>"a"</b>', render_flags=HTML_ESCAPE)) == \
+            '<p>&lt;b&gt;&quot;a&quot;&lt;/b&gt;</p>\n'
+        ok(cache.html('<b>"a"</b>', render_flags=HTML_SMARTYPANTS)) == \
+            '<p><b>&ldquo;a&rdquo;</b></p>\n'
+        ok(cache.html('~~a~~', EXT_STRIKETHROUGH)) == '<p><del>a</del></p>\n'
+        ok(cache.hits) == 0
+        ok(len(cache)) == 4
+
+    def test_markdown(self):
+        cache = hoedown.RenderCache()
+        m = Markdown(HtmlRenderer(), cache=cache)
+        ok(m.cache) == cache
+        ok(m.render_many(['a', b'a', bytearray(b'a')])) == ['<p>a</p>\n'] * 3
+        ok(cache.hits) == 2
+
+        class OtherRenderer(HtmlRenderer):
+            pass
+
+        ok(Markdown(OtherRenderer(), cache=cache).render('a')) == '<p>a</p>\n'
+        ok(cache.misses) == 2
+
+    def test_markdown_settings(self):
+        cache = hoedown.RenderCache()
+        text = '# a\n\n> > b\n'
+        ok(Markdown(HtmlRenderer(nesting_level=0), cache=cache).render(text)) == \
+            '<h1>a</h1>\n\n<blockquote>\n<blockquote>\n<p>b</p>\n</blockquote>\n</blockquote>\n'
+        ok(Markdown(HtmlRenderer(nesting_level=3), cache=cache).render(text)) == \
+            '<h1 id="toc_0">a</h1>\n\n<blockquote>\n<blockquote>\n<p>b</p>\n</blockquote>\n</blockquote>\n'
+        ok(Markdown(HtmlRenderer(), cache=cache, max_nesting=2).render(text)) == \
+            '<h1>a</h1>\n\n<blockquote>\n<blockquote>\n</blockquote>\n</blockquote>\n'
+        ok(cache.hits) == 0
+        ok(Markdown(HtmlRenderer(), cache=cache).render(text)) == \
+            '<h1>a</h1>\n\n<blockquote>\n<blockquote>\n<p>b</p>\n</blockquote>\n</blockquote>\n'
+        ok(cache.hits) == 1
+
+    def test_evict_by_entries(self):
+        cache = hoedown.RenderCache(max_entries=2)
+        for text in 'abca':
+            cache.html(text)
+        ok(len(cache)) == 2
+        ok(cache.evictions) == 2
+        ok(cache.hits) == 0
+
+    def test_evict_by_bytes(self):
+        cache = hoedown.RenderCache(max_bytes=1000)
+        for i in range(20):
+            cache.html('x' * 100 * i)
+        ok(cache.size) <= 1000
+        ok(cache.evictions) > 0
+
+    def test_least_recently_used(self):
+        cache = hoedown.RenderCache(max_entries=2)
+        cache.html('a')
+        cache.html('b')
+        cache.html('a')
+        cache.html('c')
+        cache.html('a')
+        ok(cache.hits) == 2
+        ok(cache.stats()) == {'entries': 2, 'size': cache.size, 'hits': 2,
+                              'misses': 3, 'evictions': 1}
+
+    def test_clear(self):
+        cache = hoedown.RenderCache()
+        cache.html('a')
+        cache.clear()
+        ok(len(cache)) == 0
+        ok(cache.misses) == 0
+
+
+class CallbackCacheTest(TestCase):
+    name = 'Callback cache'
+
+    def setup(self):
+        test = self
+
+        class CodeRenderer(HtmlRenderer):
+            def block_code(self, text, lang):
+                test.calls.append((text, lang))
+                if lang == 'none':
+                    return None
+                if lang == 'error':
+                    raise ValueError(text)
+                return '<pre class="%s">%s</pre>\n' % (lang, text)
+
+            def paragraph(self, text):
+                test.calls.append(text)
+                return '<p>%s</p>\n' % text
+
+        self.renderer_class = CodeRenderer
+
+    def reset(self):
+        self.calls = []
+        self.cache = hoedown.CallbackCache()
+
+    def render(self, text, flags=0, cache=None):
+        if cache is None:
+            cache = self.cache
+        renderer = self.renderer_class(flags, callback_cache=cache)
+        return Markdown(renderer, EXT_FENCED_CODE).render(text)
+
+    def test_cached(self):
+        self.reset()
+        text = '```py\nx\n```\n\n```py\nx\n```\n\n```c\nx\n```\n\na\n\na\n'
+        result = self.render(text)
+        ok(self.render(text)) == result
+        ok(self.calls) == [('x\n', 'py'), ('x\n', 'c'), 'a', 'a', 'a', 'a']
+        ok(self.cache.hits) == 4
+        ok(self.cache.misses) == 2
+        ok(self.cache.hit_rate) == 4 / 6.0
+        ok(self.cache.stats()['methods']) == {'block_code': {'hits': 4, 'misses': 2},
+                                              'math': {'hits': 0, 'misses': 0}}
+
+    def test_keyed_by_flags(self):
+        self.reset()
+        self.render('```py\nx\n```\n')
+        self.render('```py\nx\n```\n', HTML_ESCAPE)
+        ok(len(self.calls)) == 2
+
+    def test_none_and_errors(self):
+        self.reset()
+        self.render('```none\nx\n```\n')
+        self.render('```none\nx\n```\n')
+        ok(len(self.calls)) == 1
+
+        for _ in range(2):
+            try:
+                self.render('```error\nx\n```\n')
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('ValueError not raised')
+        ok(len(self.calls)) == 3
+        ok(len(self.cache)) == 1
+
+    def test_eviction(self):
+        self.reset()
+        cache = hoedown.CallbackCache(max_entries=2)
+        for lang in ('a', 'b', 'a', 'c', 'a', 'b'):
+            self.render('```%s\nx\n```\n' % lang, cache=cache)
+        ok([lang for text, lang in self.calls]) == ['a', 'b', 'c', 'b']
+        ok(cache.evictions) == 2
+        ok(len(cache)) == 2
+
+        cache.clear()
+        ok(cache.stats()['hits']) == 0
+        ok(len(cache)) == 0
+
+    def test_invalid_method(self):
+        try:
+            hoedown.CallbackCache(['highlight_code'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+
+
+class PoolTest(TestCase):
+    name = 'Pool'
+
+    def test_reuses_markdown(self):
+        pool = hoedown.Pool()
+        ok(pool.get(EXT_TABLES) is pool.get(EXT_TABLES)) == True
+        ok(pool.get(EXT_TABLES) is pool.get(EXT_TABLES, HTML_ESCAPE)) == False
+
+    def test_render(self):
+        pool = hoedown.Pool()
+        ok(pool.render('<b>~~a~~</b>', EXT_STRIKETHROUGH, HTML_ESCAPE)) == \
+            hoedown.html('<b>~~a~~</b>', EXT_STRIKETHROUGH, HTML_ESCAPE)
+
+    def test_renderer_class(self):
+        class UpperRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                return '<P>%s</P>\n' % text.upper()
+
+        pool = hoedown.Pool(UpperRenderer)
+        ok(pool.render('*hi*')) == '<P><EM>HI</EM></P>\n'
+        ok(pool.get(render_flags=HTML_ESCAPE).render('<i>hi</i>')) == \
+            '<P>&LT;I&GT;HI&LT;/I&GT;</P>\n'
+
+    def test_not_a_renderer(self):
+        try:
+            hoedown.Pool(object)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+
+    def test_per_thread(self):
+        pool = hoedown.Pool()
+        markdowns = []
+        thread = threading.Thread(target=lambda: markdowns.append(pool.get()))
+        thread.start()
+        thread.join()
+        ok(markdowns[0] is pool.get()) == False
+
+
+class AsyncRenderTest(TestCase):
+    name = 'Async rendering'
+
+    def setup(self):
+        import asyncio
+        self.asyncio = asyncio
+        self.loop = asyncio.new_event_loop()
+        self.big = '*a* [b](/c)\n\n' * 1000
+
+    def teardown(self):
+        self.loop.close()
+
+    def gather(self, *coroutines):
+        tasks = [self.asyncio.ensure_future(c, loop=self.loop) for c in coroutines]
+        return self.loop.run_until_complete(self.asyncio.gather(*tasks))
+
+    def test_render_async(self):
+        ok(self.gather(hoedown.render_async('~~a~~', EXT_STRIKETHROUGH, HTML_ESCAPE),
+                    hoedown.render_async(self.big))) == \
+            [hoedown.html('~~a~~', EXT_STRIKETHROUGH, HTML_ESCAPE), hoedown.html(self.big)]
+
+    def test_inline(self):
+        threads = []
+
+        class ThreadRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                threads.append(threading.current_thread())
+                return text
+
+        renderer = hoedown.AsyncRenderer(ThreadRenderer, inline_size=100)
+        ok(self.gather(renderer.render('a'), renderer.render('b' * 101))) == ['a', 'b' * 101]
+        ok(threads[0] is threading.current_thread()) == True
+        ok(threads[1] is threading.current_thread()) == False
+
+        renderer.close()
+        try:
+            self.gather(renderer.render('a'))
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('RuntimeError not raised')
+
+    def test_renderer_class(self):
+        class UpperRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                return '<P>%s</P>\n' % text.upper()
+
+        renderer = hoedown.AsyncRenderer(UpperRenderer, inline_size=0)
+        ok(self.gather(renderer.render('*hi*'))) == ['<P><EM>HI</EM></P>\n']
+        renderer.close()
+
+    def test_max_pending(self):
+        started = []
+        release = threading.Event()
+
+        class BlockingRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                started.append(text)
+                release.wait()
+                return text
+
+        renderer = hoedown.AsyncRenderer(BlockingRenderer, workers=4, max_pending=2,
+                                         inline_size=0)
+        tasks = [self.loop.create_task(renderer.render('%d' % n)) for n in range(4)]
+        self.loop.run_until_complete(self.asyncio.sleep(0.1))
+        ok(len(started)) == 2
+
+        # Cancelled renders keep their place until the thread is done
+        tasks[0].cancel()
+        self.loop.run_until_complete(self.asyncio.sleep(0.1))
+        ok(len(started)) == 2
+
+        release.set()
+        results = self.gather(*tasks[1:])
+        ok(sorted(results)) == ['1', '2', '3']
+        ok(len(started)) == 4
+        renderer.close()
+
+    def test_arguments(self):
+        for kwargs in ({'workers': 0}, {'max_pending': 0}):
+            try:
+                hoedown.AsyncRenderer(**kwargs)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('ValueError not raised')
+
+
+class IncrementalDocumentTest(TestCase):
+    name = 'Incremental document'
+
+    def setup(self):
+        self.text = u''.join(u'# Section %d\n\nParagraph *%d* [link][ref].\n\n' % (i, i)
+                             for i in range(20)) + u'[ref]: /url\n'
+        self.m = Markdown(HtmlRenderer(), EXT_TABLES)
+
+    def new_doc(self):
+        return hoedown.IncrementalDocument(HtmlRenderer(), EXT_TABLES, self.text)
+
+    def test_initial_render(self):
+        ok(self.new_doc().html).diff(self.m.render(self.text))
+
+    def test_edit(self):
+        doc = self.new_doc()
+        offset = doc.text.index(u'*7*')
+        html, diff = doc.edit(offset + 1, 1, u'seven')
+        ok(doc.text).contains(u'*seven*')
+        ok(html).diff(self.m.render(doc.text))
+        ok(diff.index) > 0
+        ok(diff.removed) <= 3
+        ok(u''.join(diff.inserted)).contains(u'<em>seven</em>')
+
+    def test_merge_blocks(self):
+        doc = self.new_doc()
+        offset = doc.text.index(u'# Section 5')
+        html, diff = doc.edit(offset, 2, u'Underlined\n===\n')
+        ok(html).diff(self.m.render(doc.text))
+        html, diff = doc.edit(doc.text.index(u'\n\nParagraph *9*'), 2)
+        ok(html).diff(self.m.render(doc.text))
+
+    def test_definition_change(self):
+        doc = self.new_doc()
+        html, diff = doc.edit(doc.text.index(u'/url'), 4, u'/other')
+        ok(html).diff(self.m.render(doc.text))
+        ok(diff.index) == 0
+        ok(diff.removed) == len(diff.inserted)
+
+        # A title on the next line, without its closing quote
+        doc = hoedown.IncrementalDocument(HtmlRenderer(), 0, u'[r]: /url\n"- 1. -\n\n[r]\n')
+        html, diff = doc.edit(11, 5, u'')
+        ok(html).diff(Markdown(HtmlRenderer()).render(doc.text))
+
+    def test_html_block(self):
+        doc = self.new_doc()
+        doc.edit(doc.text.index(u'# Section 3'), 0, u'<div>\n')
+        html, diff = doc.edit(doc.text.index(u'# Section 15'), 0, u'</div>\n')
+        ok(html).diff(self.m.render(doc.text))
+
+    def test_smartypants(self):
+        text = u'"a\n\nb\n\nc"\n'
+        doc = hoedown.IncrementalDocument(HtmlRenderer(HTML_SMARTYPANTS), 0, text)
+        html, diff = doc.edit(len(text) - 2, 0, u'x')
+        ok(html) == Markdown(HtmlRenderer(HTML_SMARTYPANTS)).render(doc.text)
+        ok(html).contains(u'<p>cx&rdquo;</p>')
+
+    def test_update(self):
+        doc = hoedown.IncrementalDocument(HtmlRenderer())
+        ok(doc.html) == u''
+        html, diff = doc.update(self.text)
+        ok(html).diff(self.m.render(self.text))
+        html, diff = doc.update(u'')
+        ok(html) == u''
+        ok(diff.inserted) == []
+
+    def test_edit_out_of_range(self):
+        doc = self.new_doc()
+        try:
+            doc.edit(len(self.text), 1)
+        except IndexError:
+            pass
+        else:
+            raise AssertionError('IndexError not raised')
+
+
+
+
+class TocRenderTest(TestCase):
+    name = 'Render with table of contents'
+
+    def setup(self):
+        self.text = (u'# One [link](/x) *em*\n\n## Two\n\ntext\n\n'
+                     u'### Three\n\n# Four\n')
+
+    def test_matches_toc_renderer(self):
+        body, toc = hoedown.html_with_toc(self.text)
+        ok(toc) == hoedown.html(self.text, render_flags=hoedown.HTML_TOC_TREE)
+        ok(toc).contains('<a href="#toc_0">One link <em>em</em></a>')
+        ok(body).contains('<h1 id="toc_0">One <a href="/x">link</a> <em>em</em></h1>')
+        ok(body).contains('<h1 id="toc_3">Four</h1>')
+
+    def test_nesting_level(self):
+        m = Markdown(HtmlRenderer(nesting_level=2))
+        body, toc = m.render_with_toc(self.text)
+        ok(body).contains('<h3>Three</h3>')
+        ok(body).contains('<h1 id="toc_2">Four</h1>')
+        ok(toc).not_contains('Three')
+        ok(m.render(self.text)) == body
+
+    def test_anchors_restart(self):
+        m = Markdown(HtmlRenderer(nesting_level=6))
+        ok(m.render_with_toc(self.text)) == m.render_with_toc(self.text)
+        ok(m.render(u'# a')) == '<h1 id="toc_0">a</h1>\n'
+
+    def test_no_headers(self):
+        ok(hoedown.html_with_toc(u'text')) == ('<p>text</p>\n', '')
+
+    def test_needs_html_renderer(self):
+        try:
+            Markdown(hoedown.HtmlTocRenderer()).render_with_toc(self.text)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+
+
+class SlugAnchorTest(TestCase):
+    name = 'Slug anchors'
+
+    def setup(self):
+        self.renderer = HtmlRenderer(hoedown.HTML_SLUG_ANCHORS, nesting_level=6)
+
+    def anchors(self, text, flags=0):
+        renderer = HtmlRenderer(hoedown.HTML_SLUG_ANCHORS | flags, nesting_level=6)
+        return re.findall(r'<h\d id="([^"]*)"', Markdown(renderer).render(text))
+
+    def test_slugs(self):
+        ok(self.anchors(u'# Hello, World!\n## Hello *big* [world](/x)\n')) == \
+            [u'hello-world', u'hello-big-world']
+        ok(self.anchors(u'# snake_case and-dashes\n# `code` &amp; <b>tags</b>\n')) == \
+            [u'snake_case-and-dashes', u'code--tags']
+        ok(self.anchors(u'# ???\n# !!!\n')) == [u'section', u'section-1']
+
+    def test_unicode(self):
+        ok(self.anchors(u'# Caf\xe9 \xdcBER\n# \u03a3\u039f\u03a6\u0399\u0391 '
+                        u'\u041f\u0440\u0438\u0432\u0435\u0442\n')) == \
+            [u'caf\xe9-\xfcber', u'\u03c3\u03bf\u03c6\u03b9\u03b1-'
+             u'\u043f\u0440\u0438\u0432\u0435\u0442']
+        ok(self.anchors(u'# \u4f60\u597d\uff0c\u4e16\u754c \u2014 \U0001f600 &#233;t&#xE9;\n')) == \
+            [u'\u4f60\u597d\u4e16\u754c---\xe9t\xe9']
+        ok(self.anchors(u'# \u0130stanbul \u0131\u0130\n# &#304;\n')) == \
+            [u'i\u0307stanbul-\u0131i\u0307', u'i\u0307']
+
+    def test_duplicates(self):
+        ok(self.anchors(u'# a\n# a\n# a-1\n# A\n')) == [u'a', u'a-1', u'a-1-1', u'a-2']
+
+    def test_reset_per_render(self):
+        m = Markdown(self.renderer)
+        ok(m.render(u'# a\n# a\n')) == m.render(u'# a\n# a\n')
+        ok(m.render_with_toc(u'# a\n')) == (
+            '<h1 id="a">a</h1>\n', '<ul>\n<li>\n<a href="#a">a</a>\n</li>\n</ul>\n')
+
+    def test_matches_toc_renderer(self):
+        text = (u'# One [link](/x) *em*\n\n## One link em\n\n### A -- b (c) "q"...\n\n'
+                u'## <i>raw</i> ![image](i.png)\n')
+        flags = hoedown.HTML_SLUG_ANCHORS | HTML_SMARTYPANTS
+        body, toc = Markdown(HtmlRenderer(flags, nesting_level=6)).render_with_toc(text)
+        links = re.findall(r'href="#([^"]*)"', toc)
+        ok(links) == [u'one-link-em', u'one-link-em-1', u'a----b-c-q', u'raw-']
+        ok(re.findall(r'href="#([^"]*)"', Markdown(hoedown.HtmlTocRenderer(flags)).render(text))) == links
+        ok(re.findall(r'href="#([^"]*)"', hoedown.html(text, render_flags=flags | hoedown.HTML_TOC_TREE))) == links
+
+    def test_toc_n_by_default(self):
+        ok(Markdown(HtmlRenderer(nesting_level=1)).render(u'# a')) == '<h1 id="toc_0">a</h1>\n'
+        ok(Markdown(HtmlRenderer(hoedown.HTML_SLUG_ANCHORS)).render(u'# a')) == '<h1>a</h1>\n'
+
+
+class RenderStatsTest(TestCase):
+    name = 'Render statistics'
+
+    def setup(self):
+        self.text = u'# Title\n\n*a* **b** *c*\n\n> - x\n>   - y\n\ntext\n'
+
+    def test_nodes(self):
+        stats = hoedown.RenderStats()
+        html = Markdown(HtmlRenderer()).render(self.text, stats)
+        ok(html) == Markdown(HtmlRenderer()).render(self.text)
+        ok(stats.renders) == 1
+        ok(stats.nodes['emphasis']) == 2
+        ok(stats.nodes['double_emphasis']) == 1
+        ok(stats.nodes['header']) == 1
+        ok(stats.nodes['list_item']) == 2
+        ok('table' in stats.nodes) == False
+        ok(stats.max_depth) > 3
+        ok(stats.work_buffers) > 0
+        ok(stats.input_bytes) == len(self.text)
+        ok(stats.output_bytes) == len(html)
+
+    def test_adds_up(self):
+        stats = hoedown.RenderStats()
+        m = Markdown(HtmlRenderer())
+        m.render(self.text, stats)
+        first = stats.as_dict()
+        m.render(self.text, stats=stats)
+        ok(stats.renders) == 2
+        ok(stats.nodes['emphasis']) == 4
+        ok(stats.input_bytes) == 2 * first['input_bytes']
+        ok(stats.time) >= first['time']
+
+    def test_buffers(self):
+        stats = hoedown.RenderStats()
+        Markdown(HtmlRenderer()).render(u'*%s*\n' % (u'a' * 10000), stats)
+        ok(stats.reallocs) > 0
+        ok(stats.bytes_allocated) >= 10000
+
+    def test_callback_time(self):
+        class SlowRenderer(HtmlRenderer):
+            def paragraph(self, text):
+                time.sleep(0.01)
+                return '<p>%s</p>\n' % text
+
+        stats = hoedown.RenderStats()
+        Markdown(SlowRenderer()).render(self.text, stats)
+        ok(stats.callback_time) >= 0.02
+        ok(stats.parse_time) >= 0
+        ok(stats.parse_time + stats.callback_time - stats.time) < 1e-9
+
+        stats = hoedown.RenderStats()
+        Markdown(HtmlRenderer()).render(self.text, stats)
+        ok(stats.callback_time) == 0
+
+
+class ReferenceTest(TestCase):
+    name = 'References'
+
+    def setup(self):
+        self.r = Markdown(HtmlRenderer(), EXT_FOOTNOTES).render
+
+    def test_case_insensitive(self):
+        ok(self.r(u'[a][Ref] [ref]\n\n[REF]: /x')) == \
+            '<p><a href="/x">a</a> <a href="/x">ref</a></p>\n'
+
+    def test_last_definition_wins(self):
+        ok(self.r(u'[a]\n\n[a]: /1\n[A]: /2 "t"')) == \
+            '<p><a href="/2" title="t">a</a></p>\n'
+
+    def test_many_references(self):
+        count = 5000
+        text = u''.join(u'[%d][r%d] ' % (i, i) for i in range(count)) + u'\n\n' + \
+            u''.join(u'[r%d]: /%d\n' % (i, i) for i in range(count))
+        html = self.r(text)
+        ok(html.count('<a href=')) == count
+        ok(html).contains('<a href="/4999">4999</a>')
+
+    def test_first_footnote_wins(self):
+        html = self.r(u'a[^1]\n\n[^1]: one\n\n[^1]: two\n')
+        ok(html).contains('one')
+        ok(html).not_contains('two')
+
+    def test_many_footnotes(self):
+        count = 1000
+        text = u''.join(u'[^n%d] ' % i for i in reversed(range(count))) + u'\n\n' + \
+            u''.join(u'[^n%d]: note %d\n\n' % (i, i) for i in range(count))
+        html = self.r(text)
+        ok(html.count('rel="footnote"')) == count
+        ok(html).contains('<li id="fn1">\n<p>note 999')
+
+    def test_names_are_compared(self):
+        # Names with the same hash must not be confused
+        ok(self.r(u'[83138ddcb4] and [857ad8d42a]\n\n[83138ddcb4]: /1\n[857ad8d42a]: /2')) == \
+            '<p><a href="/1">83138ddcb4</a> and <a href="/2">857ad8d42a</a></p>\n'
+
+
+class RenderLimitTest(TestCase):
+    name = 'Render limits'
+
+    def setup(self):
+        # Every link scans ahead to the parenthesis at the end
+        self.hostile = u'[a](' * 10000 + u')'
+
+    def limit(self, markdown, text, method='render'):
+        try:
+            getattr(markdown, method)(text)
+        except hoedown.RenderLimitError as e:
+            return e.limit
+        raise AssertionError('RenderLimitError not raised')
+
+    def test_attributes(self):
+        m = Markdown(HtmlRenderer(), max_steps=10, timeout=0.5)
+        ok(m.max_nesting) == 16
+        ok(m.max_steps) == 10
+        ok(m.max_input_bytes) == 0
+        ok(m.timeout) == 0.5
+
+    def test_within_limits(self):
+        m = Markdown(HtmlRenderer(), max_input_bytes=100, max_output_bytes=100,
+                     max_steps=100, timeout=10)
+        ok(m.render(u'*a* [b](/c)')) == '<p><em>a</em> <a href="/c">b</a></p>\n'
+
+    def test_max_input_bytes(self):
+        m = Markdown(HtmlRenderer(), max_input_bytes=10)
+        ok(m.render(u'0123456789')) == '<p>0123456789</p>\n'
+        ok(self.limit(m, u'01234567890')) == 'input'
+        # Bytes are counted, not characters
+        ok(self.limit(m, u'\u00e9' * 6)) == 'input'
+
+    def test_max_input_bytes_cached(self):
+        cache = hoedown.RenderCache()
+        text = u'0123456789a'
+        Markdown(HtmlRenderer(), cache=cache).render(text)
+        Markdown(HtmlRenderer(), cache=cache).render_inline(text)
+        m = Markdown(HtmlRenderer(), cache=cache, max_input_bytes=10)
+        ok(self.limit(m, text)) == 'input'
+        ok(self.limit(m, text.encode('UTF-8'), 'render_inline')) == 'input'
+        ok(self.limit(m, [bytearray(text.encode('UTF-8'))], 'render_many')) == 'input'
+        ok(cache.hits) == 0
+
+    def test_max_output_bytes(self):
+        m = Markdown(HtmlRenderer(), max_output_bytes=100)
+        ok(self.limit(m, u'a\n\n' * 100)) == 'output'
+        ok(self.limit(Markdown(HtmlRenderer(), EXT_FOOTNOTES, max_output_bytes=100),
+                      u'a[^1]\n\n[^1]: ' + u'b' * 100)) == 'output'
+
+    def test_max_steps(self):
+        m = Markdown(HtmlRenderer(), max_steps=1000)
+        ok(self.limit(m, self.hostile)) == 'steps'
+        ok(m.render(u'*a*')) == '<p><em>a</em></p>\n'
+
+    def test_timeout(self):
+        m = Markdown(HtmlRenderer(), timeout=0.01)
+        start = time.time()
+        ok(self.limit(m, self.hostile)) == 'time'
+        ok(time.time() - start) < 1
+
+    def test_python_callbacks(self):
+        class Renderer(HtmlRenderer):
+            def emphasis(self, text):
+                return '<i>%s</i>' % text
+
+        m = Markdown(Renderer(), max_steps=1000)
+        ok(self.limit(m, u'*a* ' * 1000)) == 'steps'
+        ok(m.render(u'*a*')) == '<p><i>a</i></p>\n'
+
+    def test_render_to(self):
+        m = Markdown(HtmlRenderer(), max_output_bytes=1000)
+        out = []
+        try:
+            m.render_to(out.append, u'a\n\n' * 1000, chunk_size=100)
+        except hoedown.RenderLimitError as e:
+            ok(e.limit) == 'output'
+        else:
+            raise AssertionError('RenderLimitError not raised')
+        # Checked between blocks, so a block and a chunk can go past it
+        ok(len(u''.join(out))) < 1200
+
+    def test_parse(self):
+        m = Markdown(HtmlRenderer(), max_steps=10)
+        ok(self.limit(m, u'a\n\n' * 100, 'parse')) == 'steps'
+        ok(len(m.parse(u'a'))) == 3
+
+    def test_max_nesting(self):
+        text = u'> > > a'
+        ok(Markdown(HtmlRenderer()).render(text)).contains('<p>a</p>')
+        ok(Markdown(HtmlRenderer(), max_nesting=2).render(text)).not_contains('a')
+
+    def test_invalid(self):
+        for kwargs in ({'max_nesting': 0}, {'timeout': -1}):
+            try:
+                Markdown(HtmlRenderer(), **kwargs)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('ValueError not raised')
+
+
+class PathologicalInputTest(TestCase):
+    name = 'Pathological input'
+
+    # Unclosed markup that makes the parser scan ahead, repeated
+    markup = (u'*a ', u'_a **b ', u'[', u'![', u'[a](', u'[a][', u'<a ', u'^(',
+              u'*`a` ', u'` ``', u'~~a ', u'""a ')
+
+    def setup(self):
+        self.r = Markdown(HtmlRenderer(), EXT_STRIKETHROUGH | EXT_SUPERSCRIPT |
+                          EXT_QUOTE | EXT_FOOTNOTES).render
+
+    def render_time(self, text):
+        times = []
+        for _ in range(3):
+            start = time.time()
+            self.r(text)
+            times.append(time.time() - start)
+        return max(min(times), 1e-4)
+
+    def test_linear_time(self):
+        # Eight times the text takes about eight times as long, scanning to
+        # the end for every delimiter would take 64 times as long.
+        slow = []
+        for markup in self.markup:
+            ratio = self.render_time(markup * 40000) / self.render_time(markup * 5000)
+            if ratio > 24:
+                slow.append((markup, ratio))
+        ok(slow) == []
+
+    def test_distant_closers(self):
+        text = u'a ' * 100 + u'b'
+        ok(self.r(u'[%s](/x)' % text)) == u'<p><a href="/x">%s</a></p>\n' % text
+        ok(self.r(u'*%s*' % text)) == u'<p><em>%s</em></p>\n' % text
+        ok(self.r(u'<b title="%s">' % text)) == u'<p><b title="%s"></p>\n' % text
+        ok(self.r(u'^(%s)' % text)) == u'<p><sup>%s</sup></p>\n' % text
+
+    def test_chains(self):
+        ok(self.r(u'[a][' * 20 + u'b]')) == u'<p>' + u'[a][' * 20 + u'b]</p>\n'
+        ok(self.r(u'*' + u'`a` ' * 20 + u'b*')) == \
+            u'<p><em>' + u'<code>a</code> ' * 20 + u'b</em></p>\n'
+        ok(self.r(u'[[a][' * 20 + u']')) == u'<p>' + u'[[a][' * 20 + u']</p>\n'
+
+
+class ParseTreeTest(TestCase):
+    name = 'Parse tree'
+
+    def setup(self):
+        self.m = Markdown(HtmlRenderer(), EXT_FENCED_CODE | EXT_AUTOLINK)
+        self.text = (
+            u'# Title *here*\n\n'
+            u'Some [link](/x "T") and `code`\n\n'
+            u'* one\n'
+            u'* two\n\n'
+            u'```python\n'
+            u'print(1)\n'
+            u'```\n')
+        self.tree = self.m.parse(self.text)
+
+    def test_structure(self):
+        root = self.tree.root
+        ok(root.type) == 'document'
+        ok(root.parent) == None
+        ok([n.type for n in root.children]) == ['header', 'paragraph', 'list', 'block_code']
+
+        header = root.children[0]
+        ok(header.level) == 1
+        ok([n.type for n in header.children]) == ['normal_text', 'emphasis']
+        ok(header.children[1].children[0].text) == 'here'
+        ok(header.children[0].parent) == header
+
+    def test_document_order(self):
+        ok(len(self.tree)) == len(list(self.tree))
+        for node in self.tree:
+            ok(self.tree[node.index]) == node
+            for child in node.children:
+                ok(child.index) > node.index
+
+    def test_attributes(self):
+        links = [n for n in self.tree if n.type == 'link']
+        ok(len(links)) == 1
+        ok(links[0].link) == '/x'
+        ok(links[0].title) == 'T'
+        ok(links[0].children[0].text) == 'link'
+
+        code = [n for n in self.tree if n.type == 'block_code'][0]
+        ok(code.lang) == 'python'
+        ok(code.text) == 'print(1)\n'
+
+        lists = [n for n in self.tree if n.type == 'list']
+        ok(lists[0].flags) == 0
+        ok(self.m.parse(u'1. one\n').root.children[0].flags) == hoedown.LIST_ORDERED
+
+    def test_spans(self):
+        source = self.tree.source
+        header, paragraph = self.tree.root.children[:2]
+        ok(source[header.start:header.end]) == b'# Title *here*'
+        ok(source[paragraph.start:paragraph.end]) == b'Some [link](/x "T") and `code`'
+
+        for node in self.tree:
+            if node.type in ('normal_text', 'codespan') and node.parent.type != 'list_item':
+                ok(source[node.start:node.end].decode('utf-8')) == node.text
+
+    def test_autolink(self):
+        tree = self.m.parse(u'mail a@b.com now')
+        ok([(n.type, n.text) for n in tree.root.children[0].children]) == [
+            ('normal_text', 'mail '), ('autolink', 'a@b.com'), ('normal_text', ' now')]
+
+    def test_control_characters(self):
+        tree = self.m.parse(u'a\x01b\x021')
+        ok(tree.root.children[0].children[0].text) == u'a\x01b\x021'
+
+    def test_empty(self):
+        tree = self.m.parse(u'')
+        ok(len(tree)) == 1
+        ok(tree.root.children) == []
+
+
+class ThreadingTest(TestCase):
+    name = 'Threading'
+
+    def setup(self):
+        self.text = '# Title\n\nSome *emphasis* and a [link](/url).\n' * 50
+        self.expected = Markdown(HtmlRenderer()).render(self.text)
+
+    def render_in_threads(self, get_markdown, threads=4, loops=20):
+        results = []
+
+        def work():
+            m = get_markdown()
+            for _ in range(loops):
+                results.append(m.render(self.text))
+
+        pool = [threading.Thread(target=work) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return results
+
+    def test_markdown_per_thread(self):
+        results = self.render_in_threads(lambda: Markdown(HtmlRenderer()))
+        ok(len(results)) == 80
+        ok(set(results)) == set([self.expected])
+
+    def test_shared_markdown(self):
+        shared = Markdown(HtmlRenderer())
+        results = self.render_in_threads(lambda: shared)
+        ok(len(results)) == 80
+        ok(set(results)) == set([self.expected])
+
+    def test_shared_renderer(self):
+        text = '# "Title"\n\n## Section\n\n"quoted" text\n' * 50
+        flags = hoedown.HTML_SLUG_ANCHORS | HTML_SMARTYPANTS
+        renderer = hoedown.HtmlTocRenderer(flags)
+        expected = Markdown(hoedown.HtmlTocRenderer(flags)).render(text)
+        markdowns = [Markdown(renderer), Markdown(renderer)]
+        results = []
+
+        def work(m):
+            for _ in range(20):
+                results.append(m.render(text))
+
+        pool = [threading.Thread(target=work, args=(markdowns[i % 2],)) for i in range(4)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        ok(len(results)) == 80
+        ok(set(results)) == set([expected])
+
+    def test_shared_renderer_after_reentrant_render(self):
+        text = '"quoted *em* and `c` text" it\'s -- ok...\n\n' * 200
+        renderer = HtmlRenderer(HTML_SMARTYPANTS)
+        expected = Markdown(HtmlRenderer(HTML_SMARTYPANTS)).render(text)
+        markdowns = [Markdown(renderer), Markdown(renderer)]
+
+        # The inner render must leave the renderer locked for the outer one
+        markdowns[0].render_to(lambda s: markdowns[1].render(u'x'), u'a\n\n' * 50,
+                               chunk_size=10)
+
+        results = []
+
+        def work(m):
+            for _ in range(50):
+                results.append(m.render(text))
+
+        pool = [threading.Thread(target=work, args=(markdowns[i % 2],)) for i in range(4)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        ok(len(results)) == 200
+        ok(set(results)) == set([expected])
+
+
 def run_tests():
     runner([
         BaseRendererTest,
@@ -542,9 +1969,32 @@ def run_tests():
         MarkdownParserTest,
         MarkdownBlockCustomRendererTest,
         MarkdownSpanCustomRendererTest,
+        CallbackReferenceTest,
+        CallbackErrorTest,
         MarkdownConformanceTest_10,
         MarkdownConformanceTest_103,
-        UnicodeTest
+        UnicodeTest,
+        BufferInputTest,
+        InlineRenderTest,
+        LinkRulesTest,
+        SanitizerTest,
+        PlainTextTest,
+        StreamingRenderTest,
+        BatchRenderTest,
+        CorpusRenderTest,
+        RenderCacheTest,
+        CallbackCacheTest,
+        PoolTest,
+        AsyncRenderTest,
+        IncrementalDocumentTest,
+        ParseTreeTest,
+        TocRenderTest,
+        SlugAnchorTest,
+        RenderStatsTest,
+        ReferenceTest,
+        RenderLimitTest,
+        PathologicalInputTest,
+        ThreadingTest
     ])
 
 